@@ -1,10 +1,35 @@
+import asyncio
+import contextlib
+import hashlib
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+
 import MetaTrader5 as mt5
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-from langchain_openai import ChatOpenAI
+from datetime import datetime, timedelta, timezone
+from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.prompts import PromptTemplate
 
+from bar_buffer import BarBuffer
+from bar_cache import BarCache
+from live_state import LiveFeed, MT5TickSource
+from llm_cache import CachedChain, LLMResponseCache
+from market_structure import StructureEngine, format_structure_levels
+from mt5_gateway import MT5Gateway, get_gateway
+from history_store import AnalysisHistory
+from output_check import (
+    RENDERERS, SCHEMAS, OutputRules, correction_message, grounding_set, parse_json_output, response_format, validate_output,
+)
+from prompt_encoding import COMPACT_COLUMNS, count_tokens, encode_market_blocks, fit_windows, token_counter_name
+from indicators import IndicatorEngine, INDICATOR_COLUMNS, compute_indicators, compute_indicators_many
+from resample import PRICE_COLUMNS, compare_bars, resample_ohlc
+from rules import TradingRules, format_rule_facts, no_trade_text, prescreen
+from tracing import export_trace, is_cache_hit, span, start_trace, text_bytes, usage_of
+
 
 # ===============================
 # Prompt：多周期技术分析（中文）
@@ -30,10 +55,13 @@ FEATURE_PROMPT = """你是一名专业的黄金（XAUUSD）交易员，请基于
 5分钟 M5：
 {m5_data}
 
+【系统识别的市场结构（完整历史计算的真实数值：分形摆动高低、结构突破、未回补缺口、有效订单块）】
+{structure_levels}
+
 【分析要求】
-1) 总体市场结构与主导趋势（以D1/H4为主）
-2) 关键支撑/阻力（给出具体价位，必须来自数据）
-3) 供需区/订单块/FVG/流动性（描述+对应价位必须来自数据）
+1) 总体市场结构与主导趋势（以D1/H4为主，结合上面的结构突破方向）
+2) 关键支撑/阻力（给出具体价位，优先引用系统识别的摆动高低，不必逐根复述K线）
+3) 供需区/订单块/FVG/流动性（直接引用系统识别的缺口/订单块区间，不得另行编造）
 4) RSI/EMA/ATR 状态解读
 5) 多周期共振结论
 6) 给出当下偏向：多/空/震荡（并说明原因）
@@ -65,6 +93,9 @@ M5：{m5_data}
 【系统计算的预测区间（真实数值，不可改写）】
 {forecast_data}
 
+【本地规则预检（系统计算的真实数值，不可改写；趋势一致性/止损距离/盈亏比/点差以此为准）】
+{rule_facts}
+
 【严格规则（必须执行）】
 1) 趋势一致性：D1/H4/H1/M30/M15/M5 至少 4/5 同向才算有效
 2) 入场条件（至少满足 3 条，并说明是哪3条）：
@@ -105,7 +136,7 @@ IMPORTANT：如果输出中出现任何英文，视为无效回答，请重新
 DAILY_BRIEF_PROMPT = """你是一名专业的黄金（XAUUSD）日内交易员，请基于【给定真实数据】生成“当天行情分析 + 入场点位 + 技术面分析”的中文报告。
 
 【硬性规则（必须执行）】
-- 只能使用我提供的数据里的价格数字（今日/昨日/摆动高低/支撑阻力/ATR预测区间/当前价），不得编造任何价格。
+- 只能使用我提供的数据里的价格数字（今日/昨日/摆动高低/结构价位/ATR预测区间/当前价），不得编造任何价格。
 - 入场点位必须落在：关键位附近 或 预测区间内，并说明触发条件。
 - 若条件不足：必须输出“不交易”，并指出具体缺失项（例如趋势不一致、缺少结构确认等）。
 - 必须使用简体中文，不要输出英文，不要中英混合。
@@ -126,6 +157,9 @@ DAILY_BRIEF_PROMPT = """你是一名专业的黄金（XAUUSD）日内交易员
 5) 预测区间（ATR计算，真实数值）：
 {forecast_data}
 
+6) 市场结构（系统识别的分形摆动高低/结构突破/未回补缺口/有效订单块，真实数值）：
+{structure_levels}
+
 【输出格式（必须严格按此结构）】
 一、今日概览
 - 当前价格：xxx（上涨/下跌x%）
@@ -141,8 +175,8 @@ DAILY_BRIEF_PROMPT = """你是一名专业的黄金（XAUUSD）日内交易员
 - 今日高/低：xxx / xxx
 - 昨日高/低/收：xxx / xxx / xxx
 - H1最近摆动高/低：xxx / xxx
-- 关键阻力：xxx、xxx
-- 关键支撑：xxx、xxx
+- 关键阻力：xxx、xxx（取自市场结构中的上方区间/摆动高）
+- 关键支撑：xxx、xxx（取自市场结构中的下方区间/摆动低）
 
 四、交易计划（必须给 2 套方案）
 方案A（回踩/反弹）
@@ -167,6 +201,45 @@ IMPORTANT：如果输出中出现任何英文，视为无效回答，请重新
 """
 
 
+# ===============================
+# Prompt：结构化输出（JSON Schema 由 response_format 传入，这里只替换输出格式段）
+# ===============================
+TRADING_JSON_FORMAT = """【输出格式（JSON，字段名按给定 Schema，字段内容使用简体中文，不要输出 JSON 以外的内容）】
+- signal：买入/卖出/不交易
+- reasons：理由要点（字符串数组）
+- entry_low / entry_high：入场区间下沿/上沿（不交易时为 null）
+- sl：止损价；tp1 / tp2 / tp3：止盈价（tp3 可为 null；不交易时均为 null）
+- trigger：执行条件（例如“回踩xxx后M5收阳吞没”）
+- invalidation：无效条件（例如“H1收盘跌破xxx”）
+- risks：风险提示 1-3 条
+- confidence：置信度，0-100 的整数
+- confidence_basis：置信度依据（必须引用上面规则/多周期/ATR区间）
+
+"""
+
+DAILY_JSON_FORMAT = """【输出格式（JSON，字段名按给定 Schema，字段内容使用简体中文，不要输出 JSON 以外的内容）】
+- overview：今日概览要点（当前价格与涨跌幅；今日开/高/低/现、振幅、点差）
+- technical：技术面分析要点（D1 / H4 / H1 / M15与M5 各一条）
+- resistance / support：关键阻力/关键支撑价位（数字数组，取自市场结构中的上方/下方区间与摆动高低）
+- plans：必须给 2 套方案（方案A 回踩/反弹，方案B 突破/破位），每套包含
+  name、direction（做多/做空/不交易）、entry_low / entry_high（突破方案两者相同）、sl、tp1、tp2、trigger（触发条件）、invalidation（无效条件）
+- risks：风险提示 1-3 条
+- confidence：置信度，0-100 的整数
+- confidence_basis：置信度依据（必须引用多周期一致性、关键位、ATR区间、结构确认等）
+
+"""
+
+
+def _with_output_format(template: str, output_format: str, end_marker: str) -> str:
+    """把模板中的【输出格式…】段（到 end_marker 为止）替换为 output_format"""
+    start = template.index("【输出格式")
+    return template[:start] + output_format + template[template.index(end_marker, start):]
+
+
+TRADING_PROMPT_JSON = _with_output_format(TRADING_PROMPT, TRADING_JSON_FORMAT, "【输出要求】")
+DAILY_BRIEF_PROMPT_JSON = _with_output_format(DAILY_BRIEF_PROMPT, DAILY_JSON_FORMAT, "IMPORTANT")
+
+
 # ===============================
 # 计算工具
 # ===============================
@@ -191,28 +264,267 @@ def _safe_float(x, nd=2):
         return None
 
 
-class XAUUSDTradingBot:
-    def __init__(self, api_key: str):
-        self.llm = ChatOpenAI(
-            model="gpt-4.1",
-            temperature=0.05,
-            api_key=api_key,
+# 分析使用的周期（提示词中的顺序）
+TIMEFRAME_NAMES = ("D1", "H4", "H1", "M30", "M15", "M5")
+
+# ATR区间系数（短线+波段）
+K_MAP = {
+    "M5": 1.0,   # ~30分钟参考
+    "M15": 1.2,  # ~2小时参考
+    "M30": 1.5,
+    "H1": 2.0,   # ~4小时参考
+    "H4": 2.5,
+    "D1": 3.0,   # ~1天参考
+}
+
+
+def forecast_ranges(last_values: dict, k_map: dict) -> dict:
+    """last_values：{周期: (最新收盘价, ATR)} -> {周期: {"low", "high", "atr", "k"}}，ATR 不足的周期不列出"""
+    ranges = {}
+    for tf_name, (close, atr) in last_values.items():
+        k = k_map.get(tf_name, 1.0)
+        fr = forecast_range(float(close), float(atr), k)
+        if fr:
+            ranges[tf_name] = {"low": fr[0], "high": fr[1], "atr": round(float(atr), 2), "k": k}
+    return ranges
+
+
+def format_forecast_text(last_values: dict, k_map: dict) -> str:
+    """last_values：{周期: (最新收盘价, ATR)}，按周期顺序输出预测区间文本"""
+    forecast_lines = [
+        f"{tf_name} 预测区间：{r['low']} ~ {r['high']}（ATR={r['atr']:.2f}，k={r['k']}）"
+        for tf_name, r in forecast_ranges(last_values, k_map).items()
+    ]
+    return "\n".join(forecast_lines) if forecast_lines else "预测区间：暂无（ATR不足或数据不足）"
+
+
+def format_state_line(name: str, close, rsi, ema20, ema50, ema200, atr) -> str:
+    return (
+        f"{name}: close={close:.2f}, RSI={_safe_float(rsi,1)}, "
+        f"EMA20={_safe_float(ema20)}, EMA50={_safe_float(ema50)}, EMA200={_safe_float(ema200)}, "
+        f"ATR={_safe_float(atr)}"
+    )
+
+
+def format_daily_inputs(
+    today: dict | None,
+    y: dict | None,
+    spread,
+    h1_swing_high: float,
+    h1_swing_low: float,
+    state_lines: list[str],
+    forecast_text: str,
+    structure_text: str = "市场结构：无法获取",
+) -> dict:
+    """当日行情分析链的输入文本"""
+    today_snapshot_text = "今日快照：无法获取"
+    if today:
+        direction = "上涨" if today["change_pct"] >= 0 else "下跌"
+        today_snapshot_text = (
+            f"日期：{today['date']}\n"
+            f"当前价格：{today['last']}（{direction}{abs(today['change_pct'])}%）\n"
+            f"今日开/高/低/现：{today['open']} / {today['high']} / {today['low']} / {today['last']}\n"
+            f"今日振幅：{today['range']}\n"
+            f"点差：{spread if spread is not None else '无法获取'}"
         )
 
-        self.feature_chain = PromptTemplate(
-            template=FEATURE_PROMPT,
-            input_variables=["daily_data", "h4_data", "h1_data", "m30_data", "m15_data", "m5_data"],
-        ) | self.llm
+    yesterday_text = "昨日关键位：无法获取"
+    if y:
+        yesterday_text = f"昨日高/低/收：{y['y_high']} / {y['y_low']} / {y['y_close']}"
+
+    h1_swings_text = f"H1最近摆动高/低：{h1_swing_high} / {h1_swing_low}"
+
+    return {
+        "today_snapshot": today_snapshot_text,
+        "yesterday_levels": yesterday_text,
+        "h1_swings": h1_swings_text,
+        "tf_last_state": "\n".join(state_lines),
+        "forecast_data": forecast_text,
+        "structure_levels": structure_text,
+    }
+
+
+# 提示词中每根K线的固定格式
+BAR_LINE_COLUMNS = ("open", "high", "low", "close", "rsi", "ema_20", "ema_50", "ema_200", "atr")
+BAR_LINE_TEMPLATE = "时间:{} O:{} H:{} L:{} C:{} RSI:{} EMA20:{} EMA50:{} EMA200:{} ATR:{}"
+
+
+def format_bar_lines(df: pd.DataFrame) -> list[str]:
+    """按列批量格式化K线（%.2f 与 f-string 的 :.2f 输出逐字节一致），缺失的指标列输出 nan"""
+    n = len(df)
+    times = df["time"].dt.strftime("%Y-%m-%d %H:%M:%S").tolist()
+    cols = [
+        np.char.mod("%.2f", df[c].to_numpy(dtype=np.float64) if c in df else np.full(n, np.nan)).tolist()
+        for c in BAR_LINE_COLUMNS
+    ]
+    return [BAR_LINE_TEMPLATE.format(*row) for row in zip(times, *cols)]
+
+
+# 指纹中计入“最后收盘K线时间”的慢周期：这些周期收盘时即使数值变化很小也重新调用 LLM
+FINGERPRINT_BAR_TIMEFRAMES = ("H1", "H4", "D1")
+# RSI 分区边界（超卖/偏空/偏多/超买）；RSI 为 14 根窗口均值，平淡的新K线也会让数值漂移几个点，细分档会频繁变化
+FINGERPRINT_RSI_ZONES = (30.0, 50.0, 70.0)
+
+
+def input_fingerprint(
+    dfs: dict[str, pd.DataFrame],
+    step_atr: float = 0.25,
+    bar_timeframes: tuple[str, ...] = FINGERPRINT_BAR_TIMEFRAMES,
+    grid_timeframe: str = "H1",
+) -> str:
+    """
+    LLM 输入的量化指纹，只由量化后的数值组成：
+    当前价格所在的 (step_atr × grid_timeframe 已收盘 ATR) 价格格子 + 各周期 收盘/EMA20/EMA50 排列状态 + RSI 分区，
+    以及 bar_timeframes 中各周期最后一根已收盘K线时间。
+    快周期（M5/M15/M30）收盘本身不改变指纹：平淡的新K线不会触发新的 LLM 调用，价格/排列/RSI 有实质变化时才会。
+    """
+    grid = dfs[grid_timeframe]
+    # 格子宽度取慢周期已收盘K线的 ATR，快周期新K线不会移动格子边界
+    q = step_atr * (float(grid["atr"].iat[-2]) if len(grid) >= 2 else float("nan"))
+    price = float(dfs["M5"]["close"].iat[-1])
+    parts = [int(np.floor(price / q)) if q > 0 else round(price, 2)]
+    for tf_name in TIMEFRAME_NAMES:
+        df = dfs[tf_name]
+        close, ema20, ema50 = (float(df[c].iat[-1]) for c in ("close", "ema_20", "ema_50"))
+        state = 1 if close > ema20 > ema50 else -1 if close < ema20 < ema50 else 0
+        rsi = float(df["rsi"].iat[-1])
+        closed_t = str(df["time"].iat[-2]) if tf_name in bar_timeframes and len(df) >= 2 else None
+        zone = int(np.searchsorted(FINGERPRINT_RSI_ZONES, rsi, side="right")) if np.isfinite(rsi) else None
+        parts.append((tf_name, state, zone, closed_t))
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+def _content(resp) -> str:
+    return resp.content if hasattr(resp, "content") else str(resp)
+
+
+async def run_stage_graph(stages: dict) -> dict:
+    """
+    按依赖关系并发执行各阶段。
+    stages：{名称: (依赖名称元组, async fn(依赖结果dict))}，无依赖关系的阶段同时运行。
+    """
+    tasks: dict[str, asyncio.Task] = {}
+
+    async def run(name: str):
+        deps, fn = stages[name]
+        if deps:
+            await asyncio.gather(*(tasks[d] for d in deps))
+        return await fn({d: tasks[d].result() for d in deps})
+
+    for name in stages:
+        tasks[name] = asyncio.ensure_future(run(name))
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for t in tasks.values():
+            t.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+    return {name: t.result() for name, t in tasks.items()}
 
-        self.trading_chain = PromptTemplate(
-            template=TRADING_PROMPT,
-            input_variables=["daily_data", "h4_data", "h1_data", "m30_data", "m15_data", "m5_data", "technical_features", "forecast_data"],
-        ) | self.llm
 
-        self.daily_chain = PromptTemplate(
-            template=DAILY_BRIEF_PROMPT,
-            input_variables=["today_snapshot", "yesterday_levels", "h1_swings", "tf_last_state", "forecast_data"],
-        ) | self.llm
+def run_sync(coro):
+    """在同步代码中执行协程；若当前线程已有事件循环，则放到独立线程执行"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        return ex.submit(asyncio.run, coro).result()
+
+
+class XAUUSDTradingBot:
+    def __init__(
+        self,
+        api_key: str,
+        cache_dir: str | None = ".cache/bars",
+        base_timeframe: str | None = None,
+        verify_resample: bool = False,
+        gateway: MT5Gateway | None = None,
+        llm_cache_path: str | None = ".cache/llm_cache.sqlite",
+        llm=None,
+        history_days: int = 120,
+        trace_path: str | None = None,
+        trace_format: str = "jsonl",
+        live_ticks: bool = True,
+        prescreen_rules: bool = True,
+        prompt_encoding: str = "verbose",
+        token_budget: int | None = None,
+        bar_capacity: int = 1200,
+        structured_output: bool = False,
+        validate_outputs: bool = True,
+        history_path: str | None = ".cache/history.sqlite",
+    ):
+        # llm：可注入任意 LangChain 聊天模型（基准测试使用本地模拟模型）；None 时使用 OpenAI
+        if llm is None:
+            # langchain_openai/openai 导入约占本模块导入时间的四分之三，只在实际使用 OpenAI 时导入
+            from langchain_openai import ChatOpenAI
+
+            llm = ChatOpenAI(
+                model="gpt-4.1",
+                temperature=0.05,
+                api_key=api_key,
+                stream_usage=True,
+            )
+        self.llm = llm
+
+        # 结构化输出：交易信号/当日行情两条链按 JSON Schema 输出（OpenAI response_format），结果中附带解析后的字段
+        self.structured_output = structured_output
+        trading_template = TRADING_PROMPT_JSON if structured_output else TRADING_PROMPT
+        daily_template = DAILY_BRIEF_PROMPT_JSON if structured_output else DAILY_BRIEF_PROMPT
+
+        self.prompts = {
+            "feature": PromptTemplate(
+                template=FEATURE_PROMPT,
+                input_variables=["daily_data", "h4_data", "h1_data", "m30_data", "m15_data", "m5_data", "structure_levels"],
+            ),
+            "trading": PromptTemplate(
+                template=trading_template,
+                input_variables=[
+                    "daily_data", "h4_data", "h1_data", "m30_data", "m15_data", "m5_data",
+                    "technical_features", "forecast_data", "rule_facts",
+                ],
+            ),
+            "daily": PromptTemplate(
+                template=daily_template,
+                input_variables=[
+                    "today_snapshot", "yesterday_levels", "h1_swings", "tf_last_state", "forecast_data", "structure_levels",
+                ],
+            ),
+        }
+        # 各链实际使用的模型（结构化模式下绑定 response_format），校验不通过重试时直接调用
+        self.chain_models = {
+            name: self.llm.bind(response_format=response_format(name)) if structured_output and name in SCHEMAS else self.llm
+            for name in self.prompts
+        }
+        self.feature_chain = self.prompts["feature"] | self.chain_models["feature"]
+        self.trading_chain = self.prompts["trading"] | self.chain_models["trading"]
+        self.daily_chain = self.prompts["daily"] | self.chain_models["daily"]
+
+        # LLM 响应缓存：相同输入（同一根K线内重跑、休市时自动刷新）直接返回缓存；None 表示关闭
+        self.llm_cache = LLMResponseCache(llm_cache_path) if llm_cache_path else None
+        if self.llm_cache is not None:
+            # 注入的模型不一定有 model_name/temperature（非 OpenAI 模型、包装器），缺失时用 model 或类名区分
+            params = {
+                "model": getattr(self.llm, "model_name", None) or getattr(self.llm, "model", type(self.llm).__name__),
+                "temperature": getattr(self.llm, "temperature", None),
+            }
+            # 开启输出校验时未命中的回答不自动写入：校验（含重试）通过后才由 _arun_analysis 写入，避免缓存不合格回答
+            params["write_through"] = not validate_outputs
+            self.feature_chain = CachedChain("feature", self.feature_chain, self.llm_cache, template=FEATURE_PROMPT, **params)
+            self.trading_chain = CachedChain("trading", self.trading_chain, self.llm_cache, template=trading_template, **params)
+            self.daily_chain = CachedChain("daily", self.daily_chain, self.llm_cache, template=daily_template, **params)
+        # 按链名保留缓存包装（benchmark 等外层再包一层计时器时仍能写入缓存）
+        self.cached_chains: dict[str, CachedChain] = {
+            name: c for name, c in (("feature", self.feature_chain), ("trading", self.trading_chain), ("daily", self.daily_chain))
+            if isinstance(c, CachedChain)
+        }
+
+        # 分析历史：每次结果追加到本地 SQLite（可查询最近信号/按时间段扫描，新会话启动时直接显示）；None 表示关闭
+        self.history = AnalysisHistory(history_path) if history_path else None
+
+        # 输出校验：语言（不得出现英文）+ 价格（必须出现在输入数据中）+ 结构化字段；不通过时只重试该条链。None 表示关闭
+        self.output_rules: OutputRules | None = OutputRules() if validate_outputs else None
 
         self.timeframes = {
             "D1": mt5.TIMEFRAME_D1,
@@ -224,78 +536,297 @@ class XAUUSDTradingBot:
         }
 
         # ATR区间系数（短线+波段）
-        self.k_map = {
-            "M5": 1.0,   # ~30分钟参考
-            "M15": 1.2,  # ~2小时参考
-            "M30": 1.5,
-            "H1": 2.0,   # ~4小时参考
-            "H4": 2.5,
-            "D1": 3.0,   # ~1天参考
+        self.k_map = dict(K_MAP)
+
+        # 本地K线缓存（None 表示关闭，每次全量拉取）
+        self.bar_cache = BarCache(cache_dir) if cache_dir else None
+        self._mt5_online = False
+        self._points: dict[str, float] = {}
+
+        # MT5 长连接由网关线程持有，所有调用经队列串行执行
+        self.gateway = gateway or get_gateway()
+
+        # 每个 品种/周期 在内存中只保留最近 bar_capacity 根K线（EMA200 预热 + 提示词窗口）；
+        # 价格列精度 bar_price_dtype=None 时按品种报价位数与价格量级选择（见 bar_buffer.price_dtype_for），也可固定为 np.float32 / np.float64。
+        # 首次按 history_days 拉取，之后只拉取最后一根之后的新K线。本地合成模式（base_timeframe）仍按天数整段拉取
+        self.bar_capacity = bar_capacity
+        self.bar_price_dtype = None
+        self._digits: dict[str, int] = {}
+        self._bar_buffers: dict[tuple, BarBuffer] = {}
+        self._bar_lock = threading.Lock()
+
+        # 增量指标引擎（按 品种/周期 保存运行状态，保留的行数与K线容器一致）
+        self.indicators = IndicatorEngine(max_rows=self.bar_capacity)
+        # 市场结构（摆动/结构突破/缺口/订单块），同样按 品种/周期 增量维护；structure_per_side 为每周期上下方各列出的区间数
+        self.structure = StructureEngine()
+        self.structure_per_side = 2
+
+        # 本地合成模式：只拉取最细周期（"M5"/"M1"），其余周期本地合成；None 表示逐周期拉取
+        self.base_timeframes = {
+            "M1": mt5.TIMEFRAME_M1,
+            "M5": mt5.TIMEFRAME_M5,
         }
+        if base_timeframe is not None and base_timeframe not in self.base_timeframes:
+            raise ValueError(f"不支持的基础周期：{base_timeframe}（可选 M1/M5）")
+        self.base_timeframe = base_timeframe
+        self.verify_resample = verify_resample
+        self.resample_reports: dict[str, dict] = {}
+
+        # 每个周期拉取的历史天数（EMA200 等指标的预热长度）
+        self.history_days = history_days
+
+        # 分阶段耗时追踪：结果中始终包含 trace；提供路径时每次分析追加一行（jsonl 或 otel 格式）
+        self.trace_path = trace_path
+        self.trace_format = trace_format
+
+        # 批量分析时把全量指标计算放到进程池（首次使用时创建）；行数少于阈值时本进程直接算
+        self._cpu_pool: ProcessPoolExecutor | None = None
+        self.pool_min_rows = 5000
+
+        # 实时行情（逐笔 tick 维护当日 OHLC/点差/时段区间）；False 时每次按 M5 K线和 symbol_info 查询
+        self.live_ticks = live_ticks
+        self._live_feeds: dict[str, LiveFeed] = {}
+        self._live_lock = threading.Lock()
+
+        # 量化输入不变时沿用上次 LLM 结论（仅 reuse_unchanged=True 的调用，例如自动刷新）
+        # fingerprint_bar_timeframes：收盘即视为输入变化的周期（默认 H1/H4/D1，快周期只看量化数值）
+        self.quantize_atr = 0.25
+        self.fingerprint_bar_timeframes: tuple[str, ...] = FINGERPRINT_BAR_TIMEFRAMES
+        self._last_llm: dict[str, tuple[str, dict]] = {}
+
+        # 本地规则预检：硬性条件（趋势一致性/止损/盈亏比/点差）不满足时不调用交易信号链（技术分析照常调用），
+        # 直接给出“不交易”；满足时把计算结果写入交易信号 Prompt。阈值可通过 self.rules 调整，None 表示关闭
+        self.rules: TradingRules | None = TradingRules() if prescreen_rules else None
+
+        # 行情块编码："verbose" 为逐行带字段名的原格式；"compact" 为表格 + 相对基准价差值（省 token）
+        # token_budget：compact 模式下六个周期行情块的 token 上限，超出时自动缩短各周期窗口
+        if prompt_encoding not in ("verbose", "compact"):
+            raise ValueError(f"不支持的行情编码：{prompt_encoding}（可选 verbose/compact）")
+        self.prompt_encoding = prompt_encoding
+        self.token_budget = token_budget
+        self.prompt_window = 10
+        self.prompt_min_window = 3
+        self.prompt_precision = 1
+        self.prompt_columns = COMPACT_COLUMNS
+        # compact 模式下交易信号链只附带各周期最近几根（完整窗口已在特征分析中给过）；None 表示与特征分析相同
+        self.trading_window: int | None = 3
 
     # ===== MT5 =====
     def initialize_mt5(self):
-        if not mt5.initialize():
-            raise RuntimeError(f"MT5 初始化失败：{mt5.last_error()}")
+        # 网关已连接时几乎无开销；未连接时按退避重连
+        with span("mt5.connect") as sp:
+            connected = self.gateway.ensure_connected()
+            sp.set(connected=connected)
+        if not connected:
+            self._mt5_online = False
+            # 终端短暂不可用时，有本地缓存就继续用缓存数据
+            if self.bar_cache is not None:
+                return
+            raise RuntimeError(f"MT5 初始化失败：{self.gateway.last_error}")
+        self._mt5_online = True
 
     def shutdown_mt5(self):
-        mt5.shutdown()
+        # 关闭共享长连接（通常只在进程退出时调用）
+        self.gateway.stop()
+        self._mt5_online = False
+
+    def _mt5(self, name: str, *args):
+        if not self._mt5_online:
+            return None
+        return self.gateway.call(name, *args)
 
     # ===== 指标 =====
     def calculate_indicators(self, df: pd.DataFrame) -> pd.DataFrame:
+        # 全量重算路径（与增量引擎逐位一致）
         df = df.copy()
-
-        df["ema_20"] = df["close"].ewm(span=20, adjust=False).mean()
-        df["ema_50"] = df["close"].ewm(span=50, adjust=False).mean()
-        df["ema_200"] = df["close"].ewm(span=200, adjust=False).mean()
-
-        delta = df["close"].diff()
-        gain = delta.clip(lower=0)
-        loss = -delta.clip(upper=0)
-        rs = gain.rolling(14).mean() / loss.rolling(14).mean()
-        df["rsi"] = 100 - (100 / (1 + rs))
-
-        prev_close = df["close"].shift(1)
-        tr = pd.concat(
-            [
-                (df["high"] - df["low"]),
-                (df["high"] - prev_close).abs(),
-                (df["low"] - prev_close).abs(),
-            ],
-            axis=1,
-        ).max(axis=1)
-        df["atr"] = tr.rolling(14).mean()
-
+        values = compute_indicators(
+            df["close"].to_numpy(dtype=np.float64),
+            df["high"].to_numpy(dtype=np.float64),
+            df["low"].to_numpy(dtype=np.float64),
+        )
+        for col in INDICATOR_COLUMNS:
+            df[col] = values[col]
         return df
 
+    def update_indicators(self, symbol: str, tf_name: str, df: pd.DataFrame) -> pd.DataFrame:
+        key = (symbol, tf_name)
+        with span("indicators", tf=tf_name) as sp:
+            values = None
+            if self._cpu_pool is not None and len(df) >= self.pool_min_rows and self.indicators.needs_full(key, df):
+                # 冷启动的全量计算是纯 CPU 工作：交给进程池，多个品种真正并行
+                values = self._cpu_pool.submit(
+                    compute_indicators,
+                    df["close"].to_numpy(dtype=np.float64),
+                    df["high"].to_numpy(dtype=np.float64),
+                    df["low"].to_numpy(dtype=np.float64),
+                ).result()
+                sp.set(process_pool=True)
+            return self.indicators.update(key, df, precomputed=values)
+
+    def update_indicators_many(self, frames: dict[tuple, pd.DataFrame]) -> dict[tuple, pd.DataFrame]:
+        """
+        多条序列（(品种, 周期) -> K线）一起更新：需要全量重算的序列按周期合并为二维数组批量计算
+        （进程池可用且数据量大时各周期分别提交），其余走增量路径。
+        """
+        groups: dict[str, list[tuple]] = {}
+        for key, df in frames.items():
+            if self.indicators.needs_full(key, df):
+                groups.setdefault(key[1], []).append(key)
+
+        precomputed: dict[tuple, dict] = {}
+        with span("indicators.batch", series=sum(len(keys) for keys in groups.values())) as sp:
+            pending = {}
+            for tf_name, keys in groups.items():
+                series = [
+                    (
+                        frames[k]["close"].to_numpy(dtype=np.float64),
+                        frames[k]["high"].to_numpy(dtype=np.float64),
+                        frames[k]["low"].to_numpy(dtype=np.float64),
+                    )
+                    for k in keys
+                ]
+                if self._cpu_pool is not None and sum(len(c) for c, _, _ in series) >= self.pool_min_rows:
+                    pending[tf_name] = self._cpu_pool.submit(compute_indicators_many, series)
+                    sp.set(process_pool=True)
+                else:
+                    pending[tf_name] = compute_indicators_many(series)
+            for tf_name, keys in groups.items():
+                values = pending[tf_name]
+                precomputed.update(zip(keys, values if isinstance(values, list) else values.result()))
+        return {key: self.indicators.update(key, df, precomputed=precomputed.get(key)) for key, df in frames.items()}
+
     # ===== 数据拉取 =====
-    def fetch_rates_range(self, symbol: str, timeframe, start: datetime, end: datetime) -> pd.DataFrame | None:
-        rates = mt5.copy_rates_range(symbol, timeframe, start, end)
+    def fetch_rates(self, symbol: str, timeframe, start: datetime, end: datetime):
+        """MT5 结构化数组（经本地缓存）；没有数据时返回 None"""
+        if self.bar_cache is None:
+            rates = self._mt5("copy_rates_range", symbol, timeframe, start, end)
+        else:
+            rates = self._fetch_rates_cached(symbol, timeframe, start, end)
         if rates is None or len(rates) == 0:
             return None
+        return rates
+
+    def fetch_rates_range(self, symbol: str, timeframe, start: datetime, end: datetime) -> pd.DataFrame | None:
+        rates = self.fetch_rates(symbol, timeframe, start, end)
+        if rates is None:
+            return None
         df = pd.DataFrame(rates)
         df["time"] = pd.to_datetime(df["time"], unit="s")
         return df
 
+    def _fetch_rates_cached(self, symbol: str, timeframe, start: datetime, end: datetime):
+        cache = self.bar_cache
+        start_ts = int(start.timestamp())
+        last = cache.last_time(symbol, timeframe)
+        covered = cache.covered_from(symbol, timeframe)
+
+        if self._mt5_online:
+            if last is None or covered is None or start_ts < covered:
+                # 首次或需要向前回补：整段拉取
+                rates = self._mt5("copy_rates_range", symbol, timeframe, start, end)
+                if rates is not None and len(rates) > 0:
+                    cache.replace_all(symbol, timeframe, rates, covered_from=start_ts)
+            else:
+                # 增量：从最后一根缓存K线（可能未收盘）开始拉取，UTC 时间避免本地时区偏移
+                since = datetime.fromtimestamp(last, tz=timezone.utc)
+                rates = self._mt5("copy_rates_range", symbol, timeframe, since, end)
+                if rates is not None and len(rates) > 0:
+                    cache.append(symbol, timeframe, rates)
+
+        # 结束时间为“现在”时不截尾（K线时间为服务器时区，可能晚于本地时间戳）
+        end_ts = int(end.timestamp()) if end < datetime.now() - timedelta(minutes=1) else np.iinfo(np.int64).max
+        return cache.slice(symbol, timeframe, start_ts, end_ts)
+
+    def bar_buffer(self, symbol: str, tf_name: str) -> BarBuffer:
+        buf = self._bar_buffers.get((symbol, tf_name))
+        if buf is not None:
+            return buf
+        # 报价位数在锁外查询（经 MT5 网关）
+        digits = self.get_symbol_digits(symbol) if self.bar_price_dtype is None else None
+        with self._bar_lock:
+            buf = self._bar_buffers.get((symbol, tf_name))
+            if buf is None:
+                buf = self._bar_buffers[(symbol, tf_name)] = BarBuffer(self.bar_capacity, self.bar_price_dtype, digits=digits)
+            return buf
+
+    def _fetch_tf(self, symbol: str, tf_name: str, days_back: int) -> pd.DataFrame | None:
+        # 返回的 DataFrame 直接引用K线容器的数组（只含 time/OHLC）
+        buf = self.bar_buffer(symbol, tf_name)
+        end = datetime.now()
+        last = buf.last_time()
+        # 已有数据时从最后一根（可能未收盘）开始增量拉取，UTC 时间避免本地时区偏移
+        start = end - timedelta(days=days_back) if last is None else datetime.fromtimestamp(last, tz=timezone.utc)
+        with span("fetch", tf=tf_name) as sp:
+            rates = self.fetch_rates(symbol, self.timeframes[tf_name], start, end)
+            if rates is not None:
+                buf.merge(rates)
+            sp.set(rows=0 if rates is None else len(rates), buffered=len(buf))
+        if len(buf) == 0:
+            return None
+        return buf.frame()
+
     def get_df(self, symbol: str, tf_name: str, days_back: int = 60) -> pd.DataFrame | None:
+        df = self._fetch_tf(symbol, tf_name, days_back)
+        if df is None:
+            return None
+        return self.update_indicators(symbol, tf_name, df)
+
+    def get_resampled_dfs(self, symbol: str, days_back: int = 60) -> dict[str, pd.DataFrame] | None:
+        raw = self._resampled_raw(symbol, days_back)
+        if raw is None:
+            return None
+        return {tf_name: self.update_indicators(symbol, tf_name, df) for tf_name, df in raw.items()}
+
+    def _resampled_raw(self, symbol: str, days_back: int) -> dict[str, pd.DataFrame] | None:
+        # 一次拉取基础周期，向量化合成其余周期
         end = datetime.now()
         start = end - timedelta(days=days_back)
-        df = self.fetch_rates_range(symbol, self.timeframes[tf_name], start, end)
-        if df is None or df.empty:
+        with span("fetch", tf=self.base_timeframe) as sp:
+            base = self.fetch_rates_range(symbol, self.base_timeframes[self.base_timeframe], start, end)
+            sp.set(rows=0 if base is None else len(base))
+        if base is None or base.empty:
             return None
-        return self.calculate_indicators(df)
+        with span("resample"):
+            return {
+                tf_name: base if tf_name == self.base_timeframe else resample_ohlc(base, tf_name)
+                for tf_name in self.timeframes
+            }
+
+    def warm_indicators(self, symbols: list[str]) -> int:
+        """
+        多品种指标冷启动：拉取各品种各周期K线（写入本地缓存），需要全量计算的序列按周期合并后批量计算。
+        之后各品种的分析只需增量更新。返回参与的序列数。
+        """
+        frames: dict[tuple, pd.DataFrame] = {}
+        for symbol in symbols:
+            if self.base_timeframe:
+                raw = self._resampled_raw(symbol, self.history_days) or {}
+            else:
+                raw = {tf_name: self._fetch_tf(symbol, tf_name, self.history_days) for tf_name in TIMEFRAME_NAMES}
+            frames.update(((symbol, tf_name), df) for tf_name, df in raw.items() if df is not None and not df.empty)
+        self.update_indicators_many(frames)
+        return len(frames)
+
+    def check_resample_consistency(self, symbol: str, dfs: dict[str, pd.DataFrame], count: int = 50, tol: float = 0.01) -> dict:
+        # 与券商自身的高周期K线（只取已收盘的最近 count 根）逐根比较
+        report = {}
+        for tf_name, df in dfs.items():
+            if tf_name == self.base_timeframe:
+                continue
+            rates = self._mt5("copy_rates_from_pos", symbol, self.timeframes[tf_name], 1, count)
+            if rates is None or len(rates) == 0:
+                report[tf_name] = None
+                continue
+            broker = pd.DataFrame(rates)
+            broker["time"] = pd.to_datetime(broker["time"], unit="s")
+            report[tf_name] = compare_bars(df[["time", *PRICE_COLUMNS]], broker[["time", *PRICE_COLUMNS]], tol=tol)
+        return report
 
     # ===== 文本格式化 =====
     def prepare_data_string(self, df: pd.DataFrame, tf_name: str, n: int = 10) -> str:
         recent = df.tail(n)
         lines = [f"最近{n}根 {tf_name} K线（含指标）："]
-        for _, row in recent.iterrows():
-            lines.append(
-                f"时间:{row['time']} "
-                f"O:{row['open']:.2f} H:{row['high']:.2f} L:{row['low']:.2f} C:{row['close']:.2f} "
-                f"RSI:{row.get('rsi', np.nan):.2f} EMA20:{row.get('ema_20', np.nan):.2f} EMA50:{row.get('ema_50', np.nan):.2f} "
-                f"EMA200:{row.get('ema_200', np.nan):.2f} ATR:{row.get('atr', np.nan):.2f}"
-            )
+        lines.extend(format_bar_lines(recent))
         return "\n".join(lines)
 
     # ===== 今日快照 =====
@@ -322,7 +853,7 @@ class XAUUSDTradingBot:
         }
 
     def get_yesterday_levels(self, symbol: str) -> dict | None:
-        rates = mt5.copy_rates_from_pos(symbol, mt5.TIMEFRAME_D1, 0, 5)
+        rates = self._mt5("copy_rates_from_pos", symbol, mt5.TIMEFRAME_D1, 0, 5)
         if rates is None or len(rates) < 2:
             return None
         df = pd.DataFrame(rates)
@@ -335,125 +866,594 @@ class XAUUSDTradingBot:
         }
 
     def get_current_spread(self, symbol: str) -> int | None:
-        info = mt5.symbol_info(symbol)
+        info = self._mt5("symbol_info", symbol)
         if info is None:
             return None
         return int(info.spread)
 
+    def get_symbol_point(self, symbol: str) -> float | None:
+        # 最小报价单位（点差换算为价格）；品种属性不变，每个品种只查询一次
+        point = self._points.get(symbol)
+        if point is None:
+            info = self._mt5("symbol_info", symbol)
+            if info is not None and getattr(info, "point", 0):
+                point = self._points[symbol] = float(info.point)
+        return point
+
+    def refresh_probe(self, symbol: str, tf_names, timeout: float = 5.0) -> dict | None:
+        """
+        自动刷新检查用：各周期最后一根已收盘K线的时间 + 最新报价，合并为一次 MT5 网关提交（不经 initialize_mt5 的退避重连）。
+        终端不可用或 timeout 秒内没有完成时返回 None，调用方（页面片段/调度线程）不会被阻塞。
+        """
+        tf_names = tuple(tf_names)
+        calls = [("copy_rates_from_pos", symbol, self.timeframes[tf_name], 1, 1) for tf_name in tf_names]
+        calls.append(("symbol_info_tick", symbol))
+        # 最小报价单位每个品种只查一次，未知时随本次一起查询
+        point = self._points.get(symbol)
+        if point is None:
+            calls.append(("symbol_info", symbol))
+        with span("mt5.probe", calls=len(calls)) as sp:
+            try:
+                out = self.gateway.call_many(calls, timeout=timeout)
+            except (RuntimeError, FuturesTimeoutError) as e:
+                sp.set(error=type(e).__name__)
+                return None
+        self._mt5_online = True
+        rates, tick = out[:len(tf_names)], out[len(tf_names)]
+        if point is None:
+            info = out[-1]
+            if info is not None and getattr(info, "point", 0):
+                point = self._points[symbol] = float(info.point)
+        bid = float(tick.bid) if tick is not None else None
+        return {
+            "closed_bar_time": {
+                tf_name: int(r["time"][-1]) if r is not None and len(r) > 0 else None
+                for tf_name, r in zip(tf_names, rates)
+            },
+            "bid": bid,
+            # 点差（点数，与实时状态的点差统计同一口径）
+            "spread": (float(tick.ask) - bid) / point if tick is not None and point else None,
+        }
+
+    def get_symbol_digits(self, symbol: str) -> int | None:
+        # 报价小数位数（选择K线价格列精度）；同样每个品种只查询一次
+        digits = self._digits.get(symbol)
+        if digits is None:
+            info = self._mt5("symbol_info", symbol)
+            if info is not None and getattr(info, "digits", None) is not None:
+                digits = self._digits[symbol] = int(info.digits)
+        return digits
+
+    def last_closed_bar_time(self, symbol: str, tf_name: str = "M5") -> int | None:
+        # 最后一根已收盘K线的时间（用作结果缓存的键，同一根K线内结果不变）
+        self.initialize_mt5()
+        rates = self._mt5("copy_rates_from_pos", symbol, self.timeframes[tf_name], 1, 1)
+        if rates is not None and len(rates) > 0:
+            return int(rates["time"][-1])
+        if self.bar_cache is not None:
+            # 终端不可用时用缓存中的倒数第二根（最后一根视为未收盘）
+            cached = self.bar_cache.load(symbol, self.timeframes[tf_name])
+            if len(cached) >= 2:
+                return int(cached["time"][-2])
+        return None
+
     def get_h1_swings(self, df_h1: pd.DataFrame, lookback: int = 80) -> tuple[float, float]:
         d = df_h1.tail(lookback)
         return round(float(d["high"].max()), 2), round(float(d["low"].min()), 2)
 
     def last_state_line(self, df: pd.DataFrame, name: str) -> str:
-        last = df.iloc[-1]
-        return (
-            f"{name}: close={last['close']:.2f}, RSI={_safe_float(last.get('rsi'),1)}, "
-            f"EMA20={_safe_float(last.get('ema_20'))}, EMA50={_safe_float(last.get('ema_50'))}, EMA200={_safe_float(last.get('ema_200'))}, "
-            f"ATR={_safe_float(last.get('atr'))}"
+        # 只取最后一行需要的几个标量，避免 iloc[-1] 构造整行 Series
+        close, rsi, ema20, ema50, ema200, atr = (
+            df[c].iat[-1] if c in df else None
+            for c in ("close", "rsi", "ema_20", "ema_50", "ema_200", "atr")
         )
+        return format_state_line(name, close, rsi, ema20, ema50, ema200, atr)
 
     # ===== 主流程 =====
-    def run_analysis(self, symbol: str = "XAUUSD") -> dict:
-        self.initialize_mt5()
-        try:
-            # 1) 拉取多周期
-            dfs: dict[str, pd.DataFrame] = {}
-            market_data_str: dict[str, str] = {}
-
-            for tf_name in ["D1", "H4", "H1", "M30", "M15", "M5"]:
-                df = self.get_df(symbol, tf_name, days_back=120)
-                if df is None or df.empty:
-                    raise RuntimeError(f"{tf_name} 获取数据失败（请确认MT5已登录且品种可用）")
-                dfs[tf_name] = df
-                market_data_str[tf_name] = self.prepare_data_string(df, tf_name, n=10)
-
-            # 2) 系统预测区间（真实数值）
-            forecast_lines = []
-            for tf_name, df in dfs.items():
-                last = df.iloc[-1]
-                fr = forecast_range(float(last["close"]), float(last["atr"]), self.k_map.get(tf_name, 1.0))
-                if fr:
-                    forecast_lines.append(f"{tf_name} 预测区间：{fr[0]} ~ {fr[1]}（ATR={float(last['atr']):.2f}，k={self.k_map.get(tf_name,1.0)}）")
-            forecast_text = "\n".join(forecast_lines) if forecast_lines else "预测区间：暂无（ATR不足或数据不足）"
-
-            # 3) 特征分析（LLM）
-            features = self.feature_chain.invoke({
-                "daily_data": market_data_str["D1"],
-                "h4_data": market_data_str["H4"],
-                "h1_data": market_data_str["H1"],
-                "m30_data": market_data_str["M30"],
-                "m15_data": market_data_str["M15"],
-                "m5_data": market_data_str["M5"],
-            })
-            technical_features = features.content if hasattr(features, "content") else str(features)
-
-            # 4) 交易信号（LLM）
-            signal = self.trading_chain.invoke({
-                "daily_data": market_data_str["D1"],
-                "h4_data": market_data_str["H4"],
-                "h1_data": market_data_str["H1"],
-                "m30_data": market_data_str["M30"],
-                "m15_data": market_data_str["M15"],
-                "m5_data": market_data_str["M5"],
-                "technical_features": technical_features,
-                "forecast_data": forecast_text,
-            })
-            trading_signal = signal.content if hasattr(signal, "content") else str(signal)
+    def load_market_data(self, symbol: str) -> tuple[dict[str, pd.DataFrame], dict[str, str]]:
+        dfs: dict[str, pd.DataFrame] = {}
+        market_data_str: dict[str, str] = {}
+        resampled = self.get_resampled_dfs(symbol, days_back=self.history_days) if self.base_timeframe else None
+        for tf_name in TIMEFRAME_NAMES:
+            if self.base_timeframe:
+                df = resampled.get(tf_name) if resampled else None
+            else:
+                df = self.get_df(symbol, tf_name, days_back=self.history_days)
+            if df is None or df.empty:
+                raise RuntimeError(f"{tf_name} 获取数据失败（请确认MT5已登录且品种可用）")
+            dfs[tf_name] = df
+            if self.prompt_encoding == "verbose":
+                with span("format", tf=tf_name) as sp:
+                    market_data_str[tf_name] = self.prepare_data_string(df, tf_name, n=self.prompt_window)
+                    sp.set(bytes=text_bytes([market_data_str[tf_name]]))
+        if self.prompt_encoding == "compact":
+            with span("format", encoding="compact") as sp:
+                windows, market_data_str, tokens = self.encode_compact(dfs)
+                sp.set(bytes=text_bytes(market_data_str.values()), tokens=tokens, windows=windows)
+        if self.base_timeframe and self.verify_resample and self._mt5_online:
+            with span("resample_check"):
+                self.resample_reports[symbol] = self.check_resample_consistency(symbol, dfs)
+        return dfs, market_data_str
+
+    def encode_compact(self, dfs: dict[str, pd.DataFrame]) -> tuple[dict[str, int], dict[str, str], int]:
+        """compact 编码：在 token_budget 内选择各周期窗口，返回 (窗口长度, 各周期文本, token 数)"""
+        return fit_windows(
+            dfs, self.token_budget, max_n=self.prompt_window, min_n=self.prompt_min_window,
+            precision=self.prompt_precision, columns=self.prompt_columns,
+        )
+
+    def trading_market_text(self, dfs: dict[str, pd.DataFrame], market_data_str: dict[str, str]) -> dict[str, str]:
+        """交易信号链使用的行情块：compact 模式下截短为 trading_window 根，其余情况与特征分析相同"""
+        if self.prompt_encoding != "compact":
+            return market_data_str
+        return self._compact_trading_text(dfs, market_data_str)
+
+    def _compact_trading_text(self, dfs: dict[str, pd.DataFrame], compact: dict[str, str]) -> dict[str, str]:
+        if self.trading_window is None:
+            return compact
+        windows = {tf_name: min(self.trading_window, self.prompt_window) for tf_name in dfs}
+        return encode_market_blocks(dfs, windows, precision=self.prompt_precision, columns=self.prompt_columns)
+
+    def prompt_token_report(self, dfs: dict[str, pd.DataFrame]) -> dict:
+        """同一份数据按 verbose 与当前 compact 配置编码，分别统计特征分析/交易信号两条 Prompt 的 token 数"""
+        forecast = self.build_forecast_text(dfs)
+        verbose = {tf_name: self.prepare_data_string(df, tf_name, n=self.prompt_window) for tf_name, df in dfs.items()}
+        windows, compact, _ = self.encode_compact(dfs)
+        variants = {
+            "verbose": (verbose, verbose),
+            "compact": (compact, self._compact_trading_text(dfs, compact)),
+        }
+        report = {"counter": token_counter_name(), "token_budget": self.token_budget, "windows": windows}
+        for name, (feature_text, trading_text) in variants.items():
+            # 交易信号 Prompt 中的技术分析为 LLM 输出，这里留空，只比较行情部分的差异
+            feature = count_tokens(FEATURE_PROMPT.format(**self._market_inputs(feature_text), structure_levels=""))
+            trading = count_tokens(TRADING_PROMPT.format(
+                **self._market_inputs(trading_text), technical_features="", forecast_data=forecast, rule_facts="",
+            ))
+            report[name] = {
+                "market_blocks": sum(count_tokens(t) for t in feature_text.values()),
+                "feature_prompt": feature,
+                "trading_prompt": trading,
+                "total": feature + trading,
+            }
+        report["saving_pct"] = round((1 - report["compact"]["total"] / report["verbose"]["total"]) * 100, 1)
+        return report
+
+    def structure_levels(self, symbol: str, dfs: dict[str, pd.DataFrame]) -> str:
+        """各周期市场结构（增量更新）整理为 Prompt 文本"""
+        states = {tf_name: self.structure.update((symbol, tf_name), df) for tf_name, df in dfs.items()}
+        price = float(dfs["M5"]["close"].iat[-1])
+        return format_structure_levels(states, price, self.structure_per_side)
+
+    def grounding_values(self, dfs: dict[str, pd.DataFrame]) -> list[np.ndarray]:
+        """输出校验的价格依据（除各链输入文本外）：各周期提示词窗口内的 OHLC 与均线（compact 编码的文本中只有相对差值）"""
+        cols = ("open", "high", "low", "close", "ema_20", "ema_50", "ema_200")
+        return [df[c].to_numpy()[-self.prompt_window:] for df in dfs.values() for c in cols if c in df]
+
+    def display_text(self, name: str, text: str) -> str:
+        """链输出 -> 展示文本：结构化输出按原输出格式渲染（信号解析与界面无需区分），解析失败时原样返回"""
+        if not (self.structured_output and name in SCHEMAS):
+            return text
+        data = parse_json_output(text, name)[0]
+        return RENDERERS[name](data) if data is not None else text
+
+    def build_forecast_text(self, dfs: dict[str, pd.DataFrame]) -> str:
+        return format_forecast_text(self._forecast_inputs(dfs), self.k_map)
+
+    def build_forecast_ranges(self, dfs: dict[str, pd.DataFrame]) -> dict:
+        return forecast_ranges(self._forecast_inputs(dfs), self.k_map)
+
+    @staticmethod
+    def _forecast_inputs(dfs: dict[str, pd.DataFrame]) -> dict:
+        return {tf_name: (df["close"].iat[-1], df["atr"].iat[-1]) for tf_name, df in dfs.items()}
+
+    def live_feed(self, symbol: str) -> LiveFeed:
+        with self._live_lock:
+            feed = self._live_feeds.get(symbol)
+            if feed is None:
+                source = MT5TickSource(self._mt5, symbol, mt5.COPY_TICKS_ALL, mt5.TIMEFRAME_D1)
+                feed = self._live_feeds[symbol] = LiveFeed(symbol, source)
+            return feed
+
+    def refresh_live(self, symbol: str) -> LiveFeed | None:
+        """拉取新 tick 并返回实时状态；离线或终端不提供 tick 时返回 None"""
+        if not (self.live_ticks and self._mt5_online):
+            return None
+        feed = self.live_feed(symbol)
+        with span("lookup.live") as sp:
+            ok = feed.refresh()
+            sp.set(ok=ok, ticks=feed.state.ticks)
+        return feed if ok else None
+
+    def get_market_lookups(self, symbol: str) -> dict:
+        feed = self.refresh_live(symbol)
+        if feed is not None:
+            state = feed.state
+            yesterday = state.yesterday_levels()
+            if yesterday is None:
+                with span("lookup.yesterday"):
+                    yesterday = self.get_yesterday_levels(symbol)
+            spread = state.current_spread()
+            if spread is None:
+                with span("lookup.spread"):
+                    spread = self.get_current_spread(symbol)
+            return {
+                "today": state.snapshot(), "yesterday": yesterday, "spread": spread,
+                "point": self.get_symbol_point(symbol), "live": state.summary(),
+            }
 
-            # 5) 当日快照 + 昨日关键位 + H1摆动
+        with span("lookup.today"):
             today = self.get_today_snapshot(symbol)
-            y = self.get_yesterday_levels(symbol)
+        with span("lookup.yesterday"):
+            yesterday = self.get_yesterday_levels(symbol)
+        with span("lookup.spread"):
             spread = self.get_current_spread(symbol)
+        return {"today": today, "yesterday": yesterday, "spread": spread, "point": self.get_symbol_point(symbol), "live": None}
+
+    def build_daily_inputs(self, dfs: dict[str, pd.DataFrame], lookups: dict, forecast_text: str, structure_text: str) -> dict:
+        h1_swing_high, h1_swing_low = self.get_h1_swings(dfs["H1"], lookback=80)
+        state_lines = [self.last_state_line(dfs[tf_name], tf_name) for tf_name in TIMEFRAME_NAMES]
+        return format_daily_inputs(
+            lookups["today"], lookups["yesterday"], lookups["spread"],
+            h1_swing_high, h1_swing_low, state_lines, forecast_text, structure_text,
+        )
 
-            h1_swing_high, h1_swing_low = self.get_h1_swings(dfs["H1"], lookback=80)
-
-            today_snapshot_text = "今日快照：无法获取"
-            if today:
-                direction = "上涨" if today["change_pct"] >= 0 else "下跌"
-                today_snapshot_text = (
-                    f"日期：{today['date']}\n"
-                    f"当前价格：{today['last']}（{direction}{abs(today['change_pct'])}%）\n"
-                    f"今日开/高/低/现：{today['open']} / {today['high']} / {today['low']} / {today['last']}\n"
-                    f"今日振幅：{today['range']}\n"
-                    f"点差：{spread if spread is not None else '无法获取'}"
-                )
+    @staticmethod
+    def _market_inputs(market_data_str: dict[str, str]) -> dict:
+        return {
+            "daily_data": market_data_str["D1"],
+            "h4_data": market_data_str["H4"],
+            "h1_data": market_data_str["H1"],
+            "m30_data": market_data_str["M30"],
+            "m15_data": market_data_str["M15"],
+            "m5_data": market_data_str["M5"],
+        }
 
-            yesterday_text = "昨日关键位：无法获取"
-            if y:
-                yesterday_text = f"昨日高/低/收：{y['y_high']} / {y['y_low']} / {y['y_close']}"
-
-            h1_swings_text = f"H1最近摆动高/低：{h1_swing_high} / {h1_swing_low}"
-
-            tf_last_state = "\n".join([
-                self.last_state_line(dfs["D1"], "D1"),
-                self.last_state_line(dfs["H4"], "H4"),
-                self.last_state_line(dfs["H1"], "H1"),
-                self.last_state_line(dfs["M30"], "M30"),
-                self.last_state_line(dfs["M15"], "M15"),
-                self.last_state_line(dfs["M5"], "M5"),
-            ])
-
-            # 6) 当日行情分析（LLM：含入场点位）
-            daily = self.daily_chain.invoke({
-                "today_snapshot": today_snapshot_text,
-                "yesterday_levels": yesterday_text,
-                "h1_swings": h1_swings_text,
-                "tf_last_state": tf_last_state,
-                "forecast_data": forecast_text,
+    async def arun_analysis(
+        self,
+        symbol: str = "XAUUSD",
+        on_token=None,
+        llm_limit: asyncio.Semaphore | None = None,
+        reuse_unchanged: bool = False,
+    ) -> dict:
+        # 整次分析记录为一个 Trace（各阶段耗时、LLM token/字节数），放在结果的 trace 字段
+        # llm_limit：批量分析时多个品种共享的 LLM 并发上限
+        # reuse_unchanged：量化输入指纹与上次相同时跳过三条 LLM 链，沿用上次结论
+        with start_trace(
+            "run_analysis", symbol=symbol, base_timeframe=self.base_timeframe,
+            streaming=on_token is not None, encoding=self.prompt_encoding,
+        ) as trace:
+            result = await self._arun_analysis(symbol, on_token, llm_limit, reuse_unchanged)
+        result["trace"] = trace.to_dict()
+        if self.trace_path:
+            export_trace(result["trace"], self.trace_path, self.trace_format)
+        if self.history is not None:
+            await asyncio.to_thread(self.history.append, result)
+        return result
+
+    def warm_start(self, symbol: str) -> dict | None:
+        """
+        分析历史中该品种最近一次的结果（没有则 None）。
+        同时用其中的输入指纹恢复“输入不变沿用上次结论”，进程重启后行情未变时 reuse_unchanged 的调用不再请求 GPT。
+        """
+        if self.history is None:
+            return None
+        result = self.history.latest(symbol)
+        if result is None:
+            return None
+        if result.get("input_fingerprint") and symbol not in self._last_llm:
+            data = {"trading": result.get("trading_signal_data"), "daily": result.get("daily_brief_data")}
+            self._last_llm[symbol] = (result["input_fingerprint"], {
+                "technical_features": result["technical_features"],
+                "trading_signal": result["trading_signal"],
+                "daily_brief": result["daily_brief"],
+                "validation": result.get("validation") or {},
+                "data": {k: v for k, v in data.items() if v is not None},
             })
-            daily_brief = daily.content if hasattr(daily, "content") else str(daily)
+        return result
+
+    async def _arun_analysis(
+        self,
+        symbol: str,
+        on_token,
+        llm_limit: asyncio.Semaphore | None = None,
+        reuse_unchanged: bool = False,
+    ) -> dict:
+        previous = self._last_llm.get(symbol) if reuse_unchanged else None
+
+        # 各链的输出校验结论与结构化字段（预检未通过的本地文本不校验）
+        checks: dict[str, dict] = {}
+        parsed: dict[str, dict] = {}
+
+        # on_token(字段, 文本)：提供时三条链改为流式调用，逐段回调；结构化输出的链回调的是 JSON 片段
+        # （界面用 output_check.partial_json_fields 解析已完整的字段并即时展示）
+        async def call_chain(chain, inputs: dict, field: str, name: str, fingerprint: str, dfs: dict) -> str:
+            if previous is not None and previous[0] == fingerprint:
+                text = previous[1][field]
+                if name in previous[1]["validation"]:
+                    checks[name] = previous[1]["validation"][name]
+                if name in previous[1]["data"]:
+                    parsed[name] = previous[1]["data"][name]
+                with span(f"llm.{name}", chain=name, skipped=True):
+                    if on_token is not None:
+                        on_token(field, text)
+                return text
+            structured = self.structured_output and name in SCHEMAS
+            async with llm_limit or contextlib.nullcontext():
+                text, hit = await _call_chain(chain, inputs, field, name, stream=on_token is not None)
+                text = await checked(inputs, field, name, text, hit, dfs)
+            if structured:
+                data = parsed.get(name)
+                text = RENDERERS[name](data) if data is not None else text
+            return text
+
+        async def _call_chain(chain, inputs: dict, field: str, name: str, stream: bool) -> tuple[str, bool]:
+            with span(f"llm.{name}", chain=name, streaming=stream, prompt_bytes=text_bytes(inputs.values())) as sp:
+                t0 = time.perf_counter()
+                if not stream:
+                    resp = await chain.ainvoke(inputs)
+                    text, usage, hit = _content(resp), usage_of(resp), is_cache_hit(resp)
+                else:
+                    parts, usage, hit = [], {}, False
+                    async for chunk in chain.astream(inputs):
+                        usage = usage_of(chunk) or usage
+                        hit = hit or is_cache_hit(chunk)
+                        piece = _content(chunk)
+                        if piece:
+                            if not parts:
+                                sp.set(first_token_ms=round((time.perf_counter() - t0) * 1000, 3))
+                            parts.append(piece)
+                            on_token(field, piece)
+                    text = "".join(parts)
+                sp.set(completion_bytes=text_bytes([text]), cache_hit=hit, **usage)
+                return text, hit
+
+        async def checked(inputs: dict, field: str, name: str, text: str, hit: bool, dfs: dict) -> str:
+            # 本地校验（语言/价格/结构化字段）；不通过时只重试这一条链：原对话后追加一条更正说明
+            rules = self.output_rules
+            structured = self.structured_output and name in SCHEMAS
+            if rules is None:
+                if structured:
+                    data = parse_json_output(text, name)[0]
+                    if data is not None:
+                        parsed[name] = data
+                return text
+
+            price = float(dfs["M5"]["close"].iat[-1])
+            with span(f"validate.{name}") as sp:
+                # 技术分析总结本身是模型输出，不作为价格依据
+                allowed = grounding_set(
+                    (v for k, v in inputs.items() if k != "technical_features"), self.grounding_values(dfs),
+                )
+                v = validate_output(name, text, allowed, price, rules, structured)
+                sp.set(ok=v["ok"], issues=len(v["issues"]))
+
+            retries, messages = 0, []
+            while not v["ok"] and retries < rules.max_retries:
+                retries += 1
+                messages = messages or [HumanMessage(content=self.prompts[name].format(**inputs))]
+                messages += [AIMessage(content=text), HumanMessage(content=correction_message(v["issues"], structured))]
+                with span(f"llm.{name}.retry", chain=name, attempt=retries, issues=len(v["issues"])) as sp:
+                    resp = await self.chain_models[name].ainvoke(messages)
+                    text = _content(resp)
+                    v = validate_output(name, text, allowed, price, rules, structured)
+                    sp.set(completion_bytes=text_bytes([text]), ok=v["ok"], **usage_of(resp))
+                if on_token is not None and not structured:
+                    on_token(field, "\n\n（输出未通过校验，已重新生成）\n" + text)
+            cached = self.cached_chains.get(name)
+            if v["ok"] and not hit and cached is not None:
+                # 只缓存通过校验（含重试后通过）的回答；最终仍不通过时不写入，下次重新调用模型
+                cached.store(inputs, text)
+
+            checks[name] = {"ok": v["ok"], "issues": v["issues"], "retries": retries}
+            if v["data"] is not None:
+                parsed[name] = v["data"]
+            return text
+
+        def local_chain(field: str, name: str, text: str) -> str:
+            # 预检未通过：不调用模型，直接使用本地文本
+            with span(f"llm.{name}", chain=name, skipped="prescreen"):
+                if on_token is not None:
+                    on_token(field, text)
+            return text
+
+        def reuse_key(r) -> str:
+            # 预检结论不同（例如点差恢复）时不沿用上次结论
+            v = r["screen"]
+            return r["market"]["fingerprint"] + ("" if v is None else f":{int(v['passed'])}")
+
+        async def market(_):
+            # 1) 拉取多周期 + 2) 系统预测区间（真实数值）
+            with span("market"):
+                dfs, market_data_str = await asyncio.to_thread(self.load_market_data, symbol)
+                with span("structure") as sp:
+                    structure = self.structure_levels(symbol, dfs)
+                    sp.set(bytes=text_bytes([structure]))
+                return {
+                    "dfs": dfs,
+                    "text": market_data_str,
+                    "trading_text": self.trading_market_text(dfs, market_data_str),
+                    "forecast": self.build_forecast_text(dfs),
+                    "forecast_ranges": self.build_forecast_ranges(dfs),
+                    "structure": structure,
+                    "fingerprint": input_fingerprint(dfs, self.quantize_atr, self.fingerprint_bar_timeframes),
+                }
+
+        async def lookups(_):
+            # 5) 当日快照 + 昨日关键位 + 点差
+            with span("lookups"):
+                return await asyncio.to_thread(self.get_market_lookups, symbol)
+
+        async def screen(r):
+            # 本地规则预检（纯数值计算，毫秒级）
+            if self.rules is None:
+                return None
+            with span("prescreen") as sp:
+                v = prescreen(r["market"]["dfs"], r["lookups"]["spread"], self.rules, r["lookups"]["point"])
+                sp.set(passed=v["passed"], direction=v["direction"])
+            return v
+
+        async def features(r):
+            # 3) 特征分析（LLM）；是面向用户的“技术分析”结果，预检未通过时同样调用（输入不变时仍沿用上次结论）
+            m = r["market"]
+            inputs = {**self._market_inputs(m["text"]), "structure_levels": m["structure"]}
+            return await call_chain(self.feature_chain, inputs, "technical_features", "feature", reuse_key(r), m["dfs"])
+
+        async def signal(r):
+            # 4) 交易信号（LLM）；预检未通过时直接“不交易”
+            m, v = r["market"], r["screen"]
+            if v is not None and not v["passed"]:
+                return local_chain("trading_signal", "trading", no_trade_text(v))
+            return await call_chain(self.trading_chain, {
+                **self._market_inputs(m["trading_text"]),
+                "technical_features": r["features"],
+                "forecast_data": m["forecast"],
+                "rule_facts": format_rule_facts(v) if v is not None else "未启用本地规则预检",
+            }, "trading_signal", "trading", reuse_key(r), m["dfs"])
+
+        async def daily(r):
+            # 6) 当日行情分析（LLM：含入场点位），不依赖 技术分析/交易信号，与其并发
+            m = r["market"]
+            with span("daily_inputs"):
+                inputs = self.build_daily_inputs(m["dfs"], r["lookups"], m["forecast"], m["structure"])
+            return await call_chain(self.daily_chain, inputs, "daily_brief", "daily", reuse_key(r), m["dfs"])
+
+        # MT5 调用由网关线程串行执行，这里的两个数据阶段可以并发提交
+        await asyncio.to_thread(self.initialize_mt5)
+        results = await run_stage_graph({
+            "market": ((), market),
+            "lookups": ((), lookups),
+            "screen": (("market", "lookups"), screen),
+            "features": (("market", "screen"), features),
+            "signal": (("market", "features", "screen"), signal),
+            "daily": (("market", "lookups", "screen"), daily),
+        })
+
+        fingerprint = reuse_key(results)
+        llm_skipped = previous is not None and previous[0] == fingerprint
+        self._last_llm[symbol] = (fingerprint, {
+            "technical_features": results["features"],
+            "trading_signal": results["signal"],
+            "daily_brief": results["daily"],
+            "validation": dict(checks),
+            "data": dict(parsed),
+        })
 
-            return {
-                "timestamp": datetime.now().isoformat(),
-                "symbol": symbol,
-                "current_spread": spread,
-                "today_snapshot": today,
-                "forecast": forecast_text,
-                "market_data": market_data_str,           # 各周期最近10根K线文本
-                "technical_features": technical_features, # LLM技术分析
-                "trading_signal": trading_signal,         # LLM交易信号
-                "daily_brief": daily_brief,               # LLM当日行情分析+入场
-            }
+        return {
+            "timestamp": datetime.now().isoformat(),
+            "symbol": symbol,
+            "current_spread": results["lookups"]["spread"],
+            "today_snapshot": results["lookups"]["today"],
+            "live_state": results["lookups"]["live"],      # 点差统计/当前时段区间（tick 实时）
+            "forecast": results["market"]["forecast"],
+            "forecast_ranges": results["market"]["forecast_ranges"],  # 各周期预测区间数值 {周期: {low, high, atr, k}}
+            "market_data": results["market"]["text"],      # 各周期最近10根K线文本
+            "structure_levels": results["market"]["structure"],  # 各周期市场结构价位（本地识别）
+            "technical_features": results["features"],    # LLM技术分析
+            "trading_signal": results["signal"],          # LLM交易信号
+            "daily_brief": results["daily"],              # LLM当日行情分析+入场
+            "trading_signal_data": parsed.get("trading"),  # 结构化输出的交易信号字段（文本模式为 None）
+            "daily_brief_data": parsed.get("daily"),       # 结构化输出的当日行情字段（文本模式为 None）
+            "validation": checks,                          # 各链输出校验：{链: {ok, issues, retries}}（未调用模型的链不在其中）
+            "resample_check": self.resample_reports.get(symbol) if self.base_timeframe else None,
+            "llm_cache": self.llm_cache.stats() if self.llm_cache is not None else None,
+            "llm_skipped": llm_skipped,
+            "input_fingerprint": fingerprint,              # 量化输入指纹（含预检结论），输入不变时沿用上次结论
+            "prescreen": results["screen"],                # 本地规则预检结论（None 表示未启用）
+            "refresh_anchor": self.refresh_anchor(results["market"]["dfs"], results["lookups"]),
+        }
+
+    @staticmethod
+    def refresh_anchor(dfs: dict[str, pd.DataFrame], lookups: dict) -> dict:
+        """本次分析时的参照值（自动刷新调度用）：最新价、各周期 ATR、最后收盘K线时间（秒）、点差"""
+        return {
+            "price": float(dfs["M5"]["close"].iat[-1]),
+            "atr": {tf_name: _safe_float(df["atr"].iat[-1], 4) for tf_name, df in dfs.items()},
+            "closed_bar_time": {
+                tf_name: int(df["time"].iat[-2].timestamp()) if len(df) >= 2 else None
+                for tf_name, df in dfs.items()
+            },
+            "spread": lookups.get("spread"),
+        }
+
+    def run_analysis(self, symbol: str = "XAUUSD", reuse_unchanged: bool = False) -> dict:
+        # 同步入口（Streamlit 使用）
+        return run_sync(self.arun_analysis(symbol, reuse_unchanged=reuse_unchanged))
+
+    # ===== 批量分析 =====
+    def _ensure_cpu_pool(self, workers: int | None = None) -> ProcessPoolExecutor:
+        if self._cpu_pool is None:
+            self._cpu_pool = ProcessPoolExecutor(max_workers=workers or min(4, os.cpu_count() or 1))
+        return self._cpu_pool
+
+    def shutdown_pool(self):
+        if self._cpu_pool is not None:
+            self._cpu_pool.shutdown(wait=False, cancel_futures=True)
+            self._cpu_pool = None
+
+    async def arun_batch(self, symbols: list[str], max_llm_concurrency: int = 4, use_process_pool: bool = True) -> dict:
+        """
+        多品种并行分析：先把各品种的指标冷启动按周期合并为二维数组批量计算（进程池可用时各周期并行），
+        之后各品种的数据阶段同时进行（MT5 请求经共享网关串行，指标只需增量更新），
+        所有品种的 LLM 调用共享一个并发上限。单个品种失败只记录在 failures 中，不影响其他品种。
+        """
+        t0 = time.perf_counter()
+        if use_process_pool:
+            self._ensure_cpu_pool()
+        llm_limit = asyncio.Semaphore(max_llm_concurrency)
+        symbols = list(dict.fromkeys(symbols))
+        # 先把各品种的指标冷启动合并成按周期的批量计算；本地K线缓存关闭时跳过（否则每个品种要重复拉取一遍）
+        if self.bar_cache is not None and len(symbols) > 1:
+            try:
+                await asyncio.to_thread(self.initialize_mt5)
+                await asyncio.to_thread(self.warm_indicators, symbols)
+            except RuntimeError:
+                pass    # MT5 不可用：各品种的分析会各自报告失败原因
+        outcomes = await asyncio.gather(
+            *(self.arun_analysis(sym, llm_limit=llm_limit) for sym in symbols),
+            return_exceptions=True,
+        )
+
+        results, failures = {}, {}
+        for sym, out in zip(symbols, outcomes):
+            if isinstance(out, BaseException):
+                failures[sym] = f"{type(out).__name__}: {out}"
+            else:
+                results[sym] = out
+        return {
+            "timestamp": datetime.now().isoformat(),
+            "symbols": symbols,
+            "results": results,
+            "failures": failures,
+            "elapsed_sec": round(time.perf_counter() - t0, 3),
+        }
 
-        finally:
-            self.shutdown_mt5()
+    def run_batch(self, symbols: list[str], max_llm_concurrency: int = 4, use_process_pool: bool = True) -> dict:
+        return run_sync(self.arun_batch(symbols, max_llm_concurrency, use_process_pool))
+
+    def stream_analysis(self, symbol: str = "XAUUSD"):
+        """
+        流式分析（同步生成器）：
+        逐段产出 ("token", 字段, 文本)，字段为 technical_features / trading_signal / daily_brief（结构化输出的链为 JSON 片段）；
+        最后产出 ("result", None, 完整结果dict)。
+        """
+        events: queue.Queue = queue.Queue()
+        done = object()
+
+        def worker():
+            try:
+                result = run_sync(self.arun_analysis(symbol, on_token=lambda f, t: events.put(("token", f, t))))
+                events.put(("result", None, result))
+            except BaseException as e:
+                events.put(("error", None, e))
+            finally:
+                events.put(done)
+
+        threading.Thread(target=worker, name="analysis-stream", daemon=True).start()
+        while True:
+            item = events.get()
+            if item is done:
+                return
+            if item[0] == "error":
+                raise item[2]
+            yield item
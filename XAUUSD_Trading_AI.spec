@@ -19,6 +19,26 @@ datas = [
     # 主应用文件
     (str(project_root / 'app_openai_zh.py'), '.'),
     (str(project_root / 'XAUSD_AI_openai_zh.py'), '.'),
+    (str(project_root / 'bar_cache.py'), '.'),
+    (str(project_root / 'indicators.py'), '.'),
+    (str(project_root / 'resample.py'), '.'),
+    (str(project_root / 'mt5_gateway.py'), '.'),
+    (str(project_root / 'result_cache.py'), '.'),
+    (str(project_root / 'llm_cache.py'), '.'),
+    (str(project_root / 'signals.py'), '.'),
+    (str(project_root / 'backtest.py'), '.'),
+    (str(project_root / 'tracing.py'), '.'),
+    (str(project_root / 'live_state.py'), '.'),
+    (str(project_root / 'refresh_scheduler.py'), '.'),
+    (str(project_root / 'analysis_worker.py'), '.'),
+    (str(project_root / 'prompt_encoding.py'), '.'),
+    (str(project_root / 'rules.py'), '.'),
+    (str(project_root / 'market_structure.py'), '.'),
+    (str(project_root / 'bar_buffer.py'), '.'),
+    (str(project_root / 'output_check.py'), '.'),
+    (str(project_root / 'history_store.py'), '.'),
+    (str(project_root / 'prewarm.py'), '.'),
+    (str(project_root / 'analysis_server.py'), '.'),
     # 说明文件
     (str(project_root / 'README.txt'), '.'),
     # secrets.toml 模板
@@ -148,7 +168,8 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    # 不用 UPX 压缩：压缩过的 DLL/pyd（numpy、pandas、python3xx.dll 等）每次启动都要解压并被杀毒软件重新扫描，冷启动明显变慢
+    upx=False,
     console=True,  # 保留控制台窗口以显示日志
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -164,7 +185,7 @@ coll = COLLECT(
     a.zipfiles,
     a.datas,
     strip=False,
-    upx=True,
+    upx=False,
     upx_exclude=[],
     name='XAUUSD_AI',
 )
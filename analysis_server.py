@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+"""
+XAUUSD 交易助手 - 无界面分析服务（本地 HTTP/JSON 接口）
+告警、交易日志、其他看板等工具直接读取分析结果，不再各自运行一套 MT5 + GPT 流程：
+- 所有请求共用一个 bot（K线缓存 / 增量指标 / LLM 响应缓存 / 分析历史）和一个有上限的后台分析队列
+- 请求合并：同一品种同时到达的 N 个请求只触发一次计算，全部等待同一个任务
+- 读请求直接返回缓存中已编码好的 JSON，单机每秒可处理数百次
+
+接口：
+  GET  /health                                 服务状态（各品种最近一次分析时间、排队/运行中的任务）
+  GET  /v1/<品种>/analysis[?fields=a,b][&max_age=秒]
+                                               最近一次分析（共享结果缓存 -> 分析历史；都没有或超过 max_age 秒时计算一次并等待）
+  POST /v1/<品种>/refresh[?wait=0]             强制重新分析；wait=0 时立即返回任务 ID（202）
+  GET  /v1/<品种>/snapshot                     当日快照 / 昨日关键位 / 点差 / 时段区间（实时，短时缓存）
+  GET  /v1/<品种>/forecast                     各周期 ATR 预测区间（来自最近一次分析）
+  GET  /v1/<品种>/signals[?n=20]               分析历史中最近 n 条信号摘要
+  GET  /v1/jobs/<任务ID>                       任务状态
+
+用法：python analysis_server.py --port 8502 --symbols XAUUSD --auto-refresh 30
+"""
+
+import argparse
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from analysis_worker import DONE, AnalysisWorker
+from refresh_scheduler import RefreshPolicy, RefreshScheduler
+from result_cache import SharedResultCache
+
+
+class ServiceError(Exception):
+    """带 HTTP 状态码的请求错误"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def encode_json(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, default=str).encode("utf-8")
+
+
+# ===============================
+# 查询参数（在调用分析代码前校验，格式错误返回 400；分析/存储内部的异常返回 500）
+# ===============================
+def query_int(query: dict, name: str, default: int, lo: int, hi: int) -> int:
+    raw = query.get(name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ServiceError(400, f"参数错误：{name} 应为整数")
+    if not lo <= value <= hi:
+        raise ServiceError(400, f"参数错误：{name} 应在 {lo}-{hi} 之间")
+    return value
+
+
+def query_seconds(query: dict, name: str) -> float | None:
+    raw = query.get(name)
+    if raw is None:
+        return None
+    try:
+        value = float(raw)
+    except ValueError:
+        raise ServiceError(400, f"参数错误：{name} 应为秒数")
+    if not math.isfinite(value) or value < 0:
+        raise ServiceError(400, f"参数错误：{name} 应为非负秒数")
+    return value
+
+
+def query_bool(query: dict, name: str, default: bool) -> bool:
+    raw = query.get(name)
+    if raw is None:
+        return default
+    if raw.lower() not in ("0", "1", "false", "true"):
+        raise ServiceError(400, f"参数错误：{name} 应为 0/1/true/false")
+    return raw.lower() in ("1", "true")
+
+
+def query_fields(query: dict) -> tuple[str, ...] | None:
+    fields = tuple(f for f in query.get("fields", "").split(",") if f)
+    bad = [f for f in fields if not f.isidentifier()]
+    if bad:
+        raise ServiceError(400, f"参数错误：无效的字段名 {', '.join(bad)}")
+    return fields or None
+
+
+class AnalysisService:
+    def __init__(
+        self,
+        bot,
+        symbols: list[str] | None = None,
+        workers: int = 2,
+        timeout: float = 180.0,
+        result_ttl: float = 1800.0,
+        snapshot_ttl: float = 1.0,
+        auto_refresh: float | None = None,
+        policy: RefreshPolicy | None = None,
+        encoded_entries: int = 256,
+    ):
+        self.bot = bot
+        # 允许的品种；None 表示不限
+        self.symbols = set(symbols) if symbols else None
+        self.timeout = timeout
+        # 实时快照在 snapshot_ttl 秒内复用（同一时刻的大量请求只查询一次 MT5）
+        self.snapshot_ttl = snapshot_ttl
+
+        self.result_cache = SharedResultCache(ttl=result_ttl)
+        self.schedulers: dict[str, RefreshScheduler] = {}
+        self.policy = policy or RefreshPolicy()
+        self.worker = AnalysisWorker(bot, self.result_cache, workers=workers, timeout=timeout, on_result=self._on_result)
+
+        self._lock = threading.Lock()
+        self._stored: dict[str, dict | None] = {}
+        self._snapshots: dict[str, tuple[float, dict]] = {}
+        self._snapshot_locks: dict[str, threading.Lock] = {}
+        # 已编码的响应：(品种, 结果时间, 字段) -> bytes；结果不变时直接返回
+        self._encoded: OrderedDict[tuple, bytes] = OrderedDict()
+        self.encoded_entries = encoded_entries
+
+        # 自动刷新：每 auto_refresh 秒按刷新事件（K线收盘/价格移动/点差恢复）检查一次各品种
+        self._stop = threading.Event()
+        self.auto_refresh = auto_refresh
+        if auto_refresh and self.symbols:
+            threading.Thread(target=self._auto_refresh_loop, name="auto-refresh", daemon=True).start()
+
+    # ===== 分析结果 =====
+    def check_symbol(self, symbol: str):
+        if self.symbols is not None and symbol not in self.symbols:
+            raise ServiceError(404, f"不支持的品种：{symbol}")
+
+    def _scheduler(self, symbol: str) -> RefreshScheduler:
+        with self._lock:
+            if symbol not in self.schedulers:
+                self.schedulers[symbol] = RefreshScheduler(self.bot, symbol, self.policy, self.result_cache)
+            return self.schedulers[symbol]
+
+    def _on_result(self, result: dict):
+        with self._lock:
+            self._stored[result["symbol"]] = result
+        self._scheduler(result["symbol"]).mark_analysed(result)
+
+    def _from_history(self, symbol: str) -> dict | None:
+        # 共享缓存过期后的兜底：本进程最近一次结果，或分析历史中的上一次结果（每个品种只读取一次，同时恢复输入指纹）
+        with self._lock:
+            if symbol not in self._stored:
+                self._stored[symbol] = self.bot.warm_start(symbol)
+            return self._stored[symbol]
+
+    def _wait(self, job_id: str) -> dict:
+        job = self.worker.wait(job_id, self.timeout)
+        if job is None:
+            raise ServiceError(404, f"任务不存在：{job_id}")
+        if not job.finished:
+            raise ServiceError(504, f"任务 {job_id} 超过 {self.timeout:g} 秒未完成")
+        if job.status != DONE:
+            raise ServiceError(502, f"分析未完成（{job.status}）：{job.error or ''}")
+        return job.result
+
+    def latest(self, symbol: str, max_age: float | None = None) -> dict:
+        """最近一次结果；没有或超过 max_age 秒时提交分析（同一品种的并发请求共用一个任务）并等待"""
+        self.check_symbol(symbol)
+        result = self.result_cache.latest(symbol) or self._from_history(symbol)
+        if result is not None and max_age is not None:
+            age = time.time() - datetime.fromisoformat(result["timestamp"]).timestamp()
+            if age > max_age:
+                return self._wait(self.worker.submit(symbol, reuse_unchanged=True, force=True))
+        if result is None:
+            result = self._wait(self.worker.submit(symbol))
+        return result
+
+    def refresh(self, symbol: str, wait: bool = True) -> dict:
+        """强制重新分析；同时到达的强制刷新合并为一次"""
+        self.check_symbol(symbol)
+        job_id = self.worker.submit(symbol, force=True)
+        if not wait:
+            return self.worker.get(job_id).info()
+        return self._wait(job_id)
+
+    def job(self, job_id: str) -> dict:
+        job = self.worker.get(job_id)
+        if job is None:
+            raise ServiceError(404, f"任务不存在：{job_id}")
+        return job.info()
+
+    def forecast(self, symbol: str) -> dict:
+        result = self.latest(symbol)
+        return {
+            "symbol": symbol,
+            "timestamp": result["timestamp"],
+            "ranges": result.get("forecast_ranges"),
+            "text": result["forecast"],
+        }
+
+    def signals(self, symbol: str, n: int = 20) -> list[dict]:
+        self.check_symbol(symbol)
+        if self.bot.history is None:
+            raise ServiceError(404, "未启用分析历史")
+        return self.bot.history.last_signals(symbol, n)
+
+    # ===== 实时快照 =====
+    def snapshot(self, symbol: str) -> dict:
+        self.check_symbol(symbol)
+        entry = self._snapshots.get(symbol)
+        if entry is not None and time.monotonic() - entry[0] < self.snapshot_ttl:
+            return entry[1]
+        with self._lock:
+            lock = self._snapshot_locks.setdefault(symbol, threading.Lock())
+        with lock:
+            # 等锁期间其他请求可能已经查询过
+            entry = self._snapshots.get(symbol)
+            if entry is not None and time.monotonic() - entry[0] < self.snapshot_ttl:
+                return entry[1]
+            try:
+                self.bot.initialize_mt5()
+                lookups = self.bot.get_market_lookups(symbol)
+            except RuntimeError as e:
+                raise ServiceError(503, str(e))
+            value = {"symbol": symbol, "timestamp": datetime.now().isoformat(), **lookups}
+            self._snapshots[symbol] = (time.monotonic(), value)
+            return value
+
+    # ===== 编码缓存 =====
+    def encoded(self, symbol: str, result: dict, fields: tuple[str, ...] | None = None) -> bytes:
+        """分析结果的 JSON（按结果时间与字段缓存编码结果）"""
+        key = (symbol, result["timestamp"], fields)
+        with self._lock:
+            body = self._encoded.get(key)
+            if body is not None:
+                self._encoded.move_to_end(key)
+                return body
+        if fields:
+            result = {k: result[k] for k in ("symbol", "timestamp", *fields) if k in result}
+        body = encode_json(result)
+        with self._lock:
+            self._encoded[key] = body
+            while len(self._encoded) > self.encoded_entries:
+                self._encoded.popitem(last=False)
+        return body
+
+    def status(self) -> dict:
+        return {
+            "status": "ok",
+            "symbols": sorted(self.symbols) if self.symbols else None,
+            "latest": {
+                s: (r["timestamp"] if (r := self.result_cache.latest(s)) is not None else None)
+                for s in (self.symbols or ())
+            },
+            "jobs": [j for j in self.worker.jobs() if j["status"] in ("queued", "running")],
+        }
+
+    # ===== 自动刷新 =====
+    def _auto_refresh_loop(self):
+        while not self._stop.wait(self.auto_refresh):
+            for symbol in sorted(self.symbols):
+                if self.worker.active(symbol) is not None:
+                    continue
+                try:
+                    reasons = self._scheduler(symbol).check()
+                except Exception:
+                    continue
+                if reasons:
+                    self.worker.submit(symbol, reuse_unchanged=True, force=True)
+
+    def close(self):
+        self._stop.set()
+
+
+# 品种接口 -> 请求方法
+ROUTE_METHODS = {"analysis": "GET", "refresh": "POST", "snapshot": "GET", "forecast": "GET", "signals": "GET"}
+
+
+class AnalysisRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 保持连接：轮询客户端不必每次重新建立连接
+    protocol_version = "HTTP/1.1"
+    # 响应头与正文分两次写出，不关闭 Nagle 时每个保持连接的请求都要等约 40ms 的延迟确认
+    disable_nagle_algorithm = True
+    server_version = "XAUUSD-AI"
+    service: AnalysisService = None
+
+    def log_message(self, format, *args):
+        # 每秒数百次读请求时逐条打印会拖慢服务；需要时设置 XAU_SERVER_LOG=1
+        if os.environ.get("XAU_SERVER_LOG"):
+            super().log_message(format, *args)
+
+    def _send(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self, method: str):
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        parts = [p for p in url.path.split("/") if p]
+        svc = self.service
+        try:
+            if method == "GET" and parts == ["health"]:
+                return self._send(200, encode_json(svc.status()))
+            if len(parts) == 3 and parts[:2] == ["v1", "jobs"] and method == "GET":
+                return self._send(200, encode_json(svc.job(parts[2])))
+            if len(parts) != 3 or parts[0] != "v1":
+                raise ServiceError(404, f"未知接口：{url.path}")
+
+            symbol, action = parts[1], parts[2]
+            if action in ROUTE_METHODS and method != ROUTE_METHODS[action]:
+                raise ServiceError(405, f"{url.path} 只支持 {ROUTE_METHODS[action]}")
+            if method == "GET" and action == "analysis":
+                max_age = query_seconds(query, "max_age")
+                fields = query_fields(query)
+                result = svc.latest(symbol, max_age)
+                unknown = [f for f in fields or () if f not in result]
+                if unknown:
+                    raise ServiceError(400, f"参数错误：未知字段 {', '.join(unknown)}")
+                return self._send(200, svc.encoded(symbol, result, fields))
+            if method == "POST" and action == "refresh":
+                wait = query_bool(query, "wait", True)
+                result = svc.refresh(symbol, wait)
+                if not wait:
+                    return self._send(202, encode_json(result))
+                return self._send(200, svc.encoded(symbol, result))
+            if method == "GET" and action == "snapshot":
+                return self._send(200, encode_json(svc.snapshot(symbol)))
+            if method == "GET" and action == "forecast":
+                return self._send(200, encode_json(svc.forecast(symbol)))
+            if method == "GET" and action == "signals":
+                n = query_int(query, "n", 20, 1, 1000)
+                return self._send(200, encode_json(svc.signals(symbol, n)))
+            raise ServiceError(404, f"未知接口：{url.path}")
+        except ServiceError as e:
+            self._send(e.status, encode_json({"error": str(e)}))
+        except Exception as e:
+            self._send(500, encode_json({"error": f"{type(e).__name__}: {e}"}))
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        # 请求体未使用，读掉以便保持连接
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        self._route("POST")
+
+
+def make_server(service: AnalysisService, host: str = "127.0.0.1", port: int = 8502) -> ThreadingHTTPServer:
+    handler = type("BoundAnalysisRequestHandler", (AnalysisRequestHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="XAUUSD 交易助手 - 无界面分析服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址（默认只允许本机访问）")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--symbols", nargs="+", default=["XAUUSD"], help="允许分析的品种")
+    parser.add_argument("--workers", type=int, default=2, help="后台分析线程数（同一品种始终串行）")
+    parser.add_argument("--timeout", type=float, default=180.0, help="单次分析超时（秒）")
+    parser.add_argument("--auto-refresh", type=float, default=None, help="每隔多少秒检查一次刷新事件（不设置则只在请求时分析）")
+    parser.add_argument("--structured-output", action="store_true", help="交易信号/当日行情使用结构化输出")
+    args = parser.parse_args()
+
+    from XAUSD_AI_openai_zh import XAUUSDTradingBot
+
+    bot = XAUUSDTradingBot(api_key=os.environ.get("OPENAI_API_KEY", ""), structured_output=args.structured_output)
+    service = AnalysisService(
+        bot, args.symbols, workers=args.workers, timeout=args.timeout, auto_refresh=args.auto_refresh,
+    )
+    server = make_server(service, args.host, args.port)
+    print(f"分析服务已启动：http://{args.host}:{args.port}（品种：{'、'.join(args.symbols)}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
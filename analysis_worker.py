@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+XAUUSD 交易助手 - 后台分析任务
+页面只提交任务并轮询状态，分析在后台线程中执行，界面不再被 MT5 + 三次 GPT 调用阻塞：
+- submit() 返回任务 ID；相同任务（同品种、同参数）仍在排队或运行时直接返回已有 ID（强制刷新只合并到强制任务上）
+- 任务可取消、有超时；运行中逐段保存 GPT 输出，页面轮询时可显示进度
+- 完成的结果写入共享结果缓存，并回调 on_result（例如通知自动刷新调度器）
+"""
+
+import asyncio
+import itertools
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from result_cache import SharedResultCache
+
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMEOUT = "timeout"
+FINISHED = (DONE, FAILED, CANCELLED, TIMEOUT)
+
+
+class AnalysisJob:
+    def __init__(self, job_id: str, symbol: str, reuse_unchanged: bool, force: bool):
+        self.id = job_id
+        self.symbol = symbol
+        self.reuse_unchanged = reuse_unchanged
+        self.force = force
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.result: dict | None = None
+        self.error: str | None = None
+        self.partial: dict[str, str] = {}     # 字段 -> 已输出的文本
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def key(self) -> tuple:
+        return (self.symbol, self.reuse_unchanged, self.force)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    @property
+    def elapsed(self) -> float:
+        start = self.started_at or self.created_at
+        return (self.finished_at or time.time()) - start
+
+    def info(self) -> dict:
+        return {
+            "id": self.id,
+            "symbol": self.symbol,
+            "status": self.status,
+            "elapsed_sec": round(self.elapsed, 1),
+            "error": self.error,
+        }
+
+
+class AnalysisWorker:
+    """
+    后台分析队列：workers 个线程消费任务；同一品种的任务串行执行（bot 中按品种保存的增量状态不能并发修改）。
+    """
+
+    def __init__(
+        self,
+        bot,
+        result_cache: SharedResultCache | None = None,
+        workers: int = 2,
+        timeout: float = 180.0,
+        on_result=None,
+        keep_jobs: int = 100,
+    ):
+        self.bot = bot
+        self.result_cache = result_cache
+        self.timeout = timeout
+        self.on_result = on_result
+        self.keep_jobs = keep_jobs
+
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._jobs: OrderedDict[str, AnalysisJob] = OrderedDict()
+        self._inflight: dict[tuple, str] = {}
+        self._symbol_locks: dict[str, threading.Lock] = {}
+        self._ids = itertools.count(1)
+        self._threads = [
+            threading.Thread(target=self._run_forever, name=f"analysis-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    # ===== 对外接口 =====
+    def submit(self, symbol: str, reuse_unchanged: bool = False, force: bool = False) -> str:
+        """
+        force=False 时，同一根K线已有结果则任务直接完成；
+        reuse_unchanged=True 时量化输入不变会沿用上次 LLM 结论（自动刷新使用）。
+        合并规则：非强制请求可以使用排队/运行中的强制任务（结果更新）；强制请求不使用非强制任务（可能直接返回缓存）。
+        """
+        keys = [(symbol, reuse_unchanged, True)] if force else [(symbol, reuse_unchanged, False), (symbol, reuse_unchanged, True)]
+        with self._lock:
+            for key in keys:
+                existing = self._inflight.get(key)
+                if existing is not None:
+                    return existing
+            job = AnalysisJob(f"job-{next(self._ids)}", symbol, reuse_unchanged, force)
+            self._jobs[job.id] = job
+            self._inflight[job.key] = job.id
+            self._trim()
+        self._queue.put(job)
+        return job.id
+
+    def get(self, job_id: str) -> AnalysisJob | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id: str, timeout: float | None = None) -> AnalysisJob | None:
+        """等待任务结束（多个调用方可同时等待同一任务）；超时仍未结束时返回的任务 finished 为 False"""
+        job = self.get(job_id)
+        if job is not None:
+            job._done.wait(timeout)
+        return job
+
+    def active(self, symbol: str) -> AnalysisJob | None:
+        """该品种正在排队或运行的任务（最新的一个）"""
+        with self._lock:
+            for job in reversed(self._jobs.values()):
+                if job.symbol == symbol and not job.finished:
+                    return job
+        return None
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        job._cancel.set()
+        loop, task = job._loop, job._task
+        if loop is not None and task is not None:
+            loop.call_soon_threadsafe(task.cancel)
+        return True
+
+    def jobs(self) -> list[dict]:
+        with self._lock:
+            return [job.info() for job in self._jobs.values()]
+
+    # ===== 内部 =====
+    def _trim(self):
+        # 只保留最近 keep_jobs 个已结束的任务
+        finished = [jid for jid, job in self._jobs.items() if job.finished]
+        for jid in finished[:max(0, len(finished) - self.keep_jobs)]:
+            del self._jobs[jid]
+
+    def _finish(self, job: AnalysisJob, status: str, result: dict | None = None, error: str | None = None):
+        with self._lock:
+            job.status = status
+            job.result = result
+            job.error = error
+            job.finished_at = time.time()
+            if self._inflight.get(job.key) == job.id:
+                del self._inflight[job.key]
+        job._done.set()
+
+    def _symbol_lock(self, symbol: str) -> threading.Lock:
+        with self._lock:
+            return self._symbol_locks.setdefault(symbol, threading.Lock())
+
+    def _run_forever(self):
+        while True:
+            job = self._queue.get()
+            if job._cancel.is_set():
+                self._finish(job, CANCELLED)
+                continue
+            with self._symbol_lock(job.symbol):
+                self._run(job)
+
+    def _run(self, job: AnalysisJob):
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            bar_time = self.bot.last_closed_bar_time(job.symbol)
+            cached = None
+            if self.result_cache is not None and not job.force:
+                cached = self.result_cache.get(job.symbol, bar_time)
+            result = cached if cached is not None else asyncio.run(self._arun(job))
+        except asyncio.CancelledError:
+            self._finish(job, CANCELLED)
+            return
+        except asyncio.TimeoutError:
+            self._finish(job, TIMEOUT, error=f"超过 {self.timeout:g} 秒未完成")
+            return
+        except Exception as e:
+            self._finish(job, FAILED, error=f"{type(e).__name__}: {e}")
+            return
+
+        if self.result_cache is not None and cached is None:
+            self.result_cache.put(job.symbol, bar_time, result)
+        self._finish(job, DONE, result=result)
+        # 每次进入 DONE 都回调（含结果缓存命中），调度器据此更新锚点
+        if self.on_result is not None:
+            self.on_result(result)
+
+    async def _arun(self, job: AnalysisJob) -> dict:
+        def on_token(field: str, text: str):
+            job.partial[field] = job.partial.get(field, "") + text
+
+        job._loop = asyncio.get_running_loop()
+        job._task = asyncio.current_task()
+        if job._cancel.is_set():
+            raise asyncio.CancelledError()
+        return await asyncio.wait_for(
+            self.bot.arun_analysis(job.symbol, on_token=on_token, reuse_unchanged=job.reuse_unchanged),
+            timeout=self.timeout,
+        )
@@ -1,9 +1,16 @@
 import streamlit as st
 from datetime import datetime
-import time
 import os
 
-from XAUSD_AI_openai_zh import XAUUSDTradingBot
+# 这里只导入轻量模块：分析模块（pandas/langchain/openai/MetaTrader5）在后台任务首次需要 bot 时才导入（启动器会提前预热），页面先渲染
+import prewarm
+from analysis_worker import DONE, QUEUED, AnalysisWorker
+from history_store import AnalysisHistory
+from refresh_scheduler import RefreshPolicy, RefreshScheduler
+from result_cache import SharedResultCache
+from tracing import stage_summary, token_totals
+
+SYMBOL = "XAUUSD"
 
 # 必须最先调用
 st.set_page_config(page_title="XAUUSD 交易助手", page_icon="📈", layout="wide")
@@ -55,7 +62,57 @@ if not api_key:
     """)
     st.stop()
 
-bot = XAUUSDTradingBot(api_key=api_key)
+@st.cache_resource(show_spinner=False)
+def get_bot(api_key: str) -> prewarm.BotHandle:
+    """
+    进程内共享一个 bot（LLM 客户端和三条链只创建一次）；交易信号/当日行情使用结构化输出（prewarm.BOT_OPTIONS），界面按字段展示。
+    返回句柄：页面渲染不访问 bot，后台任务/自动刷新首次访问时才创建（由启动器启动时已在后台预热）。
+    """
+    return prewarm.BotHandle(api_key)
+
+
+@st.cache_resource
+def get_history() -> AnalysisHistory:
+    """只读打开分析历史（与 bot 写入的是同一个 SQLite 文件，WAL 模式下互不阻塞）"""
+    return AnalysisHistory(prewarm.HISTORY_PATH)
+
+
+@st.cache_resource
+def get_result_cache() -> SharedResultCache:
+    """所有浏览器会话共享的分析结果缓存（30分钟过期）"""
+    return SharedResultCache(ttl=1800)
+
+
+@st.cache_resource
+def get_scheduler(symbol: str) -> RefreshScheduler:
+    """自动刷新调度器（各会话共享；M5/M15/H1 收盘、价格移动 0.5×M15 ATR、点差恢复时触发；没有参照值时先用共享结果缓存）"""
+    return RefreshScheduler(get_bot(api_key), symbol, RefreshPolicy(), get_result_cache())
+
+
+@st.cache_resource
+def get_worker() -> AnalysisWorker:
+    """后台分析队列（各会话共享；完成的结果写入共享缓存并通知调度器）"""
+    return AnalysisWorker(get_bot(api_key), get_result_cache(), on_result=get_scheduler(SYMBOL).mark_analysed)
+
+
+bot = get_bot(api_key)
+history = get_history()
+result_cache = get_result_cache()
+scheduler = get_scheduler(SYMBOL)
+worker = get_worker()
+
+
+# (结果字段, 标签名, 标题)
+TAB_LAYOUT = [
+    ("daily_brief", "🗓 今日行情", "🗓 当天行情分析（包含技术面结论）"),
+    ("trading_signal", "🎯 入场点位", "🎯 交易信号（入场/止损/止盈）"),
+    ("technical_features", "📊 技术分析", "📊 多周期技术分析（结构/支撑阻力/供需/指标）"),
+    ("forecast", "📈 预测区间", "📈 预测区间（系统基于ATR计算）"),
+    ("market_data", "📊 多周期数据", "📊 各周期最近10根K线（含RSI/EMA/ATR）"),
+]
+STREAM_FIELDS = ("daily_brief", "trading_signal", "technical_features")
+# 结果字段 -> 链名（输出校验结论按链名保存）
+FIELD_CHAINS = {"technical_features": "feature", "trading_signal": "trading", "daily_brief": "daily"}
 
 
 def display_market_data(data_str, timeframe):
@@ -65,104 +122,292 @@ def display_market_data(data_str, timeframe):
                 st.text(line)
 
 
+def _price(v) -> str:
+    return "—" if v is None else f"{v:g}"
+
+
+def display_signal_fields(data: dict):
+    """结构化交易信号：方向/入场/止损/止盈/置信度直接按字段展示"""
+    cols = st.columns(5)
+    cols[0].metric("信号", data["signal"])
+    entry = "—" if data["entry_low"] is None else f"{_price(data['entry_low'])} ~ {_price(data['entry_high'])}"
+    cols[1].metric("入场区间", entry)
+    cols[2].metric("止损", _price(data["sl"]))
+    cols[3].metric("止盈 TP1/TP2/TP3", " / ".join(_price(data[k]) for k in ("tp1", "tp2", "tp3") if data[k] is not None) or "—")
+    cols[4].metric("置信度", data["confidence"])
+
+
+def display_plan_fields(data: dict):
+    """结构化当日行情：关键价位与各套交易计划以表格展示"""
+    cols = st.columns(2)
+    cols[0].metric("关键阻力", "、".join(_price(v) for v in data["resistance"]) or "—")
+    cols[1].metric("关键支撑", "、".join(_price(v) for v in data["support"]) or "—")
+    st.table([
+        {
+            "方案": p["name"], "方向": p["direction"],
+            "入场": "—" if p["entry_low"] is None else f"{_price(p['entry_low'])} ~ {_price(p['entry_high'])}",
+            "止损": _price(p["sl"]), "止盈1": _price(p["tp1"]), "止盈2": _price(p["tp2"]),
+        }
+        for p in data["plans"]
+    ])
+
+
+def create_tabs() -> dict:
+    """创建各标签页，返回 {结果字段: 内容容器}"""
+    tabs = st.tabs([label for _, label, _ in TAB_LAYOUT])
+    containers = {}
+    for (field, _, title), tab in zip(TAB_LAYOUT, tabs):
+        with tab:
+            st.subheader(title)
+            containers[field] = st.container()
+    return containers
+
+
+def render_field(result: dict, field: str):
+    """三条 LLM 链之一的最终结果：校验提示 + 结构化字段 + 文本"""
+    check = (result.get("validation") or {}).get(FIELD_CHAINS[field])
+    if check is not None and not check["ok"]:
+        st.warning("⚠️ 输出未通过本地校验（已重试 {} 次）：{}".format(check["retries"], "；".join(check["issues"])))
+    structured = {"trading_signal": display_signal_fields, "daily_brief": display_plan_fields}
+    if field in structured and result.get(f"{field}_data"):
+        structured[field](result[f"{field}_data"])
+    st.markdown(result.get(field, "暂无"))
+
+
+@st.fragment(run_every=0.5)
+def streaming_field(job_id: str, field: str, previous: dict | None):
+    """任务进行中：标签页内直接显示 GPT 已输出的内容（结构化输出按已完整的字段渲染）；尚无输出时显示上一次结果"""
+    job = worker.get(job_id)
+    text = job.partial.get(field) if job is not None else None
+    if not text:
+        st.caption("⏳ 等待 GPT 输出…" + ("（下方为上一次结果）" if previous else ""))
+        if previous:
+            render_field(previous, field)
+        return
+    name = FIELD_CHAINS[field]
+    if text.lstrip().startswith(("{", "```")):
+        from output_check import RENDERERS, partial_json_fields, render_partial
+
+        if name in RENDERERS:
+            text = render_partial(name, partial_json_fields(text))
+    st.markdown(text + " ▌")
+
+
+def render_result_tabs(result: dict | None, job_id: str | None = None):
+    """结果标签页；有进行中的任务时，三条 LLM 链的标签页实时显示流式输出"""
+    containers = create_tabs()
+    pre = (result or {}).get("prescreen")
+    if pre is not None and not pre["passed"] and job_id is None:
+        containers["trading_signal"].caption("⚡ 本地规则预检未通过（" + "；".join(pre["reasons"]) + "），本次未调用 GPT")
+    for field in STREAM_FIELDS:
+        with containers[field]:
+            if job_id is not None:
+                streaming_field(job_id, field, result)
+            elif result is not None:
+                render_field(result, field)
+    if result is None:
+        return
+    containers["forecast"].code(result.get("forecast", "暂无"))
+    with containers["market_data"]:
+        if result.get("structure_levels"):
+            with st.expander("🧱 市场结构（摆动/结构突破/缺口/订单块）", expanded=True):
+                st.code(result["structure_levels"])
+        cols = st.columns(2)
+        for idx, (tf, data) in enumerate(result.get("market_data", {}).items()):
+            with cols[idx % 2]:
+                display_market_data(data, tf)
+
+
+def render_trace_panel(trace: dict):
+    """侧边栏：本次分析的耗时分解（顶层阶段 + 三条 LLM 链的 token）"""
+    total = trace.get("total_ms") or 0.0
+    with st.expander(f"⏱ 耗时分解（共 {total / 1000:.1f} 秒）", expanded=False):
+        for row in stage_summary(trace):
+            share = min(row["ms"] / total, 1.0) if total else 0.0
+            st.progress(share, text=f"{row['stage']}：{row['ms']:.0f} ms")
+        for sp in trace.get("spans", []):
+            if sp["name"].startswith("llm."):
+                a = sp["attrs"]
+                if a.get("skipped") == "prescreen":
+                    note = "本地规则预检未通过，未调用"
+                elif a.get("skipped"):
+                    note = "输入未变，沿用上次结论"
+                elif a.get("cache_hit"):
+                    note = "缓存命中"
+                elif sp["name"].endswith(".retry"):
+                    note = f"输出未通过校验，第 {a.get('attempt')} 次重试，{a.get('prompt_tokens') or '-'} → {a.get('completion_tokens') or '-'} tokens"
+                else:
+                    note = f"{a.get('prompt_tokens') or '-'} → {a.get('completion_tokens') or '-'} tokens"
+                st.caption(f"{sp['name']}：{sp['duration_ms']:.0f} ms，{note}")
+        tokens = token_totals(trace)
+        st.caption(f"合计 token：输入 {tokens['prompt_tokens']} / 输出 {tokens['completion_tokens']}")
+
+
+def adopt_result(result: dict, from_history: bool = False):
+    st.session_state["analysis_result"] = result
+    st.session_state["last_update"] = datetime.fromisoformat(result["timestamp"])
+    st.session_state["from_history"] = from_history
+
+
+def render_history_panel(n: int = 20):
+    """侧边栏：分析历史中最近 n 条信号（只读摘要列）"""
+    rows = history.last_signals(SYMBOL, n)
+    if not rows:
+        return
+    with st.expander(f"📜 最近 {len(rows)} 次分析", expanded=False):
+        st.dataframe(
+            [
+                {
+                    "时间": datetime.fromtimestamp(r["ts"]).strftime("%m-%d %H:%M"),
+                    "信号": r["signal"] or "—",
+                    "入场": "—" if r["entry_low"] is None else f"{r['entry_low']:g} ~ {r['entry_high']:g}",
+                    "止损": r["sl"],
+                    "TP1": r["tp1"],
+                    "置信度": r["confidence"],
+                    "价格": r["price"],
+                }
+                for r in rows
+            ],
+            hide_index=True,
+        )
+
+
+@st.fragment(run_every=1)
+def job_progress_panel(job_id: str):
+    """后台任务状态（每秒轮询）：已用时间与取消按钮（流式内容直接显示在各标签页中）；完成后整页刷新显示新结果"""
+    job = worker.get(job_id)
+    if job is None or job.finished:
+        st.session_state.pop("job_id", None)
+        if job is not None and job.status == DONE:
+            adopt_result(job.result)
+        elif job is not None:
+            st.session_state["job_error"] = f"分析未完成（{job.status}）：{job.error or ''}"
+        st.rerun()
+
+    state = "排队中" if job.status == QUEUED else "分析中（拉取MT5数据 + GPT逐段输出）"
+    col1, col2 = st.columns([4, 1])
+    col1.info(f"⏳ {state}，已用 {job.elapsed:.0f} 秒；GPT 输出实时显示在下方各标签页中")
+    if col2.button("⏹ 取消分析"):
+        worker.cancel(job_id)
+
+
+@st.fragment(run_every=30)
+def auto_refresh_watch():
+    """每 30 秒检查一次刷新事件；触发时提交后台分析任务（量化输入不变则不调用 GPT）"""
+    # 其他会话已产生更新的结果：直接采用
+    shared = result_cache.latest(SYMBOL)
+    current = st.session_state.get("analysis_result")
+    if shared is not None and (current is None or shared["timestamp"] > current["timestamp"]):
+        adopt_result(shared)
+        st.rerun()
+
+    # 已有任务在运行：等它完成
+    if "job_id" in st.session_state or worker.active(SYMBOL) is not None:
+        return
+
+    # 检查刷新事件需要 bot（查询 MT5）：仍在加载时先在后台预热，下次检查再判断
+    if not bot.ready:
+        bot.warm_up()
+        st.caption("自动刷新：分析引擎加载中…")
+        return
+
+    reasons = scheduler.check()
+    if reasons:
+        st.session_state["job_id"] = worker.submit(SYMBOL, reuse_unchanged=True, force=True)
+        st.rerun()
+
+    st.caption(f"自动刷新：已于 {datetime.now().strftime('%H:%M:%S')} 检查，无触发事件")
+    if scheduler.last_reasons:
+        st.caption(f"上次触发：{'、'.join(scheduler.last_reasons)}")
+
+
 def main():
     with st.sidebar:
         st.header("🎛 控制面板")
-        auto_refresh = st.toggle("🔄 自动刷新（30分钟）", value=False)
-
-        if st.button("🚀 运行新分析"):
-            with st.spinner("分析中（拉取MT5数据 + GPT生成报告）..."):
-                st.session_state["analysis_result"] = bot.run_analysis(symbol="XAUUSD")
-                st.session_state["last_update"] = datetime.now()
-
-        if "analysis_result" in st.session_state:
+        auto_refresh = st.toggle("🔄 自动刷新（K线收盘/价格波动触发）", value=False, key="auto_refresh_toggle")
+
+        run_clicked = st.button("🚀 运行新分析")
+
+        # 新会话直接显示其他会话已完成的最新结果；没有时显示分析历史中的上一次结果，并在后台开始新的分析
+        if "analysis_result" not in st.session_state:
+            shared = result_cache.latest(SYMBOL)
+            if shared is not None:
+                adopt_result(shared)
+            else:
+                # 只读历史库，不需要 bot；输入指纹由 bot 创建时的 warm_start 恢复
+                stored = history.latest(SYMBOL)
+                if stored is not None:
+                    adopt_result(stored, from_history=True)
+                    if worker.active(SYMBOL) is None:
+                        st.session_state["job_id"] = worker.submit(SYMBOL, reuse_unchanged=True)
+
+        # 实时行情：每次页面刷新只拉取新 tick（无 tick 或 bot 尚未加载时退回到上次分析结果中的点差）
+        feed = bot.refresh_live(SYMBOL) if bot.ready else None
+        if feed is not None:
+            snap = feed.state.snapshot()
+            live = feed.state.summary()
+            if snap:
+                st.metric("当前价格", f"{snap['last']}", f"{snap['change_pct']}%")
+            if live["spread"]:
+                sp = live["spread"]
+                st.metric("当前点差", f"{sp['last']:.0f} points", help=f"最近 {sp['count']} 笔：均值 {sp['mean']} / 最小 {sp['min']} / 最大 {sp['max']}")
+            if live["session"]:
+                ss = live["session"]
+                st.caption(f"{ss['name']}时段区间：{ss['low']} - {ss['high']}（{ss['range']}）")
+        elif "analysis_result" in st.session_state:
             r = st.session_state["analysis_result"]
             if r.get("current_spread") is not None:
                 st.metric("当前点差", f"{r['current_spread']} points")
 
         if "last_update" in st.session_state:
             st.info(f"最后更新时间：{st.session_state['last_update'].strftime('%Y-%m-%d %H:%M:%S')}")
-
-    if "analysis_result" not in st.session_state:
+            if st.session_state.get("from_history"):
+                st.caption("当前显示的是历史记录中的上一次结果")
+
+        render_history_panel()
+
+        if "analysis_result" in st.session_state and st.session_state["analysis_result"].get("trace"):
+            render_trace_panel(st.session_state["analysis_result"]["trace"])
+
+    # 分析在后台线程执行：提交任务后页面立即返回，由进度面板轮询
+    if run_clicked:
+        st.session_state["job_id"] = worker.submit(SYMBOL, force=True)
+    elif "job_id" not in st.session_state:
+        # 其他会话（或自动刷新）提交的任务正在运行：一起显示进度
+        active = worker.active(SYMBOL)
+        if active is not None:
+            st.session_state["job_id"] = active.id
+
+    if "job_error" in st.session_state:
+        st.error(st.session_state.pop("job_error"))
+    if "job_id" in st.session_state:
+        job_progress_panel(st.session_state["job_id"])
+
+    # 自动刷新：按事件触发（见 refresh_scheduler），不再固定 30 分钟重跑
+    if auto_refresh:
+        with st.sidebar:
+            auto_refresh_watch()
+
+    job_id = st.session_state.get("job_id")
+    result = st.session_state.get("analysis_result")
+    if result is None and job_id is None:
         st.warning("⚠️ 还没有分析结果，请点击左侧「运行新分析」。")
         return
 
-    result = st.session_state["analysis_result"]
-
     # 顶部：今日快照（真实数据）
-    snap = result.get("today_snapshot")
+    snap = (result or {}).get("today_snapshot")
     if snap:
         direction = "上涨" if snap["change_pct"] >= 0 else "下跌"
         st.markdown(
             f"**当前价格：{snap['last']} 美元/盎司，{direction}{abs(snap['change_pct'])}%**  \n"
             f"**今日开盘：{snap['open']}  | 今日最高：{snap['high']}  | 今日最低：{snap['low']}  | 今日振幅：{snap['range']}**"
         )
-    else:
+    elif result is not None:
         st.warning("未获取到今日快照数据（请确认 MT5 已登录且 XAUUSD 可用）")
 
-    tab0, tab1, tab2, tab3, tab4 = st.tabs(["🗓 今日行情", "🎯 入场点位", "📊 技术分析", "📈 预测区间", "📊 多周期数据"])
-
-    with tab0:
-        st.subheader("🗓 当天行情分析（包含技术面结论）")
-        st.markdown(result.get("daily_brief", "暂无"))
-
-    with tab1:
-        st.subheader("🎯 交易信号（入场/止损/止盈）")
-        st.markdown(result.get("trading_signal", "暂无"))
-
-    with tab2:
-        st.subheader("📊 多周期技术分析（结构/支撑阻力/供需/指标）")
-        st.markdown(result.get("technical_features", "暂无"))
-
-    with tab3:
-        st.subheader("📈 预测区间（系统基于ATR计算）")
-        st.code(result.get("forecast", "暂无"))
-
-    with tab4:
-        st.subheader("📊 各周期最近10根K线（含RSI/EMA/ATR）")
-        cols = st.columns(2)
-        for idx, (tf, data) in enumerate(result.get("market_data", {}).items()):
-            with cols[idx % 2]:
-                display_market_data(data, tf)
-
-    # 自动刷新
-    with st.sidebar:
-        auto_refresh = st.session_state.get("auto_refresh_state", False)
-
-    # 让 toggle 状态可持久化（避免切tab丢）
-    # 如果你不需要可以删
-    # （这里不强制）
-    # auto_refresh 只在 sidebar 中有效，所以我们简单重取一次即可
-
-    # 若开启自动刷新：30分钟 rerun
-    if st.sidebar and st.session_state.get("analysis_result") is not None:
-        # 重新读取 toggle（Streamlit 每次都会重新执行脚本）
-        # 保持跟 sidebar 一致
-        pass
-
-    # 这里沿用最简单的：如果用户开启 Auto Refresh，就显示倒计时并到点刷新
-    with st.sidebar:
-        auto_refresh = st.toggle("🔄 自动刷新（30分钟）", value=False, key="auto_refresh_toggle")
-
-        if auto_refresh:
-            current_time = datetime.now()
-            if "last_refresh" not in st.session_state:
-                st.session_state["last_refresh"] = current_time
-
-            time_diff = (current_time - st.session_state["last_refresh"]).total_seconds()
-            remaining_time = 1800 - time_diff
-
-            if remaining_time > 0:
-                progress = (1800 - remaining_time) / 1800
-                mins = int(remaining_time // 60)
-                secs = int(remaining_time % 60)
-                st.progress(progress, text=f"下次刷新：{mins:02d}:{secs:02d}")
-
-            if time_diff >= 1800:
-                st.session_state["last_refresh"] = current_time
-                time.sleep(1)
-                st.rerun()
+    render_result_tabs(result, job_id)
 
 
 if __name__ == "__main__":
     main()
+    prewarm.mark_interactive()
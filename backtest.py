@@ -0,0 +1,583 @@
+# -*- coding: utf-8 -*-
+"""
+XAUUSD 交易助手 - 历史回放回测
+按基础周期（M5）逐根回放本地K线，在每个时间点重建 run_analysis 当时能看到的输入（不含未来数据）：
+已收盘的高周期K线 + 由基础K线累计出的“未收盘”当前K线及其指标。
+通过可替换的后端调用三条链（真实模型 / 只读缓存 / 确定性本地桩），解析信号并用后续K线模拟成交。
+
+只读取本地 M5 缓存：应用只缓存最近 history_days（默认 120）天，更长的区间需先经 MT5 回补（--backfill）。
+
+用法：python backtest.py --symbol XAUUSD --days 365 --backend stub --backfill
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from bar_cache import BarCache
+from indicators import ATR_PERIOD, EMA_SPANS, RSI_PERIOD, compute_indicators, ema_alpha
+from market_structure import StructureEngine, bar_arrays, format_structure_levels
+from mt5_gateway import get_gateway
+from resample import TF_SECONDS, resample_ohlc
+from rules import TradingRules, format_rule_facts, screen, verdict
+from signals import is_actionable, parse_trading_signal
+from XAUSD_AI_openai_zh import (
+    BAR_LINE_TEMPLATE,
+    K_MAP,
+    TIMEFRAME_NAMES,
+    XAUUSDTradingBot,
+    _content,
+    format_bar_lines,
+    format_daily_inputs,
+    format_forecast_text,
+    format_state_line,
+    mt5,
+)
+from llm_cache import CachedChain
+
+
+# ===============================
+# 后端
+# ===============================
+class ChainBackend:
+    """直接调用 bot 的三条链（真实模型；若 bot 开启了 LLM 缓存，则命中缓存时不付费）"""
+
+    name = "model"
+
+    def __init__(self, bot: XAUUSDTradingBot):
+        self.bot = bot
+
+    def invoke(self, chain: str, inputs: dict, context: dict) -> str:
+        return self.bot.display_text(chain, _content(getattr(self.bot, f"{chain}_chain").invoke(inputs)))
+
+
+class CacheOnlyBackend:
+    """只读取 LLM 响应缓存中已有的回答，未命中时交给 fallback（默认本地桩），从不调用付费接口"""
+
+    name = "cache"
+
+    def __init__(self, bot: XAUUSDTradingBot, fallback=None):
+        self.bot = bot
+        self.fallback = fallback or StubBackend()
+
+    def invoke(self, chain: str, inputs: dict, context: dict) -> str:
+        c = getattr(self.bot, f"{chain}_chain")
+        if isinstance(c, CachedChain):
+            content = c.cache.get(c.name, c.key(inputs))
+            if content is not None:
+                return self.bot.display_text(chain, content)
+        return self.fallback.invoke(chain, inputs, context)
+
+
+class StubBackend:
+    """
+    确定性本地桩：按各周期 收盘/EMA20/EMA50 排列判断方向，
+    至少 min_agree 个周期同向时给出信号（止损 1.5×ATR，TP1/TP2 为 2R/3R），输出格式与 TRADING_PROMPT 一致。
+    """
+
+    name = "stub"
+
+    def __init__(self, min_agree: int = 4, entry_atr: float = 0.2, sl_atr: float = 1.5):
+        self.min_agree = min_agree
+        self.entry_atr = entry_atr
+        self.sl_atr = sl_atr
+
+    def invoke(self, chain: str, inputs: dict, context: dict) -> str:
+        up, down = context["trend_up"], context["trend_down"]
+        if chain == "feature":
+            return f"技术面（本地桩）：多头排列周期 {up} 个，空头排列周期 {down} 个。"
+        if chain == "daily":
+            return f"当日行情（本地桩）：当前价格 {context['close']:.2f}。"
+
+        close, atr = context["close"], context["atr_exec"]
+        if not (atr > 0) or max(up, down) < self.min_agree:
+            return f"交易信号：不交易\n理由（要点列表）：\n- 趋势一致性不足（多 {up} / 空 {down}）"
+        side = 1 if up >= down else -1
+        risk = self.sl_atr * atr
+        lo, hi = sorted((close - side * self.entry_atr * atr, close))
+        sl = close - side * risk
+        return (
+            f"交易信号：{'买入' if side > 0 else '卖出'}\n"
+            f"理由（要点列表）：\n- 多周期同向：{max(up, down)}/{len(TIMEFRAME_NAMES)}\n"
+            f"入场区间：{lo:.2f} ~ {hi:.2f}\n"
+            f"止损SL：{sl:.2f}\n"
+            f"止盈TP1：{close + side * 2 * risk:.2f}\n"
+            f"止盈TP2：{close + side * 3 * risk:.2f}\n"
+            f"置信度：{50 + 10 * (max(up, down) - self.min_agree)}"
+        )
+
+
+# ===============================
+# 单周期回放数据
+# ===============================
+def _seq_sum_before(values: np.ndarray, count: int) -> np.ndarray:
+    """out[g] = values[g-count] + ... + values[g-1]（按时间顺序逐项相加，与增量指标引擎一致）；不足 count 项为 nan"""
+    n = len(values)
+    out = np.full(n + 1, np.nan)
+    if n >= count:
+        acc = values[0:n - count + 1].copy()
+        for j in range(1, count):
+            acc += values[j:n - count + 1 + j]
+        out[count:] = acc
+    return out
+
+
+class _TimeframeReplay:
+    """
+    某个周期在每根基础K线时刻的状态：
+    - g[i]：基础K线 i 所在的该周期K线序号（该K线未收盘，序号更小的均已收盘）
+    - run_*[i]：该周期当前K线截至基础K线 i 的累计 O/H/L/C
+    - 当前K线的指标由“已收盘状态 + 当前价格”一步算出，与 IndicatorEngine 对未收盘K线的计算相同
+    """
+
+    def __init__(self, base: pd.DataFrame, base_secs: np.ndarray, tf_name: str, is_base: bool):
+        self.tf_name = tf_name
+        secs = TF_SECONDS[tf_name]
+        n = len(base_secs)
+
+        if is_base:
+            bars = base[["time", "open", "high", "low", "close"]].reset_index(drop=True)
+            g = np.arange(n)
+        else:
+            bars = resample_ohlc(base[["time", "open", "high", "low", "close"]], tf_name)
+            bucket = base_secs - base_secs % secs
+            starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+            g = np.searchsorted(starts, np.arange(n), side="right") - 1
+        self.g = g
+
+        c_close = bars["close"].to_numpy(dtype=np.float64)
+        c_high = bars["high"].to_numpy(dtype=np.float64)
+        c_low = bars["low"].to_numpy(dtype=np.float64)
+        ind = compute_indicators(c_close, c_high, c_low)
+        bars = bars.assign(**ind)
+        self.closed_lines = format_bar_lines(bars)
+        self.bar_time_str = bars["time"].dt.strftime("%Y-%m-%d %H:%M:%S").to_numpy()
+        self.c_high, self.c_low, self.c_close = c_high, c_low, c_close
+        # 已收盘K线数组（市场结构按 g[i] 之前的已收盘部分增量识别）
+        self.structure_bars = bar_arrays(bars)
+
+        # 当前（未收盘）K线的累计值
+        b_open = base["open"].to_numpy(dtype=np.float64)
+        b_high = base["high"].to_numpy(dtype=np.float64)
+        b_low = base["low"].to_numpy(dtype=np.float64)
+        self.run_close = base["close"].to_numpy(dtype=np.float64)
+        if is_base:
+            self.run_open, self.run_high, self.run_low = b_open, b_high, b_low
+        else:
+            self.run_open = bars["open"].to_numpy(dtype=np.float64)[g]
+            self.run_high = pd.Series(b_high).groupby(g).cummax().to_numpy()
+            self.run_low = pd.Series(b_low).groupby(g).cummin().to_numpy()
+
+        # 前一根已收盘K线的值（g == 0 时为 nan）
+        has_prev = g >= 1
+        prev_idx = np.where(has_prev, g - 1, 0)
+
+        def prev(arr):
+            return np.where(has_prev, arr[prev_idx], np.nan)
+
+        prev_close = prev(c_close)
+        x = self.run_close
+        self.emas = {}
+        for span in EMA_SPANS:
+            p = prev(ind[f"ema_{span}"])
+            alpha = ema_alpha(span)
+            old_wt = 1.0 - alpha
+            v = (old_wt * p + alpha * x) / (old_wt + alpha)
+            v = np.where(p == x, p, v)
+            self.emas[span] = np.where(np.isnan(p), x, v)
+
+        # RSI：前 13 根已收盘的涨跌幅 + 当前K线涨跌幅
+        c_delta = np.full(len(c_close), np.nan)
+        c_delta[1:] = c_close[1:] - c_close[:-1]
+        c_gain = np.where(c_delta > 0, c_delta, 0.0)
+        c_loss = np.where(c_delta < 0, -c_delta, 0.0)
+        if len(c_close):
+            c_gain[0] = c_loss[0] = np.nan
+        d = x - prev_close
+        gain = np.where(d > 0, d, 0.0)
+        loss = np.where(d < 0, -d, 0.0)
+        gain[~has_prev] = np.nan
+        loss[~has_prev] = np.nan
+        mg = (_seq_sum_before(c_gain, RSI_PERIOD - 1)[g] + gain) / RSI_PERIOD
+        ml = (_seq_sum_before(c_loss, RSI_PERIOD - 1)[g] + loss) / RSI_PERIOD
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rsi = 100.0 - (100.0 / (1.0 + mg / ml))
+        rsi[(ml == 0.0) & (mg > 0.0)] = 100.0
+        self.rsi = rsi
+
+        # ATR：前 13 根已收盘的 TR + 当前K线 TR
+        c_prev_close = np.r_[np.nan, c_close[:-1]] if len(c_close) else c_close
+        c_tr = np.maximum(np.maximum(c_high - c_low, np.abs(c_high - c_prev_close)), np.abs(c_low - c_prev_close))
+        if len(c_tr):
+            c_tr[0] = c_high[0] - c_low[0]
+        tr = np.maximum(np.maximum(self.run_high - self.run_low, np.abs(self.run_high - prev_close)), np.abs(self.run_low - prev_close))
+        tr = np.where(has_prev, tr, self.run_high - self.run_low)
+        self.atr = (_seq_sum_before(c_tr, ATR_PERIOD - 1)[g] + tr) / ATR_PERIOD
+
+        # 最近 80 根（79 根已收盘 + 当前）的最高/最低，用于 H1 摆动
+        self.swing_high = np.fmax(prev(pd.Series(c_high).rolling(79, min_periods=1).max().to_numpy()), self.run_high)
+        self.swing_low = np.fmin(prev(pd.Series(c_low).rolling(79, min_periods=1).min().to_numpy()), self.run_low)
+
+    def block(self, i: int, n: int = 10) -> str:
+        """与 prepare_data_string 相同格式的最近 n 根K线文本"""
+        g = self.g[i]
+        lines = [f"最近{n}根 {self.tf_name} K线（含指标）："]
+        lines.extend(self.closed_lines[max(0, g - (n - 1)):g])
+        vals = (
+            self.run_open[i], self.run_high[i], self.run_low[i], self.run_close[i],
+            self.rsi[i], self.emas[20][i], self.emas[50][i], self.emas[200][i], self.atr[i],
+        )
+        lines.append(BAR_LINE_TEMPLATE.format(self.bar_time_str[g], *("%.2f" % v for v in vals)))
+        return "\n".join(lines)
+
+    def state_line(self, i: int) -> str:
+        return format_state_line(
+            self.tf_name, self.run_close[i], self.rsi[i],
+            self.emas[20][i], self.emas[50][i], self.emas[200][i], self.atr[i],
+        )
+
+
+# ===============================
+# 回测引擎
+# ===============================
+class Backtester:
+    """
+    base：基础周期K线（含 time/open/high/low/close，可选 spread），time 为 MT5 服务器时间。
+    backend：ChainBackend / CacheOnlyBackend / StubBackend（需实现 invoke(chain, inputs, context)）。
+    prescreen_rules：与实时分析相同的本地规则预检，未通过的时刻不调用后端，直接记为“不交易”。
+    point：品种最小报价单位，把K线中的点差换算为价格；None 时不检查点差。
+    每 step 根基础K线做一次决策；持仓期间不再决策。
+    """
+
+    def __init__(
+        self,
+        base: pd.DataFrame,
+        backend,
+        base_timeframe: str = "M5",
+        k_map: dict | None = None,
+        step: int = 1,
+        n_bars: int = 10,
+        expiry_bars: int = 12,
+        max_hold_bars: int = 288,
+        include_daily: bool = False,
+        prescreen_rules: bool = True,
+        point: float | None = None,
+    ):
+        self.base = base.reset_index(drop=True)
+        self.backend = backend
+        self.base_timeframe = base_timeframe
+        self.k_map = k_map or dict(K_MAP)
+        self.step = step
+        self.n_bars = n_bars
+        self.expiry_bars = expiry_bars
+        self.max_hold_bars = max_hold_bars
+        self.include_daily = include_daily
+
+        self.secs = self.base["time"].to_numpy(dtype="datetime64[s]").astype(np.int64)
+        self.open = self.base["open"].to_numpy(dtype=np.float64)
+        self.high = self.base["high"].to_numpy(dtype=np.float64)
+        self.low = self.base["low"].to_numpy(dtype=np.float64)
+        self.close = self.base["close"].to_numpy(dtype=np.float64)
+        self.spread = self.base["spread"].to_numpy() if "spread" in self.base else None
+        self.point = point
+
+        self.tfs = {
+            tf_name: _TimeframeReplay(self.base, self.secs, tf_name, is_base=(tf_name == base_timeframe))
+            for tf_name in TIMEFRAME_NAMES
+        }
+
+        # 各周期市场结构：决策时刻按顺序推进，只处理新收盘的K线
+        self.structure = StructureEngine()
+
+        # 整段历史的预检一次算出（形状 (周期数, K线数)）；H1 摆动按 80 根计算，与 TradingRules 默认值一致
+        self.rules = TradingRules() if prescreen_rules else None
+        if self.rules is not None:
+            tfs, ex = self.tfs.values(), self.tfs[self.rules.exec_timeframe]
+            spread = self.spread.astype(np.float64) if self.spread is not None else np.full(len(self.close), np.nan)
+            self.screen = screen(
+                np.vstack([t.run_close for t in tfs]),
+                np.vstack([t.emas[20] for t in tfs]),
+                np.vstack([t.emas[50] for t in tfs]),
+                self.close, ex.atr, ex.rsi, self.tfs["H1"].swing_high, self.tfs["H1"].swing_low, spread, self.rules,
+                self.point,
+            )
+
+    @classmethod
+    def from_bar_cache(cls, cache_dir: str, symbol: str, backend, days: int | None = None, **kwargs) -> "Backtester":
+        """
+        从本地 M5 缓存构建；days 为回放最近多少天（None 表示缓存中的全部K线）。
+        缓存覆盖不到 days 天时报错并给出实际可回放的天数（先用 backfill_bar_cache 回补），不静默缩短区间。
+        """
+        rates = BarCache(cache_dir).load(symbol, mt5.TIMEFRAME_M5)
+        if len(rates) == 0:
+            raise RuntimeError(f"本地缓存中没有 {symbol} M5 数据（请先在应用中运行一次分析，或使用 --backfill 经 MT5 回补）")
+        base = pd.DataFrame(rates)
+        base["time"] = pd.to_datetime(base["time"], unit="s")
+        if days:
+            start = base["time"].iloc[-1] - pd.Timedelta(days=days)
+            # 区间起点落在周末/假期时第一根K线会晚几天，留出余量
+            if base["time"].iloc[0] > start + pd.Timedelta(days=4):
+                reachable = (base["time"].iloc[-1] - base["time"].iloc[0]).days
+                raise RuntimeError(
+                    f"本地缓存只覆盖 {symbol} M5 最近 {reachable} 天，不足 {days} 天"
+                    f"（使用 --backfill 经 MT5 回补，或把 --days 减小到 {reachable}）"
+                )
+            base = base[base["time"] >= start]
+        return cls(base, backend, base_timeframe="M5", **kwargs)
+
+    # ===== 某一时刻的输入 =====
+    def inputs_at(self, i: int) -> tuple[dict, str, dict, dict]:
+        """返回 (多周期文本输入, 预测区间文本, 当日链输入, 本地桩用的数值上下文)；市场结构文本在当日链输入的 structure_levels 中"""
+        tfs = self.tfs
+        market = {tf_name: tfs[tf_name].block(i, self.n_bars) for tf_name in TIMEFRAME_NAMES}
+        market_inputs = XAUUSDTradingBot._market_inputs(market)
+        forecast_text = format_forecast_text(
+            {tf_name: (tfs[tf_name].run_close[i], tfs[tf_name].atr[i]) for tf_name in TIMEFRAME_NAMES},
+            self.k_map,
+        )
+
+        d1 = tfs["D1"]
+        o, h, l, last = d1.run_open[i], d1.run_high[i], d1.run_low[i], d1.run_close[i]
+        chg_pct = (last - o) / o * 100 if o else 0.0
+        today = {
+            "date": d1.bar_time_str[d1.g[i]][:10],
+            "open": round(float(o), 2),
+            "high": round(float(h), 2),
+            "low": round(float(l), 2),
+            "last": round(float(last), 2),
+            "change_pct": round(float(chg_pct), 2),
+            "range": round(float(h - l), 2),
+        }
+        gy = d1.g[i] - 1
+        y = None
+        if gy >= 0:
+            y = {
+                "y_high": round(float(d1.c_high[gy]), 2),
+                "y_low": round(float(d1.c_low[gy]), 2),
+                "y_close": round(float(d1.c_close[gy]), 2),
+            }
+        spread = int(self.spread[i]) if self.spread is not None else None
+        h1 = tfs["H1"]
+        structure = {
+            tf_name: self.structure.advance((tf_name,), tfs[tf_name].structure_bars, int(tfs[tf_name].g[i]))
+            for tf_name in TIMEFRAME_NAMES
+        }
+        daily_inputs = format_daily_inputs(
+            today, y, spread,
+            round(float(h1.swing_high[i]), 2), round(float(h1.swing_low[i]), 2),
+            [tfs[tf_name].state_line(i) for tf_name in TIMEFRAME_NAMES],
+            forecast_text,
+            format_structure_levels(structure, float(self.close[i])),
+        )
+
+        up = down = 0
+        for t in tfs.values():
+            c, e20, e50 = t.run_close[i], t.emas[20][i], t.emas[50][i]
+            up += int(c > e20 > e50)
+            down += int(c < e20 < e50)
+        context = {
+            "time": self.base["time"].iat[i],
+            "close": float(self.close[i]),
+            "atr_exec": float(tfs["M15"].atr[i]),
+            "trend_up": up,
+            "trend_down": down,
+            "spread": spread,
+        }
+        return market_inputs, forecast_text, daily_inputs, context
+
+    def prescreen_at(self, i: int) -> dict | None:
+        if self.rules is None:
+            return None
+        ex, h1 = self.tfs[self.rules.exec_timeframe], self.tfs["H1"]
+        return verdict(
+            self.screen, TIMEFRAME_NAMES, self.rules,
+            self.close[i], ex.atr[i], ex.rsi[i], h1.swing_high[i], h1.swing_low[i],
+            int(self.spread[i]) if self.spread is not None else None, i,
+        )
+
+    # ===== 成交模拟 =====
+    def simulate(self, i: int, sig: dict) -> dict | None:
+        """限价区间在 expiry_bars 根内被触及则成交；之后先触及 SL 或 TP1 离场（同一根同时触及按止损计）"""
+        side = 1 if sig["signal"] == "买入" else -1
+        lo, hi = sig["entry"]
+        sl, tp = sig["sl"], sig["tp1"]
+        n = len(self.close)
+
+        j0, j1 = i + 1, min(n, i + 1 + self.expiry_bars)
+        if j0 >= j1:
+            return None
+        touched = (self.low[j0:j1] <= hi) & (self.high[j0:j1] >= lo)
+        if not touched.any():
+            return None
+        f = j0 + int(np.argmax(touched))
+        fill = float(np.clip(self.open[f], lo, hi))
+
+        k1 = min(n, f + self.max_hold_bars)
+        hl, hh = self.low[f:k1], self.high[f:k1]
+        hit_sl = hl <= sl if side > 0 else hh >= sl
+        hit_tp = hh >= tp if side > 0 else hl <= tp
+        any_hit = hit_sl | hit_tp
+        if any_hit.any():
+            k = f + int(np.argmax(any_hit))
+            if hit_sl[k - f]:
+                exit_price, reason = sl, "止损"
+            else:
+                exit_price, reason = tp, "止盈TP1"
+        else:
+            k = k1 - 1
+            exit_price, reason = float(self.close[k]), "超时平仓"
+
+        risk = abs(fill - sl)
+        pnl = side * (exit_price - fill)
+        return {
+            "decision_time": self.base["time"].iat[i],
+            "side": sig["signal"],
+            "entry_lo": lo,
+            "entry_hi": hi,
+            "sl": sl,
+            "tp1": tp,
+            "fill_time": self.base["time"].iat[f],
+            "fill_price": round(fill, 2),
+            "exit_time": self.base["time"].iat[k],
+            "exit_price": round(float(exit_price), 2),
+            "exit_reason": reason,
+            "pnl": round(pnl, 2),
+            "r_multiple": round(pnl / risk, 2) if risk > 0 else None,
+            "exit_index": k,
+        }
+
+    # ===== 主循环 =====
+    def warmup_index(self) -> int:
+        # 各周期至少有 RSI/ATR 所需的已收盘K线
+        need = max(RSI_PERIOD, ATR_PERIOD) + 1
+        idx = 0
+        for t in self.tfs.values():
+            ok = np.flatnonzero(t.g >= need)
+            idx = max(idx, int(ok[0]) if len(ok) else len(self.close))
+        return idx
+
+    def run(self, start: int | None = None, end: int | None = None) -> dict:
+        t0 = time.perf_counter()
+        start = self.warmup_index() if start is None else start
+        end = len(self.close) if end is None else end
+
+        trades = []
+        decisions = signals = prescreened = 0
+        i = start
+        while i < end:
+            decisions += 1
+            if self.rules is not None and not self.screen["passed"][i]:
+                # 预检未通过：与实时分析一样不调用交易信号，直接“不交易”（技术分析只作为交易信号的输入，回测中一并跳过）
+                prescreened += 1
+                if self.include_daily:
+                    _, _, daily_inputs, ctx = self.inputs_at(i)
+                    self.backend.invoke("daily", daily_inputs, ctx)
+                i += self.step
+                continue
+
+            market_inputs, forecast_text, daily_inputs, ctx = self.inputs_at(i)
+            v = self.prescreen_at(i)
+            features = self.backend.invoke("feature", {**market_inputs, "structure_levels": daily_inputs["structure_levels"]}, ctx)
+            text = self.backend.invoke("trading", {
+                **market_inputs,
+                "technical_features": features,
+                "forecast_data": forecast_text,
+                "rule_facts": format_rule_facts(v) if v is not None else "未启用本地规则预检",
+            }, ctx)
+            if self.include_daily:
+                self.backend.invoke("daily", daily_inputs, ctx)
+
+            sig = parse_trading_signal(text)
+            trade = None
+            if is_actionable(sig):
+                signals += 1
+                trade = self.simulate(i, sig)
+            if trade is not None:
+                trades.append(trade)
+                # 持仓期间不再决策
+                i = max(i + self.step, trade["exit_index"] + 1)
+            else:
+                i += self.step
+
+        df = pd.DataFrame(trades).drop(columns=["exit_index"], errors="ignore")
+        stats = {
+            "backend": getattr(self.backend, "name", type(self.backend).__name__),
+            "bars": int(end - start),
+            "decisions": decisions,
+            "prescreened": prescreened,
+            "signals": signals,
+            "trades": int(len(df)),
+            "win_rate": round(float((df["pnl"] > 0).mean()), 4) if len(df) else None,
+            "total_pnl": round(float(df["pnl"].sum()), 2) if len(df) else 0.0,
+            "avg_r": round(float(df["r_multiple"].dropna().mean()), 3) if len(df) else None,
+            "elapsed_sec": round(time.perf_counter() - t0, 2),
+        }
+        return {"stats": stats, "trades": df}
+
+
+def backfill_bar_cache(cache_dir: str, symbol: str, days: int, gateway=None) -> int:
+    """
+    经 MT5 网关把本地 M5 缓存向前回补到最近 days 天（整段拉取后 BarCache.replace_all 写回），返回缓存中的K线数。
+    缓存已覆盖该区间时不重复拉取。可回补的长度受终端“图表中的最大柱数”限制，不足时 from_bar_cache 会报出实际天数。
+    """
+    cache = BarCache(cache_dir)
+    end = datetime.now()
+    start = end - timedelta(days=days)
+    covered = cache.covered_from(symbol, mt5.TIMEFRAME_M5)
+    if covered is not None and covered <= int(start.timestamp()):
+        return len(cache.load(symbol, mt5.TIMEFRAME_M5))
+    gateway = gateway or get_gateway()
+    if not gateway.ensure_connected():
+        raise RuntimeError(f"MT5 初始化失败，无法回补：{gateway.last_error}")
+    rates = gateway.call("copy_rates_range", symbol, mt5.TIMEFRAME_M5, start, end)
+    if rates is None or len(rates) == 0:
+        raise RuntimeError(f"MT5 没有返回 {symbol} M5 数据，无法回补")
+    cache.replace_all(symbol, mt5.TIMEFRAME_M5, rates, covered_from=int(start.timestamp()))
+    return len(rates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="XAUUSD 交易助手 - 历史回放回测")
+    parser.add_argument("--symbol", default="XAUUSD")
+    parser.add_argument("--cache-dir", default=".cache/bars", help="本地K线缓存目录")
+    parser.add_argument("--days", type=int, default=365, help="回放最近多少天")
+    parser.add_argument("--backend", choices=["stub", "cache", "model"], default="stub")
+    parser.add_argument("--step", type=int, default=1, help="每隔多少根M5决策一次")
+    parser.add_argument("--no-prescreen", action="store_true", help="关闭本地规则预检（每个时刻都调用后端）")
+    parser.add_argument("--point", type=float, default=None,
+                        help="品种最小报价单位（MT5 symbol_info.point，例如 0.01），用于点差检查；不填时不检查点差")
+    parser.add_argument("--backfill", action="store_true",
+                        help="本地缓存不足 --days 天时先经 MT5 回补 M5 K线（应用只缓存最近 120 天）")
+    parser.add_argument("--out", default=None, help="成交明细输出 CSV 路径")
+    args = parser.parse_args()
+
+    if args.backfill:
+        n = backfill_bar_cache(args.cache_dir, args.symbol, args.days)
+        print(f"本地缓存 {args.symbol} M5：{n} 根")
+
+    if args.backend == "stub":
+        backend = StubBackend()
+    else:
+        import os
+        bot = XAUUSDTradingBot(api_key=os.environ.get("OPENAI_API_KEY", ""), cache_dir=args.cache_dir)
+        backend = ChainBackend(bot) if args.backend == "model" else CacheOnlyBackend(bot)
+
+    bt = Backtester.from_bar_cache(
+        args.cache_dir, args.symbol, backend, days=args.days, step=args.step, prescreen_rules=not args.no_prescreen,
+        point=args.point,
+    )
+    result = bt.run()
+    for k, v in result["stats"].items():
+        print(f"{k}: {v}")
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        result["trades"].to_csv(args.out, index=False, encoding="utf-8-sig")
+        print(f"成交明细已保存：{args.out}")
+
+
+if __name__ == "__main__":
+    main()
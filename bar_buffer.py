@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+XAUUSD 交易助手 - 定长K线容器
+按 (品种, 周期) 在内存中保存最近 capacity 根K线，代替每次刷新都把 MT5 结构化数组整段转成 DataFrame：
+- 只保存分析用到的字段：time（datetime64[ns]）与 OHLC（按品种选择精度：报价位数与价格量级允许时用 float32，否则 float64，见 price_dtype_for）
+- 新数据按时间合并：覆盖仍在形成中的最后一根，追加新K线，超出容量时丢弃最早的K线
+- frame() 返回的 DataFrame 直接引用内部数组（不复制），交给指标与文本编码阶段使用
+预分配 capacity + slack 行；写到末尾时把最近 capacity 行搬回开头，每根新K线的均摊成本为常数。
+"""
+
+import numpy as np
+import pandas as pd
+
+
+BAR_COLUMNS = ("open", "high", "low", "close")
+# float32 尾数 24 位：以最小报价单位计的价格小于该值时，float32 的误差不超过 1/4 个报价单位，按 digits 位小数取整可精确还原
+FLOAT32_MAX_TICKS = 2 ** 22
+
+
+def price_dtype_for(max_price: float, digits: int | None) -> np.dtype:
+    """按报价位数与价格量级选择价格列精度（例如 XAUUSD 2650.12 用 float32，BTCUSD 95000.12 用 float64）；位数未知时用 float64"""
+    if digits is None or not np.isfinite(max_price) or abs(max_price) * 10.0 ** digits >= FLOAT32_MAX_TICKS:
+        return np.dtype(np.float64)
+    return np.dtype(np.float32)
+
+
+class BarBuffer:
+    """
+    单个 (品种, 周期) 的定长K线容器。
+    frame() 返回的是视图：下一次 merge() 之后内容可能改变，同一品种的分析需串行执行（后台任务队列已按品种串行）。
+    price_dtype=None 时按 digits（品种报价位数）与价格量级自动选择，合并的新K线超出 float32 精度范围时整列转为 float64；
+    digits 未知时用 float64。
+    """
+
+    def __init__(self, capacity: int, price_dtype=None, slack: int | None = None, digits: int | None = None):
+        self.capacity = capacity
+        self.digits = digits
+        self._auto_dtype = price_dtype is None
+        if price_dtype is None:
+            price_dtype = np.float64 if digits is None else np.float32
+        self.price_dtype = np.dtype(price_dtype)
+        size = capacity + (slack if slack is not None else max(64, capacity // 4))
+        self._time = np.empty(size, dtype="datetime64[ns]")
+        self._cols = {c: np.empty(size, dtype=self.price_dtype) for c in BAR_COLUMNS}
+        self._start = 0
+        self._end = 0
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    @property
+    def nbytes(self) -> int:
+        return self._time.nbytes + sum(a.nbytes for a in self._cols.values())
+
+    def last_time(self) -> int | None:
+        """最后一根K线（可能未收盘）的时间（秒）"""
+        if self._end == self._start:
+            return None
+        return int(self._time[self._end - 1].astype("datetime64[s]").astype(np.int64))
+
+    def clear(self):
+        self._start = self._end = 0
+
+    def merge(self, rates):
+        """
+        合并 MT5 返回的结构化数组（time 为秒）：先去掉缓冲区中 time >= 新数据首根 time 的K线（含未收盘的最后一根），再追加。
+        """
+        n = len(rates)
+        if n == 0:
+            return
+        if n > self.capacity:
+            rates = rates[n - self.capacity:]
+            n = self.capacity
+        times = rates["time"].astype("datetime64[s]")
+        if self._auto_dtype and self.price_dtype == np.float32:
+            dtype = price_dtype_for(float(np.max(rates["high"])), self.digits)
+            if dtype != self.price_dtype:
+                self.price_dtype = dtype
+                self._cols = {name: col.astype(dtype) for name, col in self._cols.items()}
+
+        keep_end = self._start + int(np.searchsorted(self._time[self._start:self._end], times[0]))
+        start = max(self._start, keep_end + n - self.capacity)
+        if keep_end + n > len(self._time):
+            # 写不下：把保留的K线搬回开头
+            kept = keep_end - start
+            self._time[:kept] = self._time[start:keep_end]
+            for col in self._cols.values():
+                col[:kept] = col[start:keep_end]
+            start, keep_end = 0, kept
+
+        end = keep_end + n
+        self._time[keep_end:end] = times
+        for name, col in self._cols.items():
+            col[keep_end:end] = rates[name]
+        self._start, self._end = start, end
+
+    def frame(self) -> pd.DataFrame:
+        """time + OHLC 的 DataFrame（列直接引用内部数组，不复制）"""
+        s, e = self._start, self._end
+        data = {"time": self._time[s:e]}
+        data.update((name, col[s:e]) for name, col in self._cols.items())
+        return pd.DataFrame(data, copy=False)
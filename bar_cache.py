@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+XAUUSD 交易助手 - 本地K线缓存
+按 品种/周期 在本地保存历史K线（定长记录、只追加），
+每次只向 MT5 请求最后一根缓存K线之后的数据，并替换仍在形成中的最后一根。
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+
+# 与 mt5.copy_rates_* 返回的结构化数组保持一致
+RATES_DTYPE = np.dtype([
+    ("time", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("tick_volume", "<u8"),
+    ("spread", "<i4"),
+    ("real_volume", "<u8"),
+])
+
+
+def _as_rates(rates) -> np.ndarray:
+    """把 MT5 返回的数组转换为统一的记录格式"""
+    out = np.empty(len(rates), dtype=RATES_DTYPE)
+    for name in RATES_DTYPE.names:
+        out[name] = rates[name]
+    return out
+
+
+class BarCache:
+    """
+    本地K线仓库：每个 品种/周期 对应一个 .bin（定长记录，只追加）和一个 .json（元数据）。
+    - covered_from：已完整覆盖的最早起始时间（秒），更早的请求需要回补
+    - 最后一根K线视为未收盘，下次同步时会被覆盖
+    - 读写共用一把锁：append 先截断再追加，读取方不会看到截断后、追加前的中间状态
+    """
+
+    def __init__(self, cache_dir: str | os.PathLike):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    # ===== 路径 =====
+    def _paths(self, symbol: str, timeframe) -> tuple[Path, Path]:
+        stem = f"{symbol}_{int(timeframe)}"
+        return self.cache_dir / f"{stem}.bin", self.cache_dir / f"{stem}.json"
+
+    def _read_meta(self, symbol: str, timeframe) -> dict:
+        _, meta_path = self._paths(symbol, timeframe)
+        if not meta_path.exists():
+            return {}
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def _write_meta(self, symbol: str, timeframe, meta: dict):
+        _, meta_path = self._paths(symbol, timeframe)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    # ===== 读取 =====
+    def load(self, symbol: str, timeframe) -> np.ndarray:
+        data_path, _ = self._paths(symbol, timeframe)
+        with self._lock:
+            if not data_path.exists():
+                return np.empty(0, dtype=RATES_DTYPE)
+            # 只读完整记录（其他进程写到一半时尾部可能不足一条）
+            n = data_path.stat().st_size // RATES_DTYPE.itemsize
+            if n == 0:
+                return np.empty(0, dtype=RATES_DTYPE)
+            return np.fromfile(data_path, dtype=RATES_DTYPE, count=n)
+
+    def last_time(self, symbol: str, timeframe) -> int | None:
+        data_path, _ = self._paths(symbol, timeframe)
+        with self._lock:
+            if not data_path.exists():
+                return None
+            n = data_path.stat().st_size // RATES_DTYPE.itemsize
+            if n == 0:
+                return None
+            with open(data_path, "rb") as f:
+                f.seek((n - 1) * RATES_DTYPE.itemsize)
+                rec = np.frombuffer(f.read(RATES_DTYPE.itemsize), dtype=RATES_DTYPE)
+        return int(rec["time"][0])
+
+    def covered_from(self, symbol: str, timeframe) -> int | None:
+        with self._lock:
+            return self._read_meta(symbol, timeframe).get("covered_from")
+
+    def slice(self, symbol: str, timeframe, start_ts: int, end_ts: int) -> np.ndarray:
+        rates = self.load(symbol, timeframe)
+        if len(rates) == 0:
+            return rates
+        t = rates["time"]
+        i0 = int(np.searchsorted(t, start_ts, side="left"))
+        i1 = int(np.searchsorted(t, end_ts, side="right"))
+        return rates[i0:i1]
+
+    # ===== 写入 =====
+    def replace_all(self, symbol: str, timeframe, rates, covered_from: int):
+        """整段重写（首次拉取或需要向前回补时）"""
+        data_path, _ = self._paths(symbol, timeframe)
+        with self._lock:
+            tmp = data_path.with_suffix(".tmp")
+            _as_rates(rates).tofile(tmp)
+            os.replace(tmp, data_path)
+            self._write_meta(symbol, timeframe, {"covered_from": int(covered_from)})
+
+    def append(self, symbol: str, timeframe, rates):
+        """
+        追加新K线：先截掉缓存中 time >= 新数据首根 time 的记录（含未收盘的最后一根），再追加。
+        """
+        new = _as_rates(rates)
+        if len(new) == 0:
+            return
+        data_path, _ = self._paths(symbol, timeframe)
+        with self._lock:
+            first_new = int(new["time"][0])
+            if data_path.exists():
+                n = data_path.stat().st_size // RATES_DTYPE.itemsize
+                keep = n
+                # 需要覆盖的只有尾部少量K线，从后往前找
+                with open(data_path, "r+b") as f:
+                    while keep > 0:
+                        f.seek((keep - 1) * RATES_DTYPE.itemsize)
+                        rec = np.frombuffer(f.read(RATES_DTYPE.itemsize), dtype=RATES_DTYPE)
+                        if int(rec["time"][0]) < first_new:
+                            break
+                        keep -= 1
+                    f.truncate(keep * RATES_DTYPE.itemsize)
+            with open(data_path, "ab") as f:
+                new.tofile(f)
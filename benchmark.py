@@ -0,0 +1,662 @@
+# -*- coding: utf-8 -*-
+"""
+XAUUSD 交易助手 - 离线基准测试
+不需要 MT5 终端和 OpenAI Key：注入本地 MT5 模拟模块（合成或录制的K线，可设延迟）
+和本地聊天模型（可设首字延迟与输出速度），测量 run_analysis 的分阶段耗时、内存峰值和吞吐，
+覆盖 1..N 个并发调用方与多种历史长度，结果保存为 JSON，并可与基线比较以发现性能回退。
+
+用法：
+    python benchmark.py --history 30 120 365 --callers 1 2 4 --runs 3 --out .cache/bench.json
+    python benchmark.py --baseline .cache/bench_base.json --tolerance 0.25
+    python benchmark.py --fingerprint-check --history 30
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from bar_cache import RATES_DTYPE, BarCache
+from resample import TF_SECONDS, resample_ohlc
+
+
+# ===============================
+# MT5 模拟模块
+# ===============================
+class FakeMT5:
+    """
+    与 MetaTrader5 模块接口一致的本地替身（只实现本项目用到的函数）。
+    bars：{周期常量: RATES_DTYPE 数组}；latency：每次调用的模拟往返延迟（秒）。
+    """
+
+    TIMEFRAME_M1 = 1
+    TIMEFRAME_M5 = 5
+    TIMEFRAME_M15 = 15
+    TIMEFRAME_M30 = 30
+    TIMEFRAME_H1 = 16385
+    TIMEFRAME_H4 = 16388
+    TIMEFRAME_D1 = 16408
+    COPY_TICKS_ALL = -1
+
+    TF_NAMES = {
+        TIMEFRAME_M5: "M5",
+        TIMEFRAME_M15: "M15",
+        TIMEFRAME_M30: "M30",
+        TIMEFRAME_H1: "H1",
+        TIMEFRAME_H4: "H4",
+        TIMEFRAME_D1: "D1",
+    }
+
+    def __init__(self, bars: dict, latency: float = 0.0, spread: int = 20):
+        self.bars = bars
+        self.latency = latency
+        self.spread = spread
+        self.calls = 0
+        self._error = (1, "Success")
+        self.__name__ = "MetaTrader5"
+
+    @classmethod
+    def synthetic(cls, history_days: int, seed: int = 7, **kwargs) -> "FakeMT5":
+        """随机游走的 M5 K线（截至当前，最后一根未收盘），其余周期由 M5 合成，保证各周期一致"""
+        secs = TF_SECONDS["M5"]
+        now = int(time.time())
+        end = now - now % secs
+        t = np.arange(end - history_days * 86400, end + 1, secs, dtype=np.int64)
+        rng = np.random.default_rng(seed)
+        close = 2000.0 + np.cumsum(rng.normal(0.0, 0.8, len(t)))
+        open_ = np.r_[close[0], close[:-1]]
+        high = np.maximum(open_, close) + rng.random(len(t))
+        low = np.minimum(open_, close) - rng.random(len(t))
+        base = pd.DataFrame({
+            "time": pd.to_datetime(t, unit="s"),
+            "open": open_.round(2),
+            "high": high.round(2),
+            "low": low.round(2),
+            "close": close.round(2),
+        })
+        bars = {}
+        for tf, name in cls.TF_NAMES.items():
+            df = base if name == "M5" else resample_ohlc(base, name)
+            rates = np.zeros(len(df), dtype=RATES_DTYPE)
+            rates["time"] = df["time"].to_numpy(dtype="datetime64[s]").astype(np.int64)
+            for col in ("open", "high", "low", "close"):
+                rates[col] = df[col].to_numpy()
+            rates["tick_volume"] = TF_SECONDS[name] // 5
+            rates["spread"] = kwargs.get("spread", 20)
+            bars[tf] = rates
+        return cls(bars, **kwargs)
+
+    @classmethod
+    def from_bar_cache(cls, cache_dir: str, symbol: str = "XAUUSD", **kwargs) -> "FakeMT5":
+        """使用应用运行时录下的本地K线缓存作为数据源"""
+        cache = BarCache(cache_dir)
+        bars = {tf: cache.load(symbol, tf) for tf in cls.TF_NAMES}
+        missing = [cls.TF_NAMES[tf] for tf, r in bars.items() if len(r) == 0]
+        if missing:
+            raise RuntimeError(f"本地缓存缺少周期：{', '.join(missing)}")
+        return cls(bars, **kwargs)
+
+    def _sleep(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _rates(self, timeframe):
+        rates = self.bars.get(timeframe)
+        if rates is None:
+            self._error = (-2, "Invalid params")
+            return None
+        self._error = (1, "Success")
+        return rates
+
+    # ===== MetaTrader5 接口 =====
+    def initialize(self, *args, **kwargs) -> bool:
+        self._sleep()
+        return True
+
+    def shutdown(self):
+        pass
+
+    def last_error(self):
+        return self._error
+
+    def copy_rates_range(self, symbol, timeframe, date_from, date_to):
+        self._sleep()
+        rates = self._rates(timeframe)
+        if rates is None:
+            return None
+        t = rates["time"]
+        lo = np.searchsorted(t, int(date_from.timestamp()), side="left")
+        hi = np.searchsorted(t, int(date_to.timestamp()), side="right")
+        return rates[lo:hi].copy()
+
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        self._sleep()
+        rates = self._rates(timeframe)
+        if rates is None:
+            return None
+        end = max(len(rates) - start_pos, 0)
+        return rates[max(end - count, 0):end].copy()
+
+    def symbol_info(self, symbol):
+        self._sleep()
+        return SimpleNamespace(name=symbol, spread=self.spread, point=0.01, digits=2)
+
+    def symbol_info_tick(self, symbol):
+        # 以最后一根 M5 的收盘价作为当前报价
+        self._sleep()
+        last = self.bars[self.TIMEFRAME_M5][-1]
+        bid = float(last["close"])
+        t = int(last["time"])
+        return SimpleNamespace(time=t, bid=bid, ask=bid + self.spread * 0.01, last=0.0, time_msc=t * 1000)
+
+    def copy_ticks_from(self, symbol, date_from, count, flags):
+        # 合成数据是静态的：只返回当前这一笔报价
+        self._sleep()
+        from live_state import TICK_DTYPE
+
+        tick = self.symbol_info_tick(symbol)
+        out = np.zeros(1, dtype=TICK_DTYPE)
+        for name in ("time", "bid", "ask", "time_msc"):
+            out[name] = getattr(tick, name)
+        return out
+
+
+def install_fake_mt5(fake: FakeMT5):
+    """必须在导入 XAUSD_AI_openai_zh / mt5_gateway 之前调用"""
+    sys.modules["MetaTrader5"] = fake
+
+
+# ===============================
+# 聊天模型模拟
+# ===============================
+class FakeChatModel(BaseChatModel):
+    """
+    本地聊天模型：先等待 latency 秒（首字延迟），再按 tokens_per_sec 逐个输出 reply_tokens 个 token。
+    usage_metadata 按提示词字符数估算输入 token。
+    """
+
+    model_name: str = "fake-chat"
+    temperature: float = 0.0
+    latency: float = 0.5
+    tokens_per_sec: float = 80.0
+    reply_tokens: int = 200
+    token: str = "模拟"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _usage(self, messages) -> dict:
+        n_in = sum(len(str(m.content)) for m in messages)
+        return {"input_tokens": n_in, "output_tokens": self.reply_tokens, "total_tokens": n_in + self.reply_tokens}
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.tokens_per_sec if self.tokens_per_sec > 0 else 0.0
+
+    def _result(self, messages) -> ChatResult:
+        message = AIMessage(content=self.token * self.reply_tokens, usage_metadata=self._usage(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency + self.reply_tokens * self._token_delay())
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency + self.reply_tokens * self._token_delay())
+        return self._result(messages)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        delay = self._token_delay()
+        for i in range(self.reply_tokens):
+            time.sleep(delay)
+            last = i == self.reply_tokens - 1
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=self.token, usage_metadata=self._usage(messages) if last else None,
+            ))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        delay = self._token_delay()
+        for i in range(self.reply_tokens):
+            await asyncio.sleep(delay)
+            last = i == self.reply_tokens - 1
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=self.token, usage_metadata=self._usage(messages) if last else None,
+            ))
+
+
+# ===============================
+# 分阶段计时
+# ===============================
+class StageTimer:
+    """线程安全的分阶段耗时累计：wrap() 替换实例上的方法，chain() 包装 LLM 链"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: dict[str, list[float]] = {}
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, obj, attr: str, stage: str):
+        fn = getattr(obj, attr)
+
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - t0)
+
+        setattr(obj, attr, timed)
+
+    def chain(self, chain, stage: str):
+        return _TimedChain(chain, self, stage)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                stage: {
+                    "count": len(v),
+                    "total_sec": round(sum(v), 4),
+                    "mean_ms": round(1000 * statistics.fmean(v), 3),
+                    "max_ms": round(1000 * max(v), 3),
+                }
+                for stage, v in sorted(self.samples.items())
+            }
+
+
+class _TimedChain:
+    def __init__(self, chain, timer: StageTimer, stage: str):
+        self.chain = chain
+        self.timer = timer
+        self.stage = stage
+
+    def invoke(self, inputs, config=None, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return self.chain.invoke(inputs, config, **kwargs)
+        finally:
+            self.timer.record(self.stage, time.perf_counter() - t0)
+
+    async def ainvoke(self, inputs, config=None, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return await self.chain.ainvoke(inputs, config, **kwargs)
+        finally:
+            self.timer.record(self.stage, time.perf_counter() - t0)
+
+    async def astream(self, inputs, config=None, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            async for chunk in self.chain.astream(inputs, config, **kwargs):
+                yield chunk
+        finally:
+            self.timer.record(self.stage, time.perf_counter() - t0)
+
+
+def instrument(bot, timer: StageTimer):
+    """给 bot 的各阶段挂上计时（只影响该实例）"""
+    timer.wrap(bot, "initialize_mt5", "mt5.connect")
+    timer.wrap(bot, "fetch_rates", "data.fetch")
+    timer.wrap(bot.indicators, "update", "data.indicators")
+    timer.wrap(bot.structure, "update", "data.structure")
+    timer.wrap(bot, "prepare_data_string", "data.format")
+    timer.wrap(bot, "load_market_data", "data.market")
+    timer.wrap(bot, "get_market_lookups", "data.lookups")
+    timer.wrap(bot, "build_daily_inputs", "data.daily_inputs")
+    bot.feature_chain = timer.chain(bot.feature_chain, "llm.feature")
+    bot.trading_chain = timer.chain(bot.trading_chain, "llm.trading")
+    bot.daily_chain = timer.chain(bot.daily_chain, "llm.daily")
+
+
+# ===============================
+# 场景
+# ===============================
+def _latency_stats(values: list[float]) -> dict:
+    arr = np.asarray(values)
+    return {
+        "mean_sec": round(float(arr.mean()), 4),
+        "p50_sec": round(float(np.percentile(arr, 50)), 4),
+        "p95_sec": round(float(np.percentile(arr, 95)), 4),
+        "max_sec": round(float(arr.max()), 4),
+    }
+
+
+def run_scenario(
+    fake: FakeMT5,
+    history_days: int,
+    callers: int,
+    runs: int,
+    llm_kwargs: dict,
+    base_timeframe: str | None = None,
+    symbol: str = "XAUUSD",
+    prompt_encoding: str = "verbose",
+    token_budget: int | None = None,
+) -> dict:
+    """
+    callers 个调用方（各自一个 bot，共享同一个 MT5 网关，与多个浏览器会话相同）同时执行 run_analysis，重复 runs 轮。
+    第一轮为冷启动（空K线缓存、全量指标），单独统计；内存峰值取冷启动单次调用。
+    """
+    from mt5_gateway import MT5Gateway
+    from XAUSD_AI_openai_zh import XAUUSDTradingBot
+
+    gateway = MT5Gateway(mt5_module=fake)
+    timer = StageTimer()
+    with tempfile.TemporaryDirectory(prefix="xau_bench_") as tmp:
+        bots = []
+        for i in range(callers):
+            bot = XAUUSDTradingBot(
+                api_key="",
+                cache_dir=str(Path(tmp) / f"bars_{i}"),
+                base_timeframe=base_timeframe,
+                gateway=gateway,
+                llm_cache_path=None,
+                history_path=None,
+                llm=FakeChatModel(**llm_kwargs),
+                history_days=history_days,
+                prompt_encoding=prompt_encoding,
+                token_budget=token_budget,
+            )
+            instrument(bot, timer)
+            bots.append(bot)
+
+        # 冷启动 + 内存峰值（单个调用方）
+        calls_before = fake.calls
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        bots[0].run_analysis(symbol)
+        cold_sec = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        mt5_calls_cold = fake.calls - calls_before
+
+        # 其余调用方也做一次冷启动，之后只测热路径
+        for bot in bots[1:]:
+            bot.run_analysis(symbol)
+        timer.samples.clear()
+
+        latencies: list[float] = []
+        lat_lock = threading.Lock()
+        barrier = threading.Barrier(callers)
+
+        def caller(bot):
+            barrier.wait()
+            t = time.perf_counter()
+            bot.run_analysis(symbol)
+            with lat_lock:
+                latencies.append(time.perf_counter() - t)
+
+        calls_before = fake.calls
+        wall = 0.0
+        for _ in range(runs):
+            threads = [threading.Thread(target=caller, args=(bot,)) for bot in bots]
+            t0 = time.perf_counter()
+            for th in threads:
+                th.start()
+            for th in threads:
+                th.join()
+            wall += time.perf_counter() - t0
+
+        # 同一份数据下 verbose 与 compact 编码的 Prompt token 数
+        dfs, _ = bots[0].load_market_data(symbol)
+        prompt_tokens = bots[0].prompt_token_report(dfs)
+        gateway.stop()
+
+    done = callers * runs
+    return {
+        "history_days": history_days,
+        "callers": callers,
+        "runs": runs,
+        "base_timeframe": base_timeframe,
+        "prompt_encoding": prompt_encoding,
+        "cold_sec": round(cold_sec, 4),
+        "cold_peak_mem_mb": round(peak / 2**20, 2),
+        "mt5_calls_cold": mt5_calls_cold,
+        "mt5_calls_per_analysis": round((fake.calls - calls_before) / done, 2),
+        "latency": _latency_stats(latencies),
+        "throughput_per_min": round(60.0 * done / wall, 2) if wall > 0 else None,
+        "stages": timer.summary(),
+        "prompt_tokens": prompt_tokens,
+    }
+
+
+def run_benchmark(
+    history: list[int],
+    callers: list[int],
+    runs: int = 3,
+    mt5_latency: float = 0.002,
+    llm_kwargs: dict | None = None,
+    base_timeframe: str | None = None,
+    bar_cache_dir: str | None = None,
+    symbol: str = "XAUUSD",
+    prompt_encoding: str = "verbose",
+    token_budget: int | None = None,
+) -> dict:
+    llm_kwargs = llm_kwargs or {}
+    if bar_cache_dir:
+        fake = FakeMT5.from_bar_cache(bar_cache_dir, symbol, latency=mt5_latency)
+    else:
+        fake = FakeMT5.synthetic(max(history) + 2, latency=mt5_latency)
+    install_fake_mt5(fake)
+
+    scenarios = []
+    for days in history:
+        for n in callers:
+            print(f"[bench] history={days}d callers={n} ...", flush=True)
+            scenarios.append(run_scenario(
+                fake, days, n, runs, llm_kwargs, base_timeframe, symbol, prompt_encoding, token_budget,
+            ))
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "data": bar_cache_dir or "synthetic",
+            "mt5_latency_sec": mt5_latency,
+            "llm": {**FakeChatModel(**llm_kwargs).model_dump(include={"latency", "tokens_per_sec", "reply_tokens"})},
+        },
+        "scenarios": scenarios,
+    }
+
+
+def run_kernel_benchmark(series: int = 40, bars: int = 20000, seed: int = 11) -> dict:
+    """指标计算：逐条 compute_indicators 与二维批量内核的耗时、内存峰值（tracemalloc）对比，并校验结果逐位一致"""
+    from indicators import INDICATOR_COLUMNS, compute_indicators, compute_indicators_many
+
+    rng = np.random.default_rng(seed)
+    close = np.round(2000.0 + np.cumsum(rng.normal(0.0, 1.0, (series, bars)), axis=1), 2)
+    high = close + rng.random((series, bars))
+    low = close - rng.random((series, bars))
+    data = list(zip(close, high, low))
+
+    def measure(fn):
+        # 计时与内存分开测：tracemalloc 会显著拖慢逐元素的 Python 循环
+        t0 = time.perf_counter()
+        out = fn()
+        sec = time.perf_counter() - t0
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return out, {"ms": round(sec * 1000, 1), "peak_mem_mb": round(peak / 2**20, 2)}
+
+    loop, loop_stats = measure(lambda: [compute_indicators(c, h, l) for c, h, l in data])
+    batch, batch_stats = measure(lambda: compute_indicators_many(data))
+    identical = all(
+        np.array_equal(a[col], b[col], equal_nan=True)
+        for a, b in zip(loop, batch) for col in INDICATOR_COLUMNS
+    )
+    return {
+        "series": series,
+        "bars": bars,
+        "loop": loop_stats,
+        "batch": batch_stats,
+        "speedup": round(loop_stats["ms"] / batch_stats["ms"], 2) if batch_stats["ms"] else None,
+        "identical": identical,
+    }
+
+
+def run_fingerprint_check(history_days: int = 30, symbol: str = "XAUUSD") -> dict:
+    """
+    输入指纹稳定性：reuse_unchanged=True 连续分析三次——数据不变、再追加一根平盘 M5 K线（OHLC 均为上一根收盘价）。
+    后两次都不应调用 LLM，且指纹与第一次相同。
+    """
+    fake = FakeMT5.synthetic(history_days + 2)
+    install_fake_mt5(fake)
+    from mt5_gateway import MT5Gateway
+    from XAUSD_AI_openai_zh import XAUUSDTradingBot
+
+    # 最后一根 M5 先不放出，之后以平盘K线补上（时间不晚于当前，拉取范围内可见）
+    m5 = fake.bars[fake.TIMEFRAME_M5]
+    fake.bars[fake.TIMEFRAME_M5] = m5[:-1].copy()
+    gateway = MT5Gateway(mt5_module=fake)
+    timer = StageTimer()
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="xau_fp_") as tmp:
+        bot = XAUUSDTradingBot(
+            api_key="",
+            cache_dir=str(Path(tmp) / "bars"),
+            gateway=gateway,
+            llm_cache_path=None,
+            history_path=None,
+            llm=FakeChatModel(latency=0.0, tokens_per_sec=0.0, reply_tokens=20),
+            history_days=history_days,
+        )
+        instrument(bot, timer)
+
+        def analyse(label: str):
+            before = sum(len(v) for k, v in timer.samples.items() if k.startswith("llm."))
+            r = bot.run_analysis(symbol, reuse_unchanged=True)
+            calls = sum(len(v) for k, v in timer.samples.items() if k.startswith("llm.")) - before
+            runs.append({"run": label, "llm_calls": calls, "fingerprint": r["input_fingerprint"], "llm_skipped": r["llm_skipped"]})
+
+        analyse("first")
+        analyse("unchanged")
+        flat = m5[-1:].copy()
+        for col in ("open", "high", "low", "close"):
+            flat[col] = m5[-2]["close"]
+        fake.bars[fake.TIMEFRAME_M5] = np.r_[m5[:-1], flat]
+        analyse("flat_m5_bar")
+        gateway.stop()
+
+    stable = all(r["llm_calls"] == 0 and r["fingerprint"] == runs[0]["fingerprint"] for r in runs[1:])
+    return {"history_days": history_days, "runs": runs, "stable": stable}
+
+
+# 只比较本地计算阶段（LLM/网络耗时由模拟参数决定，不作为回退依据）
+COMPARE_STAGES = ("data.fetch", "data.indicators", "data.structure", "data.format", "data.market", "data.lookups", "data.daily_inputs")
+
+
+def compare_reports(current: dict, baseline: dict, tolerance: float = 0.25) -> list[str]:
+    """按 (历史天数, 调用方数) 对齐场景，本地阶段平均耗时或冷启动内存超过基线 (1+tolerance) 倍即视为回退"""
+    base = {(s["history_days"], s["callers"]): s for s in baseline.get("scenarios", [])}
+    problems = []
+    for s in current["scenarios"]:
+        b = base.get((s["history_days"], s["callers"]))
+        if b is None:
+            continue
+        tag = f"history={s['history_days']}d callers={s['callers']}"
+        for stage in COMPARE_STAGES:
+            cur, old = s["stages"].get(stage), b["stages"].get(stage)
+            if cur and old and old["mean_ms"] > 0 and cur["mean_ms"] > old["mean_ms"] * (1 + tolerance):
+                problems.append(f"{tag} {stage}: {old['mean_ms']}ms -> {cur['mean_ms']}ms")
+        if b["cold_peak_mem_mb"] > 0 and s["cold_peak_mem_mb"] > b["cold_peak_mem_mb"] * (1 + tolerance):
+            problems.append(f"{tag} 冷启动内存: {b['cold_peak_mem_mb']}MB -> {s['cold_peak_mem_mb']}MB")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="XAUUSD 交易助手 - 离线基准测试")
+    parser.add_argument("--history", type=int, nargs="+", default=[30, 120, 365], help="历史天数（可多个）")
+    parser.add_argument("--callers", type=int, nargs="+", default=[1, 2, 4], help="并发调用方数量（可多个）")
+    parser.add_argument("--runs", type=int, default=3, help="每个场景的热路径轮数")
+    parser.add_argument("--mt5-latency", type=float, default=0.002, help="每次 MT5 调用的模拟延迟（秒）")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="LLM 首字延迟（秒）")
+    parser.add_argument("--llm-tps", type=float, default=80.0, help="LLM 输出速度（token/秒）")
+    parser.add_argument("--llm-tokens", type=int, default=200, help="每次回答的 token 数")
+    parser.add_argument("--base-timeframe", choices=["M5"], default=None, help="本地合成模式")
+    parser.add_argument("--encoding", choices=["verbose", "compact"], default="verbose", help="分析时使用的行情编码")
+    parser.add_argument("--token-budget", type=int, default=None, help="compact 编码的行情块 token 上限")
+    parser.add_argument("--bar-cache", default=None, help="使用录制的本地K线缓存目录代替合成数据")
+    parser.add_argument("--out", default=".cache/benchmark.json", help="结果 JSON 路径")
+    parser.add_argument("--baseline", default=None, help="基线 JSON；本地阶段变慢超过容差时返回非零退出码")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--kernels", type=int, nargs=2, metavar=("SERIES", "BARS"), default=None,
+                        help="只测指标内核：SERIES 条序列 × BARS 根K线，逐条计算 vs 二维批量计算")
+    parser.add_argument("--fingerprint-check", action="store_true",
+                        help="只检查输入指纹：数据不变或新增一根平盘 M5 K线时不应重新调用 LLM")
+    args = parser.parse_args()
+
+    if args.kernels:
+        k = run_kernel_benchmark(*args.kernels)
+        print(json.dumps(k, ensure_ascii=False, indent=2))
+        sys.exit(0 if k["identical"] else 1)
+
+    if args.fingerprint_check:
+        f = run_fingerprint_check(args.history[0])
+        print(json.dumps(f, ensure_ascii=False, indent=2))
+        sys.exit(0 if f["stable"] else 1)
+
+    report = run_benchmark(
+        history=args.history,
+        callers=args.callers,
+        runs=args.runs,
+        mt5_latency=args.mt5_latency,
+        llm_kwargs={"latency": args.llm_latency, "tokens_per_sec": args.llm_tps, "reply_tokens": args.llm_tokens},
+        base_timeframe=args.base_timeframe,
+        bar_cache_dir=args.bar_cache,
+        prompt_encoding=args.encoding,
+        token_budget=args.token_budget,
+    )
+
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"结果已保存：{out}")
+
+    for s in report["scenarios"]:
+        print(
+            f"history={s['history_days']:>4}d callers={s['callers']}  "
+            f"cold={s['cold_sec']:.2f}s  p50={s['latency']['p50_sec']:.2f}s  "
+            f"throughput={s['throughput_per_min']}/min  peak={s['cold_peak_mem_mb']}MB"
+        )
+        tok = s["prompt_tokens"]
+        print(
+            f"  prompt tokens（{tok['counter']}）：verbose={tok['verbose']['total']}  "
+            f"compact={tok['compact']['total']}  节省 {tok['saving_pct']}%  windows={tok['windows']}"
+        )
+
+    if args.baseline:
+        problems = compare_reports(report, json.loads(Path(args.baseline).read_text(encoding="utf-8")), args.tolerance)
+        if problems:
+            print("性能回退：")
+            for p in problems:
+                print("  " + p)
+            sys.exit(1)
+        print("与基线相比无回退")
+
+
+if __name__ == "__main__":
+    main()
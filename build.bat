@@ -49,6 +49,26 @@ if not exist "dist\XAUUSD_AI\.streamlit" mkdir "dist\XAUUSD_AI\.streamlit"
 copy /y "README.txt" "dist\XAUUSD_AI\" >nul 2>&1
 copy /y "app_openai_zh.py" "dist\XAUUSD_AI\" >nul 2>&1
 copy /y "XAUSD_AI_openai_zh.py" "dist\XAUUSD_AI\" >nul 2>&1
+copy /y "bar_cache.py" "dist\XAUUSD_AI\" >nul 2>&1
+copy /y "indicators.py" "dist\XAUUSD_AI\" >nul 2>&1
+copy /y "resample.py" "dist\XAUUSD_AI\" >nul 2>&1
+copy /y "mt5_gateway.py" "dist\XAUUSD_AI\" >nul 2>&1
+copy /y "result_cache.py" "dist\XAUUSD_AI\" >nul 2>&1
+copy /y "llm_cache.py" "dist\XAUUSD_AI\" >nul 2>&1
+copy /y "signals.py" "dist\XAUUSD_AI\" >nul 2>&1
+copy /y "backtest.py" "dist\XAUUSD_AI\" >nul 2>&1
+copy /y "tracing.py" "dist\XAUUSD_AI\" >nul 2>&1
+copy /y "live_state.py" "dist\XAUUSD_AI\" >nul 2>&1
+copy /y "refresh_scheduler.py" "dist\XAUUSD_AI\" >nul 2>&1
+copy /y "analysis_worker.py" "dist\XAUUSD_AI\" >nul 2>&1
+copy /y "prompt_encoding.py" "dist\XAUUSD_AI\" >nul 2>&1
+copy /y "rules.py" "dist\XAUUSD_AI\" >nul 2>&1
+copy /y "market_structure.py" "dist\XAUUSD_AI\" >nul 2>&1
+copy /y "bar_buffer.py" "dist\XAUUSD_AI\" >nul 2>&1
+copy /y "output_check.py" "dist\XAUUSD_AI\" >nul 2>&1
+copy /y "history_store.py" "dist\XAUUSD_AI\" >nul 2>&1
+copy /y "prewarm.py" "dist\XAUUSD_AI\" >nul 2>&1
+copy /y "analysis_server.py" "dist\XAUUSD_AI\" >nul 2>&1
 if exist ".streamlit\secrets.toml" copy /y ".streamlit\secrets.toml" "dist\XAUUSD_AI\.streamlit\" >nul 2>&1
 
 echo.
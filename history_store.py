@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+XAUUSD 交易助手 - 分析历史
+每次 run_analysis 的结果追加到本地 SQLite：
+- 摘要列（时间、输入指纹、信号/入场/止损/止盈/置信度、当前价、总耗时等）单独成列，按 (品种, 时间) 建索引，
+  “最近 N 条信号”和按时间段扫描只读这些列
+- 完整结果（快照、预测区间、三段分析、Trace）压缩后存为一列，只在需要完整结果时解码
+- 新会话启动时直接显示最近一次结果，并用其中的输入指纹预热“输入不变沿用上次结论”
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+from signals import parse_trading_signal
+
+
+SUMMARY_COLUMNS = (
+    "id", "symbol", "ts", "fingerprint", "signal", "entry_low", "entry_high",
+    "sl", "tp1", "tp2", "confidence", "price", "spread", "total_ms", "llm_skipped",
+)
+
+
+def _epoch(t) -> float:
+    """datetime / ISO 字符串 / 秒 -> 秒"""
+    if isinstance(t, datetime):
+        return t.timestamp()
+    if isinstance(t, str):
+        return datetime.fromisoformat(t).timestamp()
+    return float(t)
+
+
+def encode_result(result: dict) -> bytes:
+    return zlib.compress(json.dumps(result, ensure_ascii=False, default=str).encode("utf-8"), 6)
+
+
+def decode_result(blob: bytes) -> dict:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+def summarize(result: dict) -> dict:
+    """结果 -> 摘要列（信号字段从交易信号文本解析，结构化输出渲染后的文本格式相同）"""
+    sig = parse_trading_signal(result.get("trading_signal"))
+    entry = sig["entry"] or (None, None)
+    anchor = result.get("refresh_anchor") or {}
+    trace = result.get("trace") or {}
+    return {
+        "symbol": result["symbol"],
+        "ts": _epoch(result["timestamp"]),
+        "fingerprint": result.get("input_fingerprint"),
+        "signal": sig["signal"],
+        "entry_low": entry[0],
+        "entry_high": entry[1],
+        "sl": sig["sl"],
+        "tp1": sig["tp1"],
+        "tp2": sig["tp2"],
+        "confidence": sig["confidence"],
+        "price": round(float(anchor["price"]), 2) if anchor.get("price") is not None else None,
+        "spread": result.get("current_spread"),
+        "total_ms": trace.get("total_ms"),
+        "llm_skipped": int(bool(result.get("llm_skipped"))),
+    }
+
+
+class AnalysisHistory:
+    def __init__(self, path: str | Path, keep_days: float | None = 180, prune_every: int = 200):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 只保留最近 keep_days 天（None 表示不清理）；每追加 prune_every 条清理一次
+        self.keep_days = keep_days
+        self.prune_every = prune_every
+        self._appended = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        # WAL：页面读取与后台写入互不阻塞
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS analyses ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, symbol TEXT NOT NULL, ts REAL NOT NULL, fingerprint TEXT,"
+            " signal TEXT, entry_low REAL, entry_high REAL, sl REAL, tp1 REAL, tp2 REAL, confidence INTEGER,"
+            " price REAL, spread INTEGER, total_ms REAL, llm_skipped INTEGER NOT NULL DEFAULT 0,"
+            " result BLOB NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_symbol_ts ON analyses(symbol, ts)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_ts ON analyses(ts)")
+        self._conn.commit()
+
+    def append(self, result: dict) -> int:
+        """追加一次分析结果，返回记录 ID"""
+        row = summarize(result)
+        blob = encode_result(result)
+        cols = list(row) + ["result"]
+        with self._lock:
+            cur = self._conn.execute(
+                f"INSERT INTO analyses ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                (*row.values(), blob),
+            )
+            self._conn.commit()
+            self._appended += 1
+            if self.keep_days is not None and self._appended % self.prune_every == 0:
+                self._prune(time.time() - self.keep_days * 86400)
+            return cur.lastrowid
+
+    def _prune(self, before: float):
+        self._conn.execute("DELETE FROM analyses WHERE ts < ?", (before,))
+        self._conn.commit()
+
+    def prune(self, before) -> int:
+        """删除 before（时间）之前的记录，返回删除条数"""
+        with self._lock:
+            n = self._conn.execute("SELECT COUNT(*) FROM analyses WHERE ts < ?", (_epoch(before),)).fetchone()[0]
+            self._prune(_epoch(before))
+            return n
+
+    def _summaries(self, sql: str, args: tuple) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [dict(zip(SUMMARY_COLUMNS, r)) for r in rows]
+
+    def latest(self, symbol: str) -> dict | None:
+        """该品种最近一次的完整结果"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM analyses WHERE symbol = ? ORDER BY ts DESC LIMIT 1", (symbol,),
+            ).fetchone()
+        return decode_result(row[0]) if row is not None else None
+
+    def get(self, record_id: int) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM analyses WHERE id = ?", (record_id,)).fetchone()
+        return decode_result(row[0]) if row is not None else None
+
+    def last_signals(self, symbol: str, n: int = 20, actionable_only: bool = False) -> list[dict]:
+        """最近 n 条摘要（新的在前）；actionable_only=True 时只取买入/卖出"""
+        cond = " AND signal IN ('买入', '卖出')" if actionable_only else ""
+        return self._summaries(
+            f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM analyses WHERE symbol = ?{cond} ORDER BY ts DESC LIMIT ?",
+            (symbol, n),
+        )
+
+    def scan(self, symbol: str, start=None, end=None, full: bool = False) -> list[dict]:
+        """
+        时间段 [start, end) 内的记录（按时间升序）；start/end 可为 datetime、ISO 字符串或秒，None 表示不限。
+        full=False 只返回摘要列；full=True 返回完整结果（逐条解码，较慢）。
+        """
+        lo = _epoch(start) if start is not None else float("-inf")
+        hi = _epoch(end) if end is not None else float("inf")
+        if not full:
+            return self._summaries(
+                f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM analyses WHERE symbol = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (symbol, lo, hi),
+            )
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT result FROM analyses WHERE symbol = ? AND ts >= ? AND ts < ? ORDER BY ts", (symbol, lo, hi),
+            ).fetchall()
+        return [decode_result(r[0]) for r in rows]
+
+    def count(self, symbol: str | None = None) -> int:
+        with self._lock:
+            if symbol is None:
+                return self._conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM analyses WHERE symbol = ?", (symbol,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,557 @@
+# -*- coding: utf-8 -*-
+"""
+XAUUSD 交易助手 - 增量指标引擎
+按 (品种, 周期) 保存 EMA20/50/200、RSI(14)、ATR(14) 的运行状态，
+新K线到来时按根 O(1) 更新；全量重算路径与增量路径使用同一套算术，结果逐位一致。
+多条序列（多品种/回测）冷启动时可用 compute_indicators_batch 在 (序列数 × K线数) 二维数组上一次算完，结果同样逐位一致。
+"""
+
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+EMA_SPANS = (20, 50, 200)
+RSI_PERIOD = 14
+ATR_PERIOD = 14
+INDICATOR_COLUMNS = ("ema_20", "ema_50", "ema_200", "rsi", "atr")
+
+
+def ema_alpha(span: int) -> float:
+    # 与 pandas ewm(span=...) 相同的换算
+    com = (span - 1) / 2.0
+    return 1.0 / (1.0 + com)
+
+
+def ema_step(prev: float, x: float, alpha: float) -> float:
+    # 与 pandas ewm(adjust=False) 的递推式一致
+    if prev != prev:
+        return x
+    old_wt = 1.0 - alpha
+    if prev != x:
+        return (old_wt * prev + alpha * x) / (old_wt + alpha)
+    return prev
+
+
+def rsi_from_means(mean_gain: float, mean_loss: float) -> float:
+    if mean_gain != mean_gain or mean_loss != mean_loss:
+        return np.nan
+    if mean_loss == 0.0:
+        return np.nan if mean_gain == 0.0 else 100.0
+    return 100.0 - (100.0 / (1.0 + mean_gain / mean_loss))
+
+
+def true_range(high: float, low: float, prev_close: float) -> float:
+    if prev_close != prev_close:
+        return high - low
+    return max(high - low, abs(high - prev_close), abs(low - prev_close))
+
+
+def _window_mean(values: np.ndarray, period: int) -> np.ndarray:
+    """滚动均值：窗口内按时间顺序逐项相加，与增量路径的求和顺序一致"""
+    n = len(values)
+    out = np.full(n, np.nan)
+    if n < period:
+        return out
+    acc = values[0:n - period + 1].copy()
+    for j in range(1, period):
+        acc += values[j:n - period + 1 + j]
+    out[period - 1:] = acc / period
+    return out
+
+
+def compute_indicators(close: np.ndarray, high: np.ndarray, low: np.ndarray) -> dict[str, np.ndarray]:
+    """全量重算（用于冷启动与校验）"""
+    close = np.asarray(close, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    n = len(close)
+    out: dict[str, np.ndarray] = {}
+
+    closes = close.tolist()
+    for span in EMA_SPANS:
+        alpha = ema_alpha(span)
+        vals = np.empty(n)
+        prev = np.nan
+        for i, x in enumerate(closes):
+            prev = ema_step(prev, x, alpha)
+            vals[i] = prev
+        out[f"ema_{span}"] = vals
+
+    delta = np.full(n, np.nan)
+    delta[1:] = close[1:] - close[:-1]
+    gain = np.where(delta > 0, delta, 0.0)
+    loss = np.where(delta < 0, -delta, 0.0)
+    gain[0] = loss[0] = np.nan
+    mean_gain = _window_mean(gain, RSI_PERIOD)
+    mean_loss = _window_mean(loss, RSI_PERIOD)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = 100.0 - (100.0 / (1.0 + mean_gain / mean_loss))
+    rsi[(mean_loss == 0.0) & (mean_gain > 0.0)] = 100.0
+    out["rsi"] = rsi
+
+    prev_close = np.full(n, np.nan)
+    prev_close[1:] = close[:-1]
+    tr = np.maximum(np.maximum(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+    if n:
+        tr[0] = high[0] - low[0]
+    out["atr"] = _window_mean(tr, ATR_PERIOD)
+    return out
+
+
+# ===============================
+# 批量内核：(序列数 × K线数) 二维数组一次计算
+# ===============================
+# 行数不少于该值时 EMA 按列（时间）循环、各行向量化；行数较少时逐行标量递推更快
+BATCH_MIN_ROWS = 8
+# 分块大小：EMA 每次复制的时间列数上限、每块临时缓冲的元素数（限制临时缓冲的内存，峰值接近结果数组本身）
+_CHUNK_COLUMNS = 1024
+_CHUNK_ELEMENTS = 1 << 15
+
+
+def pad_series(arrays: list[np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    """把长度不同的一维序列右对齐堆叠为二维数组（左侧补 nan），返回 (数组, 各行长度)"""
+    lengths = np.array([len(a) for a in arrays], dtype=np.int64)
+    out = np.full((len(arrays), int(lengths.max(initial=0))), np.nan)
+    for row, a in zip(out, arrays):
+        if len(a):
+            row[len(row) - len(a):] = a
+    return out, lengths
+
+
+def _window_mean_2d(values: np.ndarray, period: int, out: np.ndarray, acc: np.ndarray):
+    """按行滚动均值，求和顺序与 _window_mean 相同；acc 为长度 n-period+1 的工作缓冲"""
+    n = values.shape[1]
+    out[:, :period - 1] = np.nan
+    if n < period:
+        out[:] = np.nan
+        return
+    m = n - period + 1
+    np.copyto(acc, values[:, 0:m])
+    for j in range(1, period):
+        acc += values[:, j:m + j]
+    np.divide(acc, period, out=out[:, period - 1:])
+
+
+def _rsi_atr_rows(close: np.ndarray, high: np.ndarray, low: np.ndarray, rsi_out: np.ndarray, atr_out: np.ndarray):
+    """若干行的 RSI / ATR（与 compute_indicators 相同的运算），全部原地写入几块工作缓冲，不产生整块临时数组"""
+    rows, n = close.shape
+    acc = np.empty((rows, max(n - min(RSI_PERIOD, ATR_PERIOD) + 1, 0)))
+    delta, gain, mean_gain = np.empty((3, rows, n))
+    mask, mask2 = np.empty((2, rows, n), dtype=bool)
+    # 每行第一根有效K线及其左侧补齐部分（对应一维计算中的第 0 根）
+    first = np.argmax(~np.isnan(close), axis=1)
+    head = np.less_equal(np.arange(n)[None, :], first[:, None], out=np.empty((rows, n), dtype=bool))
+    delta[:, 0] = np.nan
+    np.subtract(close[:, 1:], close[:, :-1], out=delta[:, 1:])
+    # gain = where(delta > 0, delta, 0)
+    gain.fill(0.0)
+    np.copyto(gain, delta, where=np.greater(delta, 0.0, out=mask))
+    gain[head] = np.nan
+    _window_mean_2d(gain, RSI_PERIOD, mean_gain, acc[:, :max(n - RSI_PERIOD + 1, 0)])
+    # loss = where(delta < 0, -delta, 0)，复用 gain 的缓冲
+    loss = gain
+    loss.fill(0.0)
+    np.negative(delta, out=loss, where=np.less(delta, 0.0, out=mask))
+    loss[head] = np.nan
+    mean_loss = delta
+    _window_mean_2d(loss, RSI_PERIOD, mean_loss, acc[:, :max(n - RSI_PERIOD + 1, 0)])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        np.divide(mean_gain, mean_loss, out=rsi_out)
+        rsi_out += 1.0
+        np.divide(100.0, rsi_out, out=rsi_out)
+        np.subtract(100.0, rsi_out, out=rsi_out)
+    np.equal(mean_loss, 0.0, out=mask)
+    mask &= np.greater(mean_gain, 0.0, out=mask2)
+    rsi_out[mask] = 100.0
+
+    # TR = max(high-low, |high-前收|, |low-前收|)，复用 RSI 用过的缓冲
+    prev_close = mean_gain
+    prev_close[:, 0] = np.nan
+    prev_close[:, 1:] = close[:, :-1]
+    tr = np.subtract(high, low, out=gain)
+    tmp = np.subtract(high, prev_close, out=delta)
+    np.abs(tmp, out=tmp)
+    np.maximum(tr, tmp, out=tr)
+    np.subtract(low, prev_close, out=tmp)
+    np.abs(tmp, out=tmp)
+    np.maximum(tr, tmp, out=tr)
+    # 每行第一根有效K线的 TR 为 high - low
+    np.subtract(high, low, out=tr, where=head)
+    _window_mean_2d(tr, ATR_PERIOD, atr_out, acc[:, :max(n - ATR_PERIOD + 1, 0)])
+
+
+def _ema_rows(close: np.ndarray, ema_out: np.ndarray):
+    """EMA：递推（与 ema_step 相同的分支与运算顺序），每根K线对所有序列和周期只做几次原地运算"""
+    rows, n = close.shape
+    if rows < BATCH_MIN_ROWS:
+        for k, span in enumerate(EMA_SPANS):
+            alpha = ema_alpha(span)
+            for r in range(rows):
+                vals = ema_out[k, r]
+                p = np.nan
+                for j, x in enumerate(close[r].tolist()):
+                    p = ema_step(p, x, alpha)
+                    vals[j] = p
+        return
+
+    # 三个周期的状态展平为一维（周期 k 的第 r 个序列在 k*rows + r），每步都是等长连续数组
+    spans = len(EMA_SPANS)
+    alpha = np.repeat([ema_alpha(span) for span in EMA_SPANS], rows)
+    old_wt = 1.0 - alpha
+    denom = old_wt + alpha
+    # 各周期的 old_wt + alpha 恰为 1.0 时除法不改变结果，省去每步一次运算
+    divide = not (denom == 1.0).all()
+    ema_t = ema_out.transpose(2, 0, 1)
+    # prev 可能为 nan 的区间：各行第一根有效K线之前；数据中间含 nan 时为全部区间
+    valid = ~np.isnan(close)
+    starts = np.argmax(valid, axis=1)
+    tail_valid = valid.any(axis=1).all() and valid[np.arange(n)[None, :] >= starts[:, None]].all()
+    del valid
+    nan_until = int(starts.max()) + 1 if tail_valid else n
+    # 默认的 out 布局下每步直接写入输出；调用方传入其他布局的 out 时经临时数组复制
+    direct = n > 0 and ema_t[0].flags.c_contiguous
+    prev = np.full(spans * rows, np.nan)
+    same = np.empty(prev.shape, dtype=bool)
+    width = max(1, min(_CHUNK_COLUMNS, n, _CHUNK_ELEMENTS // (spans * rows)))
+    # 每段时间列各复制 spans 份（与展平后的状态对齐），alpha * x 按段一次算好
+    close_t = np.empty((width, spans * rows))
+    ax_t = np.empty_like(close_t)
+    for j in range(n):
+        if j % width == 0:
+            cols = close[:, j:j + width].T
+            for k in range(spans):
+                close_t[:len(cols), k * rows:(k + 1) * rows] = cols
+            np.multiply(alpha, close_t, out=ax_t)
+        x = close_t[j % width]
+        cur = ema_t[j].reshape(-1) if direct else np.empty_like(prev)
+        np.multiply(old_wt, prev, out=cur)
+        cur += ax_t[j % width]
+        if divide:
+            cur /= denom
+        np.equal(prev, x, out=same)
+        np.copyto(cur, prev, where=same)
+        if j < nan_until:
+            np.copyto(cur, x, where=np.isnan(prev))
+        if not direct:
+            ema_t[j] = cur.reshape(spans, rows)
+        prev = cur
+
+
+def _empty_result(rows: int, n: int) -> np.ndarray:
+    # 内存按 (K线, 指标, 序列) 排列：逐根递推时每步写入一段连续内存
+    return np.empty((n, len(INDICATOR_COLUMNS), rows)).transpose(1, 2, 0)
+
+
+def compute_indicators_batch(
+    close: np.ndarray,
+    high: np.ndarray,
+    low: np.ndarray,
+    out: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    close/high/low：形状 (序列数, K线数)，较短的序列左侧补 nan（见 pad_series）。
+    返回形状 (len(INDICATOR_COLUMNS), 序列数, K线数) 的数组，顺序同 INDICATOR_COLUMNS；
+    可传入同形状的 out 复用缓冲。每个元素的算术与 compute_indicators 完全相同，结果逐位一致。
+    """
+    close = np.asarray(close, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    rows, n = close.shape
+    if out is None:
+        out = _empty_result(rows, n)
+    _ema_rows(close, out[:len(EMA_SPANS)])
+
+    # RSI / ATR：按行分块向量化，临时缓冲大小与总行数无关
+    rsi_out, atr_out = out[len(EMA_SPANS)], out[len(EMA_SPANS) + 1]
+    step = max(1, _CHUNK_ELEMENTS // max(n, 1))
+    for r0 in range(0, rows, step):
+        r1 = min(rows, r0 + step)
+        _rsi_atr_rows(close[r0:r1], high[r0:r1], low[r0:r1], rsi_out[r0:r1], atr_out[r0:r1])
+    return out
+
+
+def _pad_rows(arrays, out: np.ndarray):
+    """把若干一维序列右对齐写入 out 的各行（左侧补 nan）"""
+    n = out.shape[1]
+    for row, a in zip(out, arrays):
+        a = np.asarray(a, dtype=np.float64)
+        row[:n - len(a)] = np.nan
+        row[n - len(a):] = a
+
+
+def compute_indicators_many(series: list[tuple[np.ndarray, np.ndarray, np.ndarray]]) -> list[dict[str, np.ndarray]]:
+    """
+    多条 (close, high, low) 序列一次计算；返回与 compute_indicators 相同格式的结果列表。
+    只分配一块结果数组：补齐后的 close 先暂存在 ATR 所在的平面，high/low 按行分块补齐，不复制整块输入。
+    """
+    if len(series) < BATCH_MIN_ROWS:
+        # 序列较少时逐条计算更快（也避免长度差异很大时的补齐开销）
+        return [compute_indicators(c, h, l) for c, h, l in series]
+    lengths = [len(c) for c, _, _ in series]
+    rows, n = len(series), max(lengths)
+    values = _empty_result(rows, n)
+    rsi_out, atr_out = values[len(EMA_SPANS)], values[len(EMA_SPANS) + 1]
+    close = atr_out
+    _pad_rows((c for c, _, _ in series), close)
+    _ema_rows(close, values[:len(EMA_SPANS)])
+
+    # RSI / ATR 按行分块：本块的 close 先复制出来，再用 ATR 覆盖这几行
+    step = max(1, _CHUNK_ELEMENTS // max(n, 1))
+    buf = np.empty((3, min(step, rows), n))
+    for r0 in range(0, rows, step):
+        r1 = min(rows, r0 + step)
+        c, h, l = buf[:, :r1 - r0]
+        np.copyto(c, close[r0:r1])
+        _pad_rows((s[1] for s in series[r0:r1]), h)
+        _pad_rows((s[2] for s in series[r0:r1]), l)
+        _rsi_atr_rows(c, h, l, rsi_out[r0:r1], atr_out[r0:r1])
+    return [
+        {col: values[k, r, n - length:] for k, col in enumerate(INDICATOR_COLUMNS)}
+        for r, length in enumerate(lengths)
+    ]
+
+
+def compute_indicators_frames(dfs: list[pd.DataFrame]) -> list[dict[str, np.ndarray]]:
+    """pandas 适配：多个含 close/high/low 的 DataFrame 一次计算指标"""
+    return compute_indicators_many([
+        (df["close"].to_numpy(dtype=np.float64), df["high"].to_numpy(dtype=np.float64), df["low"].to_numpy(dtype=np.float64))
+        for df in dfs
+    ])
+
+
+class _SeriesState:
+    """
+    单个 (品种, 周期) 的运行状态；最后一根K线视为未收盘，不写入状态。
+    已处理的K线及其指标保存在预分配的定长缓冲中（与 BarBuffer 相同：尾部原地写入，写满时把保留部分搬回开头），
+    time / ohlc / values 返回缓冲的视图，下一次 update 之后内容可能改变。
+    """
+
+    _COLUMNS = ("high", "low", "close") + INDICATOR_COLUMNS
+
+    def __init__(self, max_rows: int | None = None):
+        self.ema = {span: np.nan for span in EMA_SPANS}
+        self.gains: deque = deque(maxlen=RSI_PERIOD)
+        self.losses: deque = deque(maxlen=RSI_PERIOD)
+        self.trs: deque = deque(maxlen=ATR_PERIOD)
+        self.prev_close = np.nan
+
+        # 已处理的全部K线（含未收盘的最后一根）及其指标：每列一行，有效区间为 [_start, _end)
+        self.max_rows = max_rows
+        self._time = np.empty(0, dtype="datetime64[ns]")
+        self._data = np.empty((len(self._COLUMNS), 0))
+        self._start = 0
+        self._end = 0
+        # 是否丢弃过最早的K线（EMA 依赖被丢弃的历史，之后只能校验 RSI/ATR）
+        self.trimmed = False
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    @property
+    def time(self) -> np.ndarray:
+        return self._time[self._start:self._end]
+
+    @property
+    def ohlc(self) -> dict[str, np.ndarray]:
+        return {k: self._data[i, self._start:self._end] for i, k in enumerate(self._COLUMNS[:3])}
+
+    @property
+    def values(self) -> dict[str, np.ndarray]:
+        return {k: self._data[3 + i, self._start:self._end] for i, k in enumerate(INDICATOR_COLUMNS)}
+
+    def _allocate(self, n: int):
+        # 与 BarBuffer 相同：容量之外预留一段空间，尾部追加写满时才需要搬移
+        size = max(n, self.max_rows or 0)
+        size += max(64, size // 4)
+        self._time = np.empty(size, dtype=self._time.dtype)
+        self._data = np.empty((len(self._COLUMNS), size))
+
+    def load(self, time: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray, values: dict):
+        """全量写入（冷启动 / 全量重算）"""
+        n = len(time)
+        self._allocate(n)
+        self._time[:n] = time
+        for i, col in enumerate((high, low, close) + tuple(values[k] for k in INDICATOR_COLUMNS)):
+            self._data[i, :n] = col
+        self._start, self._end = 0, n
+
+    def extend(self, time: np.ndarray, rows: np.ndarray):
+        """
+        用新K线替换最后一根（未收盘）并追加；rows 形状 (len(_COLUMNS), 新K线数)。
+        超过 max_rows 时丢弃最早的K线（运行状态不受影响）。
+        """
+        m = len(time)
+        keep_end = self._end - 1
+        start = self._start
+        if self.max_rows is not None:
+            start = min(keep_end, max(start, keep_end + m - self.max_rows))
+        self.trimmed = self.trimmed or start > self._start
+        if keep_end + m > len(self._time):
+            # 写不下：把保留的K线搬回开头（未限制行数时扩容）
+            kept = keep_end - start
+            if kept + m > len(self._time):
+                old_time, old_data = self._time, self._data
+                self._allocate(kept + m)
+                self._time[:kept] = old_time[start:keep_end]
+                self._data[:, :kept] = old_data[:, start:keep_end]
+            else:
+                self._time[:kept] = self._time[start:keep_end]
+                self._data[:, :kept] = self._data[:, start:keep_end]
+            start, keep_end = 0, kept
+        end = keep_end + m
+        self._time[keep_end:end] = time
+        self._data[:, keep_end:end] = rows
+        self._start, self._end = start, end
+
+    def step(self, high: float, low: float, close: float, commit: bool) -> tuple:
+        emas = tuple(ema_step(self.ema[span], close, ema_alpha(span)) for span in EMA_SPANS)
+
+        pc = self.prev_close
+        if pc != pc:
+            gain = loss = np.nan
+        else:
+            d = close - pc
+            gain = d if d > 0 else 0.0
+            loss = -d if d < 0 else 0.0
+        gains = list(self.gains)[-(RSI_PERIOD - 1):] + [gain]
+        losses = list(self.losses)[-(RSI_PERIOD - 1):] + [loss]
+        if len(gains) < RSI_PERIOD:
+            rsi = np.nan
+        else:
+            rsi = rsi_from_means(sum(gains) / RSI_PERIOD, sum(losses) / RSI_PERIOD)
+
+        tr = true_range(high, low, pc)
+        trs = list(self.trs)[-(ATR_PERIOD - 1):] + [tr]
+        atr = sum(trs) / ATR_PERIOD if len(trs) == ATR_PERIOD else np.nan
+
+        if commit:
+            for span, v in zip(EMA_SPANS, emas):
+                self.ema[span] = v
+            self.gains.append(gain)
+            self.losses.append(loss)
+            self.trs.append(tr)
+            self.prev_close = close
+        return emas + (rsi, atr)
+
+
+class IndicatorEngine:
+    """
+    增量指标引擎：
+    - update(key, df)：按时间对齐，只计算上次之后新增/变化的K线，在 df 上追加指标列并返回
+    - needs_full(key, df)：该次 update 是否需要全量重算（可先在进程池中算好，再通过 precomputed 传入）
+    - verify(key)：用全量重算路径校验当前状态，结果必须逐位一致
+    max_rows：每条序列最多保留的K线数（与定长K线容器配合，长期运行时内存不随时间增长）；None 表示不截断
+    """
+
+    def __init__(self, max_rows: int | None = None):
+        self.max_rows = max_rows
+        self._states: dict[tuple, _SeriesState] = {}
+
+    def reset(self, key: tuple | None = None):
+        if key is None:
+            self._states.clear()
+        else:
+            self._states.pop(key, None)
+
+    def _full(self, key: tuple, df: pd.DataFrame, precomputed: dict | None = None) -> _SeriesState:
+        state = _SeriesState(self.max_rows)
+        high = df["high"].to_numpy(dtype=np.float64)
+        low = df["low"].to_numpy(dtype=np.float64)
+        close = df["close"].to_numpy(dtype=np.float64)
+        # df 的列可能是定长K线容器的视图，状态中保存副本（写入状态自己的缓冲）
+        values = precomputed if precomputed is not None else compute_indicators(close, high, low)
+        state.load(df["time"].to_numpy(dtype="datetime64[ns]"), high, low, close, values)
+
+        # 用已收盘部分回放出运行状态（只需最后一个窗口）
+        n = len(close)
+        if n > 1:
+            for span in EMA_SPANS:
+                state.ema[span] = float(values[f"ema_{span}"][n - 2])
+            tail = max(0, n - 1 - max(RSI_PERIOD, ATR_PERIOD) - 1)
+            for i in range(tail, n - 1):
+                pc = close[i - 1] if i > 0 else np.nan
+                if pc != pc:
+                    g = l = np.nan
+                else:
+                    d = close[i] - pc
+                    g = d if d > 0 else 0.0
+                    l = -d if d < 0 else 0.0
+                state.gains.append(float(g))
+                state.losses.append(float(l))
+                state.trs.append(true_range(float(high[i]), float(low[i]), float(pc)))
+            state.prev_close = float(close[n - 2])
+        self._states[key] = state
+        return state
+
+    @staticmethod
+    def _extend_from(state: _SeriesState, df: pd.DataFrame) -> int | None:
+        """可增量计算时返回最后一根已收盘K线在 df 中的位置，否则返回 None（不修改状态）"""
+        times = df["time"].to_numpy(dtype="datetime64[ns]")
+        n_old = len(state.time)
+        if n_old < 2 or len(times) == 0:
+            return None
+        # 最后一根已收盘K线在新数据中的位置
+        committed_t = state.time[n_old - 2]
+        p = int(np.searchsorted(times, committed_t))
+        if p >= len(times) or times[p] != committed_t:
+            return None
+        if float(df["close"].iat[p]) != float(state.ohlc["close"][n_old - 2]):
+            return None
+        # 新数据的起点必须落在已处理的区间内
+        if times[0] < state.time[0]:
+            return None
+        if p + 1 >= len(times):
+            return None
+        return p
+
+    def needs_full(self, key: tuple, df: pd.DataFrame) -> bool:
+        state = self._states.get(key)
+        return state is None or self._extend_from(state, df) is None
+
+    def _incremental(self, state: _SeriesState, df: pd.DataFrame) -> bool:
+        p = self._extend_from(state, df)
+        if p is None:
+            return False
+        new = df.iloc[p + 1:]
+        m = len(new)
+        rows = np.empty((len(_SeriesState._COLUMNS), m))
+        rows[0] = new["high"].to_numpy(dtype=np.float64)
+        rows[1] = new["low"].to_numpy(dtype=np.float64)
+        rows[2] = new["close"].to_numpy(dtype=np.float64)
+        # 只对新增/变化的K线递推，结果直接写入缓冲的尾部
+        for i, (h, l, c) in enumerate(zip(*rows[:3].tolist())):
+            rows[3:, i] = state.step(h, l, c, commit=i < m - 1)
+        state.extend(df["time"].to_numpy(dtype="datetime64[ns]")[p + 1:], rows)
+        return True
+
+    def update(self, key: tuple, df: pd.DataFrame, precomputed: dict | None = None) -> pd.DataFrame:
+        # precomputed：调用方已对 df 全量计算好的指标（仅在需要全量重算时使用）
+        state = self._states.get(key)
+        if state is None or not self._incremental(state, df):
+            state = self._full(key, df, precomputed)
+
+        # 按时间把引擎中的指标对齐到 df 的行
+        times = df["time"].to_numpy(dtype="datetime64[ns]")
+        i0 = int(np.searchsorted(state.time, times[0]))
+        i1 = i0 + len(df)
+        if i1 > len(state.time) or state.time[i0] != times[0] or state.time[i1 - 1] != times[-1]:
+            state = self._full(key, df)
+            i0, i1 = 0, len(df)
+
+        # df 由调用方新建，直接追加指标列，不再整表复制
+        for col, values in state.values.items():
+            df[col] = values[i0:i1]
+        return df
+
+    def verify(self, key: tuple) -> bool:
+        state = self._states.get(key)
+        if state is None:
+            return True
+        full = compute_indicators(state.ohlc["close"], state.ohlc["high"], state.ohlc["low"])
+        if state.trimmed:
+            # 截断后只有窗口类指标可以从保留的K线重算
+            w = max(RSI_PERIOD, ATR_PERIOD)
+            return all(np.array_equal(full[col][w:], state.values[col][w:], equal_nan=True) for col in ("rsi", "atr"))
+        return all(np.array_equal(full[col], state.values[col], equal_nan=True) for col in INDICATOR_COLUMNS)
@@ -10,8 +10,14 @@ import webbrowser
 import time
 import threading
 import ctypes
+import urllib.request
 from pathlib import Path
 
+import prewarm
+
+# 启动器开始运行的时间（用于统计启动到页面可交互的耗时）
+LAUNCH_TIME = time.time()
+
 
 def get_base_path():
     """获取程序运行的基础路径（支持打包后和开发环境）"""
@@ -125,12 +131,26 @@ def check_and_get_api_key(base_path: Path) -> str:
     return api_key
 
 
-def open_browser_delayed(url: str, delay: float = 2.0):
-    """延迟打开浏览器"""
-    time.sleep(delay)
+def open_browser_when_ready(url: str, timeout: float = 60.0, interval: float = 0.1):
+    """Streamlit 服务就绪（健康检查通过）后立即打开浏览器，超时仍未就绪也会打开"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/_stcore/health", timeout=1) as resp:
+                if resp.status == 200:
+                    print(f"      ✓ 服务已就绪（启动后 {time.time() - LAUNCH_TIME:.2f} 秒）")
+                    break
+        except Exception:
+            pass
+        time.sleep(interval)
     webbrowser.open(url)
 
 
+def report_prewarm(text: str):
+    print(text)
+    print(f"      （启动后 {time.time() - LAUNCH_TIME:.2f} 秒）")
+
+
 def create_streamlit_config(base_path: Path):
     """创建 Streamlit 配置文件"""
     config_dir = base_path / ".streamlit"
@@ -155,18 +175,23 @@ serverAddress = "localhost"
         f.write(config_content)
 
 
-def run_streamlit_directly(app_file: str, api_key: str, base_path: Path):
+def run_streamlit_directly(app_file: str, api_key: str, base_path: Path, prewarm_bot: bool = True):
     """直接运行 Streamlit"""
     # 设置环境变量
     os.environ['OPENAI_API_KEY'] = api_key
+    os.environ[prewarm.LAUNCH_TIME_ENV] = str(LAUNCH_TIME)
     
     # 创建配置文件
     create_streamlit_config(base_path)
     
     url = "http://localhost:8501"
+
+    # 后台预热：导入分析模块、创建 bot、连接 MT5，与 Streamlit 启动和打开浏览器同时进行（同一进程，页面直接取用）
+    if prewarm_bot:
+        prewarm.start(api_key, report=report_prewarm)
     
-    # 延迟打开浏览器
-    browser_thread = threading.Thread(target=open_browser_delayed, args=(url, 2.0))
+    # 服务就绪后打开浏览器
+    browser_thread = threading.Thread(target=open_browser_when_ready, args=(url,))
     browser_thread.daemon = True
     browser_thread.start()
     
@@ -203,6 +228,11 @@ def main():
     
     # 设置工作目录
     os.chdir(base_path)
+
+    # --profile-imports：只打印各重依赖的导入耗时后退出（排查打包后启动慢）
+    if "--profile-imports" in sys.argv:
+        print(prewarm.format_profile(prewarm.import_profile()))
+        return
     
     # 1. 检查 API Key
     print("[1/2] 检查 API Key 配置...")
@@ -234,7 +264,8 @@ def main():
     
     # 3. 运行 Streamlit
     try:
-        run_streamlit_directly(str(app_file), api_key, base_path)
+        # --no-prewarm：不在后台预热 bot（页面首次打开时再创建）
+        run_streamlit_directly(str(app_file), api_key, base_path, prewarm_bot="--no-prewarm" not in sys.argv)
     except SystemExit:
         # Streamlit 正常退出
         pass
@@ -250,4 +281,7 @@ def main():
 
 
 if __name__ == "__main__":
+    # 打包后批量分析的进程池子进程会重新启动本程序，需要先交给 multiprocessing 处理
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+XAUUSD 交易助手 - 实时行情状态
+逐笔消费 tick（MT5 copy_ticks_from 轮询，或可回放的本地 tick 数据），每笔 O(1) 维护：
+当日 OHLC / 最新价、滚动点差统计、当前交易时段区间。
+首次使用时只取两根日线作为起点（今日开高低 + 昨日关键位），之后每次刷新只拉取上次之后的新 tick。
+"""
+
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+import numpy as np
+
+
+# 交易时段（服务器时间的小时区间 [起, 止)）
+DEFAULT_SESSIONS = (
+    ("亚洲", 0, 8),
+    ("欧洲", 8, 16),
+    ("美洲", 16, 24),
+)
+
+# 本地回放用的 tick 记录格式（与 mt5.copy_ticks_* 返回的字段同名）
+TICK_DTYPE = np.dtype([
+    ("time", "<i8"),
+    ("bid", "<f8"),
+    ("ask", "<f8"),
+    ("last", "<f8"),
+    ("volume", "<u8"),
+    ("time_msc", "<i8"),
+    ("flags", "<u4"),
+    ("volume_real", "<f8"),
+])
+
+
+class _RollingStats:
+    """固定窗口的均值/最小/最大（单调队列，每次更新摊还 O(1)）"""
+
+    def __init__(self, window: int):
+        self.window = window
+        self._values: deque = deque()
+        self._sum = 0.0
+        self._min: deque = deque()
+        self._max: deque = deque()
+        self._n = 0
+
+    def push(self, x: float):
+        i = self._n
+        self._n += 1
+        self._values.append(x)
+        self._sum += x
+        while self._min and self._min[-1][1] >= x:
+            self._min.pop()
+        self._min.append((i, x))
+        while self._max and self._max[-1][1] <= x:
+            self._max.pop()
+        self._max.append((i, x))
+        if len(self._values) > self.window:
+            self._sum -= self._values.popleft()
+            oldest = self._n - self.window
+            if self._min[0][0] < oldest:
+                self._min.popleft()
+            if self._max[0][0] < oldest:
+                self._max.popleft()
+
+    def summary(self) -> dict | None:
+        if not self._values:
+            return None
+        return {
+            "last": self._values[-1],
+            "mean": self._sum / len(self._values),
+            "min": self._min[0][1],
+            "max": self._max[0][1],
+            "count": len(self._values),
+        }
+
+
+class LiveMarketState:
+    """
+    单品种实时状态（线程安全）。价格按 bid 计（与 MT5 K线一致），点差按 (ask-bid)/point 计。
+    seed() 用日线初始化当日开高低和昨日关键位；未 seed 时以当天第一笔 tick 作为开盘价。
+    """
+
+    def __init__(self, symbol: str, point: float = 0.01, spread_window: int = 500, sessions=DEFAULT_SESSIONS):
+        self.symbol = symbol
+        self.point = point
+        self.sessions = sessions
+        self._lock = threading.Lock()
+        self._spread = _RollingStats(spread_window)
+
+        self.day: int | None = None          # 当日 0 点（服务器时间，秒）
+        self.open = self.high = self.low = self.last = None
+        self.yesterday: dict | None = None
+        self.session_name: str | None = None
+        self.session_high = self.session_low = None
+        self.last_tick_time: int | None = None
+        self.ticks = 0
+
+    def seed(self, day_start: int, open_: float, high: float, low: float, last: float, yesterday: dict | None = None):
+        with self._lock:
+            self.day = day_start
+            self.open, self.high, self.low, self.last = open_, high, low, last
+            self.yesterday = yesterday
+
+    def _session_of(self, t: int) -> str | None:
+        hour = (t % 86400) // 3600
+        for name, start, end in self.sessions:
+            if start <= hour < end:
+                return name
+        return None
+
+    def on_tick(self, t: int, bid: float, ask: float):
+        with self._lock:
+            self._apply(t, bid, ask)
+
+    def on_ticks(self, ticks: np.ndarray):
+        if len(ticks) == 0:
+            return
+        with self._lock:
+            for t, bid, ask in zip(ticks["time"].tolist(), ticks["bid"].tolist(), ticks["ask"].tolist()):
+                self._apply(t, bid, ask)
+
+    def _apply(self, t: int, bid: float, ask: float):
+        if not (bid > 0):
+            return
+        day = t - t % 86400
+        if self.day is None or day > self.day:
+            # 跨日：当天收盘变为昨日关键位
+            if self.day is not None and self.open is not None:
+                self.yesterday = {
+                    "y_high": round(self.high, 2),
+                    "y_low": round(self.low, 2),
+                    "y_close": round(self.last, 2),
+                }
+            self.day = day
+            self.open = self.high = self.low = bid
+        else:
+            if bid > self.high:
+                self.high = bid
+            if bid < self.low:
+                self.low = bid
+        self.last = bid
+
+        session = self._session_of(t)
+        if session != self.session_name:
+            self.session_name = session
+            self.session_high = self.session_low = bid
+        else:
+            if bid > self.session_high:
+                self.session_high = bid
+            if bid < self.session_low:
+                self.session_low = bid
+
+        if ask > 0 and self.point > 0:
+            self._spread.push((ask - bid) / self.point)
+        self.last_tick_time = t
+        self.ticks += 1
+
+    # ===== 输出（与 bot 原有查询结果格式一致）=====
+    def snapshot(self) -> dict | None:
+        with self._lock:
+            if self.day is None or self.open is None:
+                return None
+            o, h, l, last = self.open, self.high, self.low, self.last
+            chg_pct = (last - o) / o * 100 if o else 0.0
+            return {
+                "date": datetime.fromtimestamp(self.day, tz=timezone.utc).strftime("%Y-%m-%d"),
+                "open": round(o, 2),
+                "high": round(h, 2),
+                "low": round(l, 2),
+                "last": round(last, 2),
+                "change_pct": round(chg_pct, 2),
+                "range": round(h - l, 2),
+            }
+
+    def yesterday_levels(self) -> dict | None:
+        with self._lock:
+            return dict(self.yesterday) if self.yesterday else None
+
+    def current_spread(self) -> int | None:
+        with self._lock:
+            stats = self._spread.summary()
+        return int(round(stats["last"])) if stats else None
+
+    def summary(self) -> dict:
+        with self._lock:
+            stats = self._spread.summary()
+            session = None
+            if self.session_name is not None:
+                session = {
+                    "name": self.session_name,
+                    "high": round(self.session_high, 2),
+                    "low": round(self.session_low, 2),
+                    "range": round(self.session_high - self.session_low, 2),
+                }
+            return {
+                "last_tick_time": self.last_tick_time,
+                "ticks": self.ticks,
+                "spread": {k: (round(v, 1) if isinstance(v, float) else v) for k, v in stats.items()} if stats else None,
+                "session": session,
+            }
+
+
+# ===============================
+# tick 来源
+# ===============================
+class MT5TickSource:
+    """
+    通过 MT5 网关拉取 tick：call(name, *args) 为 bot._mt5 或 gateway.call。
+    MT5 的 copy_ticks_from 以秒为起点，返回的首批可能包含已处理过的同一毫秒 tick，由 LiveFeed 去重。
+    """
+
+    def __init__(self, call, symbol: str, copy_ticks_flag, d1_timeframe):
+        self.call = call
+        self.symbol = symbol
+        self.copy_ticks_flag = copy_ticks_flag
+        self.d1_timeframe = d1_timeframe
+
+    def point(self) -> float | None:
+        info = self.call("symbol_info", self.symbol)
+        return float(info.point) if info is not None and getattr(info, "point", 0) else None
+
+    def day_bars(self):
+        """最近两根日线（昨日 + 今日未收盘）"""
+        return self.call("copy_rates_from_pos", self.symbol, self.d1_timeframe, 0, 2)
+
+    def latest_tick(self):
+        tick = self.call("symbol_info_tick", self.symbol)
+        if tick is None:
+            return None
+        out = np.zeros(1, dtype=TICK_DTYPE)
+        for name in ("time", "bid", "ask", "time_msc"):
+            out[name] = getattr(tick, name)
+        return out
+
+    def ticks_since(self, time_msc: int, count: int):
+        return self.call("copy_ticks_from", self.symbol, time_msc // 1000, count, self.copy_ticks_flag)
+
+
+class ReplayTickSource:
+    """本地回放：按 time_msc 排序的 tick 数组（TICK_DTYPE 或 MT5 导出的同名字段）"""
+
+    def __init__(self, ticks: np.ndarray, point: float = 0.01):
+        self.ticks = np.sort(ticks, order="time_msc")
+        self._point = point
+        self.cursor = 0   # 回放进度：只返回游标之前“已经发生”的 tick
+
+    def advance(self, n: int):
+        self.cursor = min(len(self.ticks), self.cursor + n)
+
+    def point(self) -> float:
+        return self._point
+
+    def day_bars(self):
+        return None
+
+    def latest_tick(self):
+        return self.ticks[max(self.cursor - 1, 0):self.cursor]
+
+    def ticks_since(self, time_msc: int, count: int):
+        visible = self.ticks[:self.cursor]
+        i = int(np.searchsorted(visible["time_msc"], (time_msc // 1000) * 1000, side="left"))
+        return visible[i:i + count]
+
+
+class LiveFeed:
+    """把 tick 来源接到 LiveMarketState：refresh() 只拉取上次之后的新 tick；缺口过大时重新用日线起点"""
+
+    def __init__(self, symbol: str, source, batch: int = 5000, max_batches: int = 20, **state_kwargs):
+        self.source = source
+        self.batch = batch
+        self.max_batches = max_batches
+        self.state_kwargs = state_kwargs
+        self.state = LiveMarketState(symbol, **state_kwargs)
+        self._lock = threading.Lock()
+        self._last_msc: int | None = None
+        self._seen_at_last_msc = 0
+
+    def _seed(self) -> bool:
+        point = self.source.point()
+        self.state = LiveMarketState(self.state.symbol, **{**self.state_kwargs, **({"point": point} if point else {})})
+        tick = self.source.latest_tick()
+        if tick is None or len(tick) == 0:
+            return False
+        bars = self.source.day_bars()
+        if bars is not None and len(bars) > 0:
+            today = bars[-1]
+            yesterday = None
+            if len(bars) >= 2:
+                y = bars[-2]
+                yesterday = {"y_high": round(float(y["high"]), 2), "y_low": round(float(y["low"]), 2), "y_close": round(float(y["close"]), 2)}
+            self.state.seed(int(today["time"]), float(today["open"]), float(today["high"]), float(today["low"]), float(today["close"]), yesterday)
+        self.state.on_ticks(tick)
+        self._last_msc = int(tick["time_msc"][-1])
+        self._seen_at_last_msc = 1
+        return True
+
+    def refresh(self) -> bool:
+        """拉取并应用新 tick；返回状态是否可用"""
+        with self._lock:
+            if self._last_msc is None:
+                return self._seed()
+            for _ in range(self.max_batches):
+                ticks = self.source.ticks_since(self._last_msc, self.batch)
+                if ticks is None:
+                    return self.state.day is not None
+                msc = ticks["time_msc"]
+                # 跳过已处理的 tick（同一毫秒已处理过的条数）
+                start = int(np.searchsorted(msc, self._last_msc, side="left"))
+                same = int(np.searchsorted(msc, self._last_msc, side="right")) - start
+                skip = start + min(same, self._seen_at_last_msc)
+                new = ticks[skip:]
+                if len(new):
+                    self.state.on_ticks(new)
+                    last = int(new["time_msc"][-1])
+                    if last == self._last_msc:
+                        self._seen_at_last_msc += len(new)
+                    else:
+                        self._last_msc = last
+                        self._seen_at_last_msc = int(np.count_nonzero(new["time_msc"] == last))
+                if len(ticks) < self.batch:
+                    return True
+            # 缺口太大（例如长时间未刷新）：用日线重新建立起点，避免逐笔追赶
+            return self._seed()
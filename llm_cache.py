@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+XAUUSD 交易助手 - LLM 响应缓存
+以 (模型, 提示词模板, 渲染变量) 的哈希为键，把回答保存在本地 SQLite；
+按条数做 LRU 淘汰，按链设置 TTL，并统计命中/未命中次数。
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+
+# 各条链的默认有效期（秒）
+DEFAULT_TTL = {
+    "feature": 6 * 3600,
+    "trading": 2 * 3600,
+    "daily": 2 * 3600,
+}
+
+
+def cache_key(model: str, template: str, variables: dict, **params) -> str:
+    payload = json.dumps(
+        {"model": model, "template": template, "variables": variables, "params": params},
+        ensure_ascii=False,
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    def __init__(self, path: str | Path, max_entries: int = 2000, ttl: dict[str, float] | None = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl = {**DEFAULT_TTL, **(ttl or {})}
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, chain TEXT NOT NULL, content TEXT NOT NULL,"
+            " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.commit()
+        self._stats: dict[str, dict[str, int]] = {}
+
+    def _count(self, chain: str, field: str):
+        self._stats.setdefault(chain, {"hits": 0, "misses": 0})[field] += 1
+
+    def get(self, chain: str, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT content, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl.get(chain, float("inf")):
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self._count(chain, "misses")
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._count(chain, "hits")
+            return row[0]
+
+    def put(self, chain: str, key: str, content: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, chain, content, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, chain, content, now, now),
+            )
+            # LRU：超出容量时删除最久未访问的记录
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            chains = {k: dict(v) for k, v in self._stats.items()}
+        return {
+            "entries": size,
+            "hits": sum(v["hits"] for v in chains.values()),
+            "misses": sum(v["misses"] for v in chains.values()),
+            "chains": chains,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+
+class CachedChain:
+    """
+    包装 PromptTemplate | llm 链：相同输入直接返回缓存的回答（AIMessage；流式时一次性产出整段）。
+    write_through=False 时未命中的回答不自动写入，由调用方校验通过后调用 store() 写入。
+    """
+
+    def __init__(
+        self, name: str, chain, cache: LLMResponseCache, model: str, template: str,
+        write_through: bool = True, **params,
+    ):
+        self.name = name
+        self.chain = chain
+        self.cache = cache
+        self.model = model
+        self.template = template
+        self.write_through = write_through
+        self.params = params
+
+    def key(self, inputs: dict) -> str:
+        return cache_key(self.model, self.template, inputs, **self.params)
+
+    def store(self, inputs: dict, content: str):
+        self.cache.put(self.name, self.key(inputs), content)
+
+    def _miss(self, key: str, content: str):
+        if self.write_through:
+            self.cache.put(self.name, key, content)
+
+    def invoke(self, inputs: dict, config=None, **kwargs):
+        key = self.key(inputs)
+        content = self.cache.get(self.name, key)
+        if content is not None:
+            return AIMessage(content=content, response_metadata={"cache_hit": True})
+        resp = self.chain.invoke(inputs, config, **kwargs)
+        self._miss(key, resp.content if hasattr(resp, "content") else str(resp))
+        return resp
+
+    async def ainvoke(self, inputs: dict, config=None, **kwargs):
+        key = self.key(inputs)
+        content = self.cache.get(self.name, key)
+        if content is not None:
+            return AIMessage(content=content, response_metadata={"cache_hit": True})
+        resp = await self.chain.ainvoke(inputs, config, **kwargs)
+        self._miss(key, resp.content if hasattr(resp, "content") else str(resp))
+        return resp
+
+    def stream(self, inputs: dict, config=None, **kwargs):
+        key = self.key(inputs)
+        content = self.cache.get(self.name, key)
+        if content is not None:
+            yield AIMessageChunk(content=content, response_metadata={"cache_hit": True})
+            return
+        parts = []
+        for chunk in self.chain.stream(inputs, config, **kwargs):
+            parts.append(chunk.content if hasattr(chunk, "content") else str(chunk))
+            yield chunk
+        self._miss(key, "".join(parts))
+
+    async def astream(self, inputs: dict, config=None, **kwargs):
+        key = self.key(inputs)
+        content = self.cache.get(self.name, key)
+        if content is not None:
+            yield AIMessageChunk(content=content, response_metadata={"cache_hit": True})
+            return
+        parts = []
+        async for chunk in self.chain.astream(inputs, config, **kwargs):
+            parts.append(chunk.content if hasattr(chunk, "content") else str(chunk))
+            yield chunk
+        self._miss(key, "".join(parts))
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+XAUUSD 交易助手 - 市场结构识别
+在各周期完整的已收盘K线上识别结构，代替让模型从最近十根K线里自行寻找：
+- 分形摆动高/低：左右各 fractal 根K线均不超过它（右侧收盘后才确认，不含未来数据）
+- 结构突破（BOS）：收盘价首次越过最近一个已确认的摆动高/低
+- 公允价值缺口（FVG）：三根K线中第 1 根与第 3 根之间未重叠的区间，价格回到缺口另一端即视为回补
+- 订单块（OB）：结构突破前最后一根反向K线，收盘价越过订单块另一端即失效
+全量路径用 numpy 向量化计算（冷启动），之后按 (品种, 周期) 保存状态，新K线到来时逐根增量更新；两条路径结果逐位一致。
+"""
+
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+class _StructureState:
+    def __init__(self, keep: int):
+        self.count = 0                      # 已处理的已收盘K线数
+        self.last_time = None               # 最后一根已处理K线的时间（datetime64[ns]，实时数据对齐用）
+        self.last_close = np.nan
+        self.swing_high: list | None = None   # 最近确认的摆动高 [时间, 价位, 是否已被突破]
+        self.swing_low: list | None = None
+        self.last_bear: tuple | None = None   # 最近一根阴线 (时间, 低, 高)，用于多头订单块
+        self.last_bull: tuple | None = None
+        self.highs: deque = deque(maxlen=keep)   # 最近几个摆动高 (时间, 价位)
+        self.lows: deque = deque(maxlen=keep)
+        self.bos: deque = deque(maxlen=keep)     # 最近几次结构突破 (时间, 方向, 价位)
+        self.fvgs: list[list] = []          # 未回补的缺口 [方向, 时间, 下沿, 上沿]（部分回补时区间收窄）
+        self.obs: list[list] = []           # 有效订单块 [方向, 时间, 下沿, 上沿]
+
+    def snapshot(self) -> dict:
+        return {
+            "swing_high": self.swing_high,
+            "swing_low": self.swing_low,
+            "last_bear": self.last_bear,
+            "last_bull": self.last_bull,
+            "highs": list(self.highs),
+            "lows": list(self.lows),
+            "bos": list(self.bos),
+            "fvgs": self.fvgs,
+            "obs": self.obs,
+        }
+
+
+def bar_arrays(df: pd.DataFrame) -> tuple[np.ndarray, ...]:
+    """(时间秒, O, H, L, C, ATR)；没有 atr 列时不按 ATR 过滤缺口"""
+    secs = df["time"].to_numpy(dtype="datetime64[s]").astype(np.int64)
+    cols = tuple(df[c].to_numpy(dtype=np.float64) for c in ("open", "high", "low", "close"))
+    atr = df["atr"].to_numpy(dtype=np.float64) if "atr" in df else np.zeros(len(df))
+    return (secs, *cols, atr)
+
+
+def fractal_swings(high: np.ndarray, low: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """分形摆动高/低的位置：高点严格高于左侧 k 根、不低于右侧 k 根（低点对称）"""
+    w = 2 * k + 1
+    if len(high) < w:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    wh = np.lib.stride_tricks.sliding_window_view(high, w)
+    wl = np.lib.stride_tricks.sliding_window_view(low, w)
+    ch, cl = wh[:, k], wl[:, k]
+    is_high = (ch > wh[:, :k].max(axis=1)) & (ch >= wh[:, k + 1:].max(axis=1))
+    is_low = (cl < wl[:, :k].min(axis=1)) & (cl <= wl[:, k + 1:].min(axis=1))
+    return np.flatnonzero(is_high) + k, np.flatnonzero(is_low) + k
+
+
+def _last_true(mask: np.ndarray) -> np.ndarray:
+    """每个位置及之前最后一个 True 的位置，没有时为 -1"""
+    return np.maximum.accumulate(np.where(mask, np.arange(len(mask)), -1))
+
+
+def _breaks(levels: np.ndarray, swings: np.ndarray, close: np.ndarray, k: int, up: bool):
+    """每个摆动位（确认后）第一次被收盘价越过的位置；返回 (突破K线位置, 摆动位置)"""
+    m = len(close)
+    confirmed = np.full(m, -1)
+    confirmed[swings + k] = swings
+    # 第 j 根K线可用的是 j-1 及之前确认的摆动位
+    avail = np.r_[-1, np.maximum.accumulate(confirmed)[:-1]]
+    ok = avail >= 0
+    level = np.where(ok, levels[np.where(ok, avail, 0)], np.nan)
+    with np.errstate(invalid="ignore"):
+        crossed = ok & ((close > level) if up else (close < level))
+    js = np.flatnonzero(crossed)
+    ids, first = np.unique(avail[js], return_index=True)
+    return js[first], ids
+
+
+def build_structure(bars: tuple[np.ndarray, ...], fractal: int = 2, min_gap_atr: float = 0.1, keep: int = 3) -> _StructureState:
+    """全量计算（向量化）：bars 为 bar_arrays() 的结果，只包含已收盘K线"""
+    t, o, h, l, c, atr = bars
+    k = fractal
+    m = len(c)
+    st = _StructureState(keep)
+    st.count = m
+    if m == 0:
+        return st
+
+    # 后缀最小/最大值：位置 x 之后（含 x）的所有K线，末尾补 ±inf
+    suf_min_l = np.r_[np.minimum.accumulate(l[::-1])[::-1], np.inf]
+    suf_max_h = np.r_[np.maximum.accumulate(h[::-1])[::-1], -np.inf]
+    suf_min_c = np.r_[np.minimum.accumulate(c[::-1])[::-1], np.inf]
+    suf_max_c = np.r_[np.maximum.accumulate(c[::-1])[::-1], -np.inf]
+
+    sh, sl = fractal_swings(h, l, k)
+    up_j, up_sw = _breaks(h, sh, c, k, up=True)
+    dn_j, dn_sw = _breaks(l, sl, c, k, up=False)
+
+    for idx in sh[-keep:]:
+        st.highs.append((int(t[idx]), float(h[idx])))
+    for idx in sl[-keep:]:
+        st.lows.append((int(t[idx]), float(l[idx])))
+    if len(sh):
+        st.swing_high = [int(t[sh[-1]]), float(h[sh[-1]]), bool(len(up_sw) and up_sw[-1] == sh[-1])]
+    if len(sl):
+        st.swing_low = [int(t[sl[-1]]), float(l[sl[-1]]), bool(len(dn_sw) and dn_sw[-1] == sl[-1])]
+
+    # 结构突破与订单块：同一根K线上先多后空
+    last_bear = _last_true(c < o)
+    last_bull = _last_true(c > o)
+    events = sorted(
+        [(int(j), 0, int(s)) for j, s in zip(up_j, up_sw)] + [(int(j), 1, int(s)) for j, s in zip(dn_j, dn_sw)]
+    )
+    for j, side, s in events[-keep:]:
+        st.bos.append((int(t[j]), 1 if side == 0 else -1, float(h[s] if side == 0 else l[s])))
+    for j, side, _ in events:
+        if side == 0:
+            b = last_bear[j - 1]
+            if b >= 0 and suf_min_c[j + 1] >= l[b]:
+                st.obs.append([1, int(t[b]), float(l[b]), float(h[b])])
+        else:
+            b = last_bull[j - 1]
+            if b >= 0 and suf_max_c[j + 1] <= h[b]:
+                st.obs.append([-1, int(t[b]), float(l[b]), float(h[b])])
+
+    # 缺口：按 ATR 过滤过小的缺口；未回补的保留（部分回补时区间收窄）
+    if m >= 3:
+        h2, l2 = h[:-2], l[:-2]
+        h0, l0 = h[2:], l[2:]
+        thr = min_gap_atr * atr[2:]
+        with np.errstate(invalid="ignore"):
+            bull = (l0 > h2) & ((l0 - h2) >= thr)
+            bear = (h0 < l2) & ((l2 - h0) >= thr)
+        for j in np.flatnonzero(bull | bear) + 2:
+            if l[j] > h[j - 2]:
+                bottom, top = h[j - 2], l[j]
+                if suf_min_l[j + 1] > bottom:
+                    st.fvgs.append([1, int(t[j - 1]), float(bottom), float(min(top, suf_min_l[j + 1]))])
+            else:
+                bottom, top = h[j], l[j - 2]
+                if suf_max_h[j + 1] < top:
+                    st.fvgs.append([-1, int(t[j - 1]), float(max(bottom, suf_max_h[j + 1])), float(top)])
+
+    lb, lu = last_bear[-1], last_bull[-1]
+    st.last_bear = (int(t[lb]), float(l[lb]), float(h[lb])) if lb >= 0 else None
+    st.last_bull = (int(t[lu]), float(l[lu]), float(h[lu])) if lu >= 0 else None
+    return st
+
+
+def extend_structure(
+    st: _StructureState,
+    bars: tuple[np.ndarray, ...],
+    start: int,
+    end: int,
+    fractal: int = 2,
+    min_gap_atr: float = 0.1,
+):
+    """增量路径：逐根处理 bars 中 [start, end) 的已收盘K线（与全量路径同一套判定）"""
+    t, o, h, l, c, atr = bars
+    k = fractal
+    for j in range(start, end):
+        tj, oj, hj, lj, cj = int(t[j]), float(o[j]), float(h[j]), float(l[j]), float(c[j])
+
+        # 1) 已有缺口/订单块的回补与失效
+        fvgs = []
+        for item in st.fvgs:
+            if item[0] > 0:
+                if lj <= item[2]:
+                    continue
+                item[3] = min(item[3], lj)
+            else:
+                if hj >= item[3]:
+                    continue
+                item[2] = max(item[2], hj)
+            fvgs.append(item)
+        st.fvgs = fvgs
+        st.obs = [ob for ob in st.obs if not (cj < ob[2] if ob[0] > 0 else cj > ob[3])]
+
+        # 2) 结构突破 + 订单块
+        sh, sl = st.swing_high, st.swing_low
+        if sh is not None and not sh[2] and cj > sh[1]:
+            sh[2] = True
+            st.bos.append((tj, 1, sh[1]))
+            if st.last_bear is not None:
+                st.obs.append([1, st.last_bear[0], st.last_bear[1], st.last_bear[2]])
+        if sl is not None and not sl[2] and cj < sl[1]:
+            sl[2] = True
+            st.bos.append((tj, -1, sl[1]))
+            if st.last_bull is not None:
+                st.obs.append([-1, st.last_bull[0], st.last_bull[1], st.last_bull[2]])
+
+        # 3) 新缺口
+        if st.count >= 2:
+            thr = min_gap_atr * float(atr[j])
+            if lj > h[j - 2] and (lj - h[j - 2]) >= thr:
+                st.fvgs.append([1, int(t[j - 1]), float(h[j - 2]), lj])
+            elif hj < l[j - 2] and (l[j - 2] - hj) >= thr:
+                st.fvgs.append([-1, int(t[j - 1]), hj, float(l[j - 2])])
+
+        # 4) 第 j 根收盘后确认 j-k 处的分形
+        if st.count >= 2 * k:
+            i = j - k
+            if h[i] > h[i - k:i].max() and h[i] >= h[i + 1:j + 1].max():
+                st.swing_high = [int(t[i]), float(h[i]), False]
+                st.highs.append((int(t[i]), float(h[i])))
+            if l[i] < l[i - k:i].min() and l[i] <= l[i + 1:j + 1].min():
+                st.swing_low = [int(t[i]), float(l[i]), False]
+                st.lows.append((int(t[i]), float(l[i])))
+
+        if cj < oj:
+            st.last_bear = (tj, lj, hj)
+        elif cj > oj:
+            st.last_bull = (tj, lj, hj)
+        st.count += 1
+
+
+class StructureEngine:
+    """
+    按 (品种, 周期) 保存结构状态：
+    - update(key, df)：实时数据（最后一根为未收盘K线），按时间对齐后只处理新收盘的K线
+    - advance(key, bars, end)：整段数组（回测），处理到第 end 根（不含）为止
+    新增K线超过 rebuild_bars 根或无法对齐时走全量路径。
+    """
+
+    def __init__(self, fractal: int = 2, min_gap_atr: float = 0.1, keep: int = 3, rebuild_bars: int = 500):
+        self.fractal = fractal
+        self.min_gap_atr = min_gap_atr
+        self.keep = keep
+        self.rebuild_bars = rebuild_bars
+        self._states: dict[tuple, _StructureState] = {}
+
+    def reset(self, key: tuple | None = None):
+        if key is None:
+            self._states.clear()
+        else:
+            self._states.pop(key, None)
+
+    def _build(self, bars: tuple[np.ndarray, ...]) -> _StructureState:
+        return build_structure(bars, self.fractal, self.min_gap_atr, self.keep)
+
+    def update(self, key: tuple, df: pd.DataFrame) -> _StructureState:
+        closed = len(df) - 1
+        times = df["time"].to_numpy(dtype="datetime64[ns]")
+        state = self._states.get(key)
+        p = None
+        if state is not None and state.last_time is not None and closed > 0:
+            q = int(np.searchsorted(times[:closed], state.last_time))
+            if q < closed and times[q] == state.last_time and float(df["close"].iat[q]) == state.last_close:
+                p = q
+        bars = bar_arrays(df)
+        if p is not None and p + 1 == closed:
+            return state
+        if p is None or p + 1 < 2 * self.fractal or closed - p - 1 > self.rebuild_bars:
+            state = self._build(tuple(a[:closed] for a in bars))
+        else:
+            extend_structure(state, bars, p + 1, closed, self.fractal, self.min_gap_atr)
+        if closed > 0:
+            state.last_time = times[closed - 1]
+            state.last_close = float(df["close"].iat[closed - 1])
+        self._states[key] = state
+        return state
+
+    def advance(self, key: tuple, bars: tuple[np.ndarray, ...], end: int) -> _StructureState:
+        state = self._states.get(key)
+        if state is None or end < state.count or end - state.count > self.rebuild_bars:
+            state = self._build(tuple(a[:end] for a in bars))
+        elif end > state.count:
+            extend_structure(state, bars, state.count, end, self.fractal, self.min_gap_atr)
+        self._states[key] = state
+        return state
+
+    def verify(self, key: tuple, df: pd.DataFrame) -> bool:
+        """用全量路径重算 df 的已收盘部分并与当前状态比较（df 需与状态覆盖同一段历史）"""
+        state = self._states.get(key)
+        if state is None:
+            return True
+        full = self._build(tuple(a[:len(df) - 1] for a in bar_arrays(df)))
+        return full.count == state.count and full.snapshot() == state.snapshot()
+
+
+# ===============================
+# 文本
+# ===============================
+_ZONE_NAMES = {("fvg", 1): "多头缺口", ("fvg", -1): "空头缺口", ("ob", 1): "多头订单块", ("ob", -1): "空头订单块"}
+
+
+def _time_str(secs: int, tf_name: str) -> str:
+    return pd.Timestamp(secs, unit="s").strftime("%m-%d" if tf_name == "D1" else "%m-%d %H:%M")
+
+
+def nearest_zones(state: _StructureState, price: float, per_side: int = 2) -> dict[str, list[tuple]]:
+    """距当前价最近的有效区间：above/below 各取 per_side 个，inside 为包含当前价的区间"""
+    zones = [("fvg", *z) for z in state.fvgs] + [("ob", *z) for z in state.obs]
+    above = sorted((z for z in zones if z[3] > price), key=lambda z: z[3] - price)
+    below = sorted((z for z in zones if z[4] < price), key=lambda z: price - z[4])
+    inside = [z for z in zones if z[3] <= price <= z[4]]
+    return {"above": above[:per_side], "below": below[:per_side], "inside": inside[-per_side:]}
+
+
+def format_structure_line(tf_name: str, state: _StructureState, price: float, per_side: int = 2) -> str:
+    def zone(z):
+        return f"{_ZONE_NAMES[(z[0], z[1])]} {z[3]:.2f}~{z[4]:.2f}"
+
+    parts = [tf_name]
+    if state.bos:
+        t, side, level = state.bos[-1]
+        parts.append(f"最近结构突破：{'向上' if side > 0 else '向下'} {level:.2f}（{_time_str(t, tf_name)}）")
+    else:
+        parts.append("最近结构突破：无")
+    parts.append("摆动高 " + ("、".join(f"{v:.2f}" for _, v in reversed(state.highs)) or "无"))
+    parts.append("摆动低 " + ("、".join(f"{v:.2f}" for _, v in reversed(state.lows)) or "无"))
+    z = nearest_zones(state, price, per_side)
+    parts.append("上方 " + ("、".join(zone(x) for x in z["above"]) or "无"))
+    parts.append("下方 " + ("、".join(zone(x) for x in z["below"]) or "无"))
+    if z["inside"]:
+        parts.append("当前价位于 " + "、".join(zone(x) for x in z["inside"]))
+    return "｜".join(parts)
+
+
+def format_structure_levels(states: dict[str, _StructureState], price: float, per_side: int = 2) -> str:
+    """写入 Prompt 的结构价位：每个周期一行"""
+    lines = [f"当前价 {price:.2f}（摆动/缺口/订单块均按已收盘K线识别，价位为实际值）"]
+    lines.extend(format_structure_line(tf_name, st, price, per_side) for tf_name, st in states.items())
+    return "\n".join(lines)
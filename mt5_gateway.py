@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+XAUUSD 交易助手 - MT5 网关
+MetaTrader5 模块不是线程安全的：由一个专用工作线程持有长连接，
+所有调用方（任意线程、任意会话）通过队列提交请求并拿到 Future，
+连接断开时按退避策略自动重连。
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
+
+import MetaTrader5 as mt5
+
+
+# last_error() 中表示与终端通讯失败的错误码（RES_E_INTERNAL_FAIL_*），需要重连
+_DISCONNECT_CODES = range(-10005, -9999)
+
+
+class MT5Gateway:
+    """
+    单线程 MT5 网关：
+    - submit(name, *args) -> Future；call(...) 阻塞等待；acall(...) 供协程 await
+    - call_many([(name, *args), ...], timeout)：多个调用一次提交、在网关线程中依次执行，可设超时
+    - 首次请求时连接，之后保持连接；通讯失败时退避重连并重试
+    """
+
+    def __init__(self, mt5_module=None, max_retries: int = 3, backoff: float = 0.5, max_backoff: float = 8.0):
+        self.mt5 = mt5_module or mt5
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+        self.connected = False
+        self.last_error = None
+
+    # ===== 生命周期 =====
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._worker, name="mt5-gateway", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float | None = 5.0):
+        thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+        self._thread = None
+
+    # ===== 提交请求 =====
+    def submit_fn(self, fn, *args, **kwargs) -> Future:
+        """在网关线程中执行任意函数（函数内部可直接使用 mt5 模块）"""
+        self.start()
+        fut: Future = Future()
+        self._queue.put((fn, args, kwargs, fut))
+        return fut
+
+    def submit(self, name: str, *args, **kwargs) -> Future:
+        return self.submit_fn(self._invoke, name, *args, **kwargs)
+
+    def call(self, name: str, *args, **kwargs):
+        return self.submit(name, *args, **kwargs).result()
+
+    def call_many(self, calls: list[tuple], timeout: float | None = None) -> list:
+        """
+        多个只读调用（每项为 (name, *args)）合并为一次提交，返回各调用的结果列表。
+        超时抛出 concurrent.futures.TimeoutError；仍在排队的请求随之取消，不占用网关线程。
+        """
+        fut = self.submit_fn(lambda: [self._invoke(name, *args) for name, *args in calls])
+        try:
+            return fut.result(timeout)
+        except FuturesTimeoutError:
+            fut.cancel()
+            raise
+
+    async def acall(self, name: str, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(name, *args, **kwargs))
+
+    def ensure_connected(self) -> bool:
+        return self.submit_fn(self._connect).result()
+
+    # ===== 工作线程 =====
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            fn, args, kwargs, fut = item
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                fut.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                fut.set_exception(e)
+        if self.connected:
+            self.mt5.shutdown()
+            self.connected = False
+
+    def _connect(self) -> bool:
+        if self.connected:
+            return True
+        delay = self.backoff
+        for attempt in range(self.max_retries):
+            if self.mt5.initialize():
+                self.connected = True
+                self.last_error = None
+                return True
+            self.last_error = self.mt5.last_error()
+            if attempt < self.max_retries - 1:
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+        return False
+
+    def _invoke(self, name: str, *args, **kwargs):
+        fn = getattr(self.mt5, name)
+        result = None
+        for _ in range(self.max_retries):
+            if not self._connect():
+                raise RuntimeError(f"MT5 初始化失败：{self.last_error}")
+            result = fn(*args, **kwargs)
+            if result is not None:
+                return result
+            err = self.mt5.last_error()
+            code = err[0] if isinstance(err, tuple) and err else None
+            if code not in _DISCONNECT_CODES:
+                # 无数据/参数错误等：不是连接问题，直接返回 None
+                return None
+            # 通讯失败：断开后重连再试
+            self.last_error = err
+            self.mt5.shutdown()
+            self.connected = False
+        return result
+
+
+_gateway: MT5Gateway | None = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> MT5Gateway:
+    """进程内共享的 MT5 网关"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = MT5Gateway()
+        return _gateway
@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""
+XAUUSD 交易助手 - 模型输出校验
+- 结构化输出：交易信号与当日行情两条链可按 JSON Schema 输出（OpenAI response_format），界面直接按字段展示
+- 本地校验（毫秒级，不调用模型）：
+  语言：不得出现英文单词（SL/TP/ATR 等约定缩写除外）；
+  价格：输出中的每个价格都必须能在输入数据（各周期K线/预测区间/结构价位/预检事实/当日快照）中找到；
+  结构化输出：字段、类型与取值范围
+- 校验不通过时只重试该条链：在原对话后追加一条简短的更正说明
+- 流式展示：结构化输出逐段到达时，已完整的顶层字段先按展示文本格式渲染，其余字段显示为“…”
+"""
+
+import json
+import re
+
+import numpy as np
+
+
+# 提示词中约定使用的缩写（按字母部分比较，大小写不敏感）
+ALLOWED_LATIN = frozenset({
+    "SL", "TP", "RR", "ATR", "RSI", "EMA", "BOS", "FVG", "OB", "XAUUSD", "USD", "MT", "GPT",
+})
+
+_LATIN = re.compile(r"[A-Za-z]{2,}")
+_NUMBER = re.compile(r"(?<![\d.])\d+(?:\.\d+)?(?![\d.])")
+# 日期/时刻中的数字（年份可能落在价格范围内）不参与价格检查
+_DATETIME = re.compile(r"\d{4}[-/.]\d{1,2}[-/.]\d{1,2}|\d{1,2}:\d{2}(?::\d{2})?")
+
+
+class OutputRules:
+    def __init__(
+        self,
+        price_band: float = 0.15,
+        price_tolerance_pct: float = 0.025,
+        allowed_latin: frozenset = ALLOWED_LATIN,
+        max_retries: int = 1,
+        max_listed: int = 8,
+    ):
+        # 与当前价相差 price_band（比例）以内的数字视为价格，其余（RSI/置信度/百分比/时间）不检查
+        self.price_band = price_band
+        # 价格与输入数据中最近的数值相差不超过当前价的 price_tolerance_pct%（黄金约 0.5 美元）即视为有依据
+        self.price_tolerance_pct = price_tolerance_pct
+        self.allowed_latin = allowed_latin
+        # 校验不通过时该条链最多重试的次数
+        self.max_retries = max_retries
+        # 更正说明中最多列出的问题数
+        self.max_listed = max_listed
+
+
+# ===============================
+# JSON Schema
+# ===============================
+_PRICE = {"type": ["number", "null"]}
+_TEXTS = {"type": "array", "items": {"type": "string"}}
+
+
+def _object(properties: dict) -> dict:
+    # OpenAI 严格模式要求列出全部字段且不允许额外字段
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+
+TRADING_SCHEMA = _object({
+    "signal": {"type": "string", "enum": ["买入", "卖出", "不交易"]},
+    "reasons": _TEXTS,
+    "entry_low": _PRICE,
+    "entry_high": _PRICE,
+    "sl": _PRICE,
+    "tp1": _PRICE,
+    "tp2": _PRICE,
+    "tp3": _PRICE,
+    "trigger": {"type": "string"},
+    "invalidation": {"type": "string"},
+    "risks": _TEXTS,
+    "confidence": {"type": "integer"},
+    "confidence_basis": {"type": "string"},
+})
+
+_PLAN = _object({
+    "name": {"type": "string"},
+    "direction": {"type": "string", "enum": ["做多", "做空", "不交易"]},
+    "entry_low": _PRICE,
+    "entry_high": _PRICE,
+    "sl": _PRICE,
+    "tp1": _PRICE,
+    "tp2": _PRICE,
+    "trigger": {"type": "string"},
+    "invalidation": {"type": "string"},
+})
+
+DAILY_SCHEMA = _object({
+    "overview": _TEXTS,
+    "technical": _TEXTS,
+    "resistance": {"type": "array", "items": {"type": "number"}},
+    "support": {"type": "array", "items": {"type": "number"}},
+    "plans": {"type": "array", "items": _PLAN},
+    "risks": _TEXTS,
+    "confidence": {"type": "integer"},
+    "confidence_basis": {"type": "string"},
+})
+
+SCHEMAS = {"trading": TRADING_SCHEMA, "daily": DAILY_SCHEMA}
+PRICE_FIELDS = ("entry_low", "entry_high", "sl", "tp1", "tp2", "tp3")
+
+
+def response_format(name: str) -> dict:
+    """OpenAI response_format 参数（json_schema 严格模式）"""
+    return {"type": "json_schema", "json_schema": {"name": f"{name}_output", "schema": SCHEMAS[name], "strict": True}}
+
+
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+def schema_errors(value, schema: dict, path: str = "$") -> list[str]:
+    """按上面用到的 JSON Schema 子集（type/enum/properties/required/additionalProperties/items）校验"""
+    types = schema.get("type")
+    if types is not None:
+        types = types if isinstance(types, list) else [types]
+        ok = any(
+            isinstance(value, _JSON_TYPES[t]) and not (isinstance(value, bool) and t in ("integer", "number"))
+            for t in types
+        )
+        if not ok:
+            return [f"{path} 类型应为 {'/'.join(types)}"]
+    if "enum" in schema and value not in schema["enum"]:
+        return [f"{path} 取值应为 {'/'.join(schema['enum'])}"]
+
+    errors = []
+    if isinstance(value, dict):
+        props = schema.get("properties", {})
+        errors += [f"{path}.{k} 缺失" for k in schema.get("required", []) if k not in value]
+        if schema.get("additionalProperties") is False:
+            errors += [f"{path}.{k} 不是约定字段" for k in value if k not in props]
+        for k, sub in props.items():
+            if k in value:
+                errors += schema_errors(value[k], sub, f"{path}.{k}")
+    elif isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            errors += schema_errors(item, schema["items"], f"{path}[{i}]")
+    return errors
+
+
+def parse_json_output(text: str, name: str) -> tuple[dict | None, list[str]]:
+    """解析结构化输出（容忍 ```json 代码块包裹），返回 (数据, 问题列表)"""
+    body = (text or "").strip()
+    if body.startswith("```"):
+        body = body.strip("`")
+        body = body[4:] if body[:4].lower() == "json" else body
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None, ["输出不是合法的 JSON"]
+    errors = schema_errors(data, SCHEMAS[name])
+    if not errors and not 0 <= data["confidence"] <= 100:
+        errors.append("$.confidence 应在 0-100 之间")
+    return (data if not errors else None), errors
+
+
+# ===============================
+# 校验
+# ===============================
+def latin_words(text: str, allowed: frozenset = ALLOWED_LATIN) -> list[str]:
+    """约定缩写以外的英文单词（去重，保持出现顺序）"""
+    words = (w for w in _LATIN.findall(text or "") if w.upper() not in allowed)
+    return list(dict.fromkeys(words))
+
+
+def price_numbers(text: str, price: float, band: float) -> list[float]:
+    """文本中落在当前价 ±band 比例内的数字（视为价格）"""
+    lo, hi = price * (1 - band), price * (1 + band)
+    text = _DATETIME.sub(" ", text or "")
+    return [v for v in map(float, _NUMBER.findall(text)) if lo <= v <= hi]
+
+
+def grounding_set(texts, values=()) -> np.ndarray:
+    """输入数据中出现的全部数值（文本中的数字 + 直接给出的数组），排序去重"""
+    nums = np.asarray([float(x) for t in texts for x in _NUMBER.findall(_DATETIME.sub(" ", t or ""))], dtype=np.float64)
+    allowed = np.concatenate([nums, *(np.asarray(v, dtype=np.float64).ravel() for v in values)])
+    allowed = allowed[np.isfinite(allowed)]
+    return np.unique(np.round(allowed, 2))
+
+
+def ungrounded(prices, allowed: np.ndarray, tolerance: float) -> list[float]:
+    """找不到依据的价格：与 allowed（已排序）中最近的数值相差超过 tolerance"""
+    p = np.asarray(prices, dtype=np.float64)
+    if len(p) == 0:
+        return []
+    if len(allowed) == 0:
+        bad = p
+    else:
+        i = np.searchsorted(allowed, p)
+        below = allowed[np.clip(i - 1, 0, len(allowed) - 1)]
+        above = allowed[np.clip(i, 0, len(allowed) - 1)]
+        bad = p[np.minimum(np.abs(p - below), np.abs(above - p)) > tolerance]
+    return list(dict.fromkeys(bad.tolist()))
+
+
+def _strings(value):
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _strings(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from _strings(v)
+
+
+def _structured_prices(data: dict) -> list[float]:
+    prices = [data[k] for k in PRICE_FIELDS if data.get(k) is not None]
+    prices += data.get("resistance", []) + data.get("support", [])
+    for plan in data.get("plans", []):
+        prices += [plan[k] for k in PRICE_FIELDS if plan.get(k) is not None]
+    return prices
+
+
+def validate_output(
+    name: str,
+    text: str,
+    allowed: np.ndarray,
+    price: float,
+    rules: OutputRules,
+    structured: bool = False,
+) -> dict:
+    """
+    返回 {"ok", "issues", "data"}：issues 为中文问题描述，data 为结构化输出解析后的字典（文本模式为 None）。
+    """
+    issues: list[str] = []
+    data = None
+    if structured:
+        data, errors = parse_json_output(text, name)
+        issues += errors[:rules.max_listed]
+        strings = list(_strings(data)) if data is not None else []
+        prices = _structured_prices(data) if data is not None else []
+        for s in strings:
+            prices += price_numbers(s, price, rules.price_band)
+    else:
+        strings = [text]
+        prices = price_numbers(text, price, rules.price_band)
+
+    words = latin_words("\n".join(strings), rules.allowed_latin)
+    if words:
+        issues.append("出现英文：" + "、".join(words[:rules.max_listed]))
+    bad = ungrounded(prices, allowed, price * rules.price_tolerance_pct / 100)
+    if bad:
+        issues.append("以下价格在给定数据中找不到：" + "、".join(f"{p:g}" for p in bad[:rules.max_listed]))
+    return {"ok": not issues, "issues": issues, "data": data}
+
+
+def correction_message(issues: list[str], structured: bool) -> str:
+    """重试时追加的更正说明（尽量短，只说明问题）"""
+    lines = "\n".join(f"- {i}" for i in issues)
+    fmt = "按给定 JSON Schema 重新输出完整 JSON" if structured else "按原输出格式重新输出完整回答"
+    return (
+        f"上一次回答未通过校验：\n{lines}\n"
+        f"请只修正以上问题：价格只能使用输入数据中出现的数值，全部使用简体中文；{fmt}。"
+    )
+
+
+# ===============================
+# 结构化输出 -> 展示文本（与文本模式的输出格式一致，信号解析与界面无需区分）
+# ===============================
+def _p(v) -> str:
+    return "—" if v is None else f"{v:g}"
+
+
+def render_trading(d: dict) -> str:
+    reasons = "\n".join(f"- {r}" for r in d["reasons"])
+    risks = "\n".join(f"- {r}" for r in d["risks"])
+    lines = [f"交易信号：{d['signal']}", f"理由（要点列表）：\n{reasons}"]
+    if d["entry_low"] is not None and d["entry_high"] is not None:
+        lines.append(f"入场区间：{_p(d['entry_low'])} ~ {_p(d['entry_high'])}")
+    for key, label in (("sl", "止损SL"), ("tp1", "止盈TP1"), ("tp2", "止盈TP2"), ("tp3", "止盈TP3")):
+        if d[key] is not None:
+            lines.append(f"{label}：{_p(d[key])}")
+    lines += [
+        f"执行条件：{d['trigger']}",
+        f"无效条件：{d['invalidation']}",
+        f"风险提示：\n{risks}",
+        f"置信度：{d['confidence']}（{d['confidence_basis']}）",
+    ]
+    return "\n".join(lines)
+
+
+def render_daily(d: dict) -> str:
+    def bullets(items):
+        return "\n".join(f"- {x}" for x in items)
+
+    parts = [
+        "一、今日概览\n" + bullets(d["overview"]),
+        "二、技术面分析（简明）\n" + bullets(d["technical"]),
+        "三、关键价位\n"
+        f"- 关键阻力：{'、'.join(_p(v) for v in d['resistance']) or '—'}\n"
+        f"- 关键支撑：{'、'.join(_p(v) for v in d['support']) or '—'}",
+    ]
+    plans = []
+    for plan in d["plans"]:
+        entry = f"{_p(plan['entry_low'])} ~ {_p(plan['entry_high'])}" if plan["entry_low"] is not None else "—"
+        plans.append(
+            f"{plan['name']}\n"
+            f"- 方向：{plan['direction']}\n"
+            f"- 入场区间：{entry}\n"
+            f"- 止损SL：{_p(plan['sl'])}\n"
+            f"- 止盈TP1/TP2：{_p(plan['tp1'])} / {_p(plan['tp2'])}\n"
+            f"- 触发条件：{plan['trigger']}\n"
+            f"- 无效条件：{plan['invalidation']}"
+        )
+    parts.append("四、交易计划\n" + "\n\n".join(plans))
+    parts.append("五、风险提示\n" + bullets(d["risks"]))
+    parts.append(f"最后：置信度 {d['confidence']}（{d['confidence_basis']}）")
+    return "\n\n".join(parts)
+
+
+RENDERERS = {"trading": render_trading, "daily": render_daily}
+
+
+# ===============================
+# 流式输出中的部分 JSON
+# ===============================
+_DECODER = json.JSONDecoder()
+_PENDING = "…"
+
+
+def _skip(text: str, i: int, chars: str = " \t\r\n") -> int:
+    while i < len(text) and text[i] in chars:
+        i += 1
+    return i
+
+
+def partial_json_fields(text: str) -> dict:
+    """尚未输出完的 JSON 对象中已经完整的顶层字段（末尾可能还在输出的数字不计入）"""
+    start = (text or "").find("{")
+    if start < 0:
+        return {}
+    out = {}
+    i = start + 1
+    while True:
+        i = _skip(text, i, " \t\r\n,")
+        if i >= len(text) or text[i] != '"':
+            return out
+        try:
+            key, i = _DECODER.raw_decode(text, i)
+            i = _skip(text, i)
+            if i >= len(text) or text[i] != ":":
+                return out
+            i = _skip(text, i + 1)
+            value, i = _DECODER.raw_decode(text, i)
+        except ValueError:
+            return out
+        if i >= len(text):
+            return out
+        out[key] = value
+
+
+def _pending(schema: dict):
+    types = schema.get("type")
+    types = types if isinstance(types, list) else [types]
+    if "array" in types:
+        return []
+    return None if "null" in types else _PENDING
+
+
+def render_partial(name: str, fields: dict) -> str:
+    """按展示文本格式渲染已完整的字段，未到达的字段显示为“…”（类型不符的字段同样视为未到达）"""
+    props = SCHEMAS[name]["properties"]
+    d = {
+        k: fields[k] if k in fields and not schema_errors(fields[k], sub) else _pending(sub)
+        for k, sub in props.items()
+    }
+    return RENDERERS[name](d)
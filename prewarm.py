@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+XAUUSD 交易助手 - 启动预热
+启动器与 Streamlit 在同一进程内运行：
+- 启动器在打开浏览器的同时，后台线程导入分析模块（pandas/langchain/openai/MetaTrader5）、创建 bot 并连接 MT5；
+- 页面只导入轻量模块并持有 BotHandle：渲染页面不需要 bot，分析任务/自动刷新在各自线程中首次访问 bot 时
+  才通过 get_bot() 取用预热好的实例（仍在预热则等待，未预热则当场创建）；
+- 记录各重依赖的导入耗时与预热各阶段耗时，启动器打印；页面首次渲染完成时把启动到可交互的总耗时交给启动器的回调。
+本模块只使用标准库，导入不增加启动时间。
+"""
+
+import importlib
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+
+# 分析历史（页面直接只读打开，显示上一次结果与最近信号时不需要 bot）
+HISTORY_PATH = ".cache/history.sqlite"
+
+# 页面使用的 bot 参数（预热与页面必须一致，否则页面会另建一个 bot）
+BOT_OPTIONS = {"structured_output": True, "history_path": HISTORY_PATH}
+
+# 按依赖顺序导入，单独计时（后面的模块已包含前面的耗时之外的部分）
+HEAVY_MODULES = (
+    "numpy",
+    "pandas",
+    "MetaTrader5",
+    "langchain_core.prompts",
+    "openai",
+    "langchain_openai",
+    "XAUSD_AI_openai_zh",
+)
+
+# 启动器开始运行的时间（time.time()），由启动器写入环境变量，用于计算启动到可交互的耗时
+LAUNCH_TIME_ENV = "XAU_LAUNCH_TIME"
+
+_lock = threading.Lock()
+_future: Future | None = None
+_key: tuple | None = None
+_timings: dict[str, float] = {}
+_profile: list[dict] = []
+_interactive_ms: float | None = None
+_report = None
+
+
+def import_profile(modules=HEAVY_MODULES) -> list[dict]:
+    """逐个导入并计时：[{"module", "ms", "error"}]；已导入的模块耗时约为 0"""
+    rows = []
+    for name in modules:
+        t0 = time.perf_counter()
+        error = None
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        rows.append({"module": name, "ms": round((time.perf_counter() - t0) * 1000, 1), "error": error})
+    return rows
+
+
+def format_profile(rows: list[dict]) -> str:
+    lines = [f"  {r['module']:<24}{r['ms']:>9.1f} ms" + (f"  （失败：{r['error']}）" if r["error"] else "") for r in rows]
+    lines.append(f"  {'合计':<22}{sum(r['ms'] for r in rows):>9.1f} ms")
+    return "\n".join(lines)
+
+
+def _build(fut: Future, api_key: str, options: dict, connect: bool, symbol: str | None, report):
+    try:
+        t0 = time.perf_counter()
+        _profile[:] = import_profile()
+        _timings["imports_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+
+        from XAUSD_AI_openai_zh import XAUUSDTradingBot
+
+        t1 = time.perf_counter()
+        bot = XAUUSDTradingBot(api_key=api_key, **options)
+        _timings["bot_ms"] = round((time.perf_counter() - t1) * 1000, 1)
+
+        if connect:
+            t2 = time.perf_counter()
+            try:
+                bot.initialize_mt5()
+            except Exception as e:
+                # MT5 未启动时页面照常打开，首次分析时再按退避重连
+                _timings["mt5_error"] = str(e)
+            _timings["mt5_ms"] = round((time.perf_counter() - t2) * 1000, 1)
+        if symbol is not None:
+            bot.warm_start(symbol)
+        _timings["total_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    except BaseException as e:
+        fut.set_exception(e)
+        if report is not None:
+            report(f"预热失败：{type(e).__name__}: {e}")
+        return
+    fut.set_result(bot)
+    if report is not None:
+        report(summary())
+
+
+def start(
+    api_key: str,
+    options: dict | None = None,
+    connect: bool = True,
+    symbol: str | None = "XAUUSD",
+    report=None,
+) -> Future:
+    """
+    在后台线程创建 bot（同一进程只创建一次），返回 Future。
+    connect：同时连接 MT5；symbol：从分析历史恢复该品种上次的结论；report(文本)：预热完成后回调（启动器用于打印）。
+    """
+    global _future, _key, _report
+    options = dict(BOT_OPTIONS if options is None else options)
+    with _lock:
+        if report is not None:
+            _report = report
+        if _future is None:
+            _future = Future()
+            _key = (api_key, tuple(sorted(options.items())))
+            threading.Thread(
+                target=_build, args=(_future, api_key, options, connect, symbol, report),
+                name="bot-prewarm", daemon=True,
+            ).start()
+        return _future
+
+
+def get_bot(api_key: str, options: dict | None = None):
+    """取预热好的 bot；参数与预热时不同（或预热失败）时当场创建"""
+    options = dict(BOT_OPTIONS if options is None else options)
+    fut = start(api_key, options, connect=False)
+    if _key == (api_key, tuple(sorted(options.items()))):
+        try:
+            return fut.result()
+        except Exception:
+            pass
+    from XAUSD_AI_openai_zh import XAUUSDTradingBot
+
+    return XAUUSDTradingBot(api_key=api_key, **options)
+
+
+def is_ready() -> bool:
+    return _future is not None and _future.done()
+
+
+class BotHandle:
+    """
+    页面持有的 bot 句柄：首次访问 bot 的属性时才调用 get_bot()（导入 pandas/langchain/MetaTrader5 并创建 bot）。
+    交给后台任务与自动刷新调度器使用，重依赖在这些线程中首次需要时加载，页面渲染不等待。
+    """
+
+    def __init__(self, api_key: str, options: dict | None = None):
+        self._api_key = api_key
+        self._options = options
+        self._bot = None
+
+    @property
+    def ready(self) -> bool:
+        return self._bot is not None or is_ready()
+
+    def get(self):
+        if self._bot is None:
+            self._bot = get_bot(self._api_key, self._options)
+        return self._bot
+
+    def warm_up(self):
+        """后台开始预热（不等待）"""
+        start(self._api_key, self._options, connect=False)
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def summary() -> str:
+    """预热各阶段耗时（启动器打印）"""
+    t = _timings
+    lines = ["预热完成：", format_profile(_profile), f"  创建 bot {t.get('bot_ms', 0):.1f} ms"]
+    if "mt5_ms" in t:
+        lines.append(f"  连接 MT5 {t['mt5_ms']:.1f} ms" + (f"（失败：{t['mt5_error']}）" if "mt5_error" in t else ""))
+    lines.append(f"  预热合计 {t.get('total_ms', 0):.1f} ms")
+    return "\n".join(lines)
+
+
+def mark_interactive() -> float | None:
+    """页面首次渲染完成时调用：返回启动器开始运行到此刻的耗时（毫秒），并交给启动器的回调输出；之后的调用直接返回首次的值"""
+    global _interactive_ms
+    with _lock:
+        if _interactive_ms is not None:
+            return _interactive_ms
+        launched = os.environ.get(LAUNCH_TIME_ENV)
+        if not launched:
+            return None
+        _interactive_ms = round((time.time() - float(launched)) * 1000, 1)
+    if _report is not None:
+        _report(f"启动到页面可交互：{_interactive_ms / 1000:.2f} 秒")
+    return _interactive_ms
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+XAUUSD 交易助手 - 紧凑行情编码
+把多周期K线块编码为更省 token 的表格：每块只写一次表头，价格类列写成相对基准价的差值，
+精度可调、列可裁剪；给定 token 预算时自动为各周期选择窗口长度。
+token 计数优先使用 tiktoken（可选依赖），未安装或无法加载编码表时按字符估算。
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+
+COMPACT_COLUMNS = ("open", "high", "low", "close", "rsi", "ema_20", "ema_50", "ema_200", "atr")
+PRICE_LIKE = ("open", "high", "low", "close", "ema_20", "ema_50", "ema_200")
+_LABELS = {
+    "open": "O",
+    "high": "H",
+    "low": "L",
+    "close": "C",
+    "rsi": "RSI",
+    "ema_20": "E20",
+    "ema_50": "E50",
+    "ema_200": "E200",
+    "atr": "ATR",
+}
+
+# 超出预算时依次缩短的周期（入场周期 M5 与大方向 D1 最后才缩短）
+REDUCE_ORDER = ("M30", "H4", "H1", "M15", "D1", "M5")
+
+
+# ===============================
+# token 计数
+# ===============================
+_encoder = None
+_encoder_loaded = False
+
+
+def _get_encoder():
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        _encoder_loaded = True
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoder = None
+    return _encoder
+
+
+def count_tokens(text: str) -> int:
+    enc = _get_encoder()
+    if enc is not None:
+        return len(enc.encode(text))
+    # 估算：中日韩字符约 1 token/字，其余约 3.5 字符/token
+    cjk = sum(1 for ch in text if 0x3000 <= ord(ch) <= 0x9FFF or 0xFF00 <= ord(ch) <= 0xFFEF)
+    return cjk + math.ceil((len(text) - cjk) / 3.5)
+
+
+def token_counter_name() -> str:
+    return "tiktoken/o200k_base" if _get_encoder() is not None else "estimate"
+
+
+# ===============================
+# 编码
+# ===============================
+def format_compact_block(
+    df: pd.DataFrame,
+    tf_name: str,
+    n: int = 10,
+    ref_price: float | None = None,
+    precision: int = 1,
+    columns: tuple[str, ...] = COMPACT_COLUMNS,
+) -> str:
+    """
+    最近 n 根K线的紧凑表格。ref_price 不为 None 时，价格类列（OHLC/EMA）写成相对 ref_price 的差值；
+    RSI 取整，ATR 按 precision 保留小数。
+    """
+    recent = df.tail(n)
+    time_fmt = "%m-%d" if tf_name == "D1" else "%m-%d %H:%M"
+    cols = [np.asarray(recent["time"].dt.strftime(time_fmt), dtype=str)]
+    for col in columns:
+        vals = recent[col].to_numpy(dtype=np.float64)
+        if col == "rsi":
+            cols.append(np.char.mod("%.0f", vals))
+        elif col in PRICE_LIKE and ref_price is not None:
+            cols.append(np.char.mod(f"%+.{precision}f", vals - ref_price))
+        else:
+            cols.append(np.char.mod(f"%.{precision}f", vals))
+
+    note = f"价格列=相对{ref_price:.2f}的差值" if ref_price is not None else "价格为实际值"
+    header = f"{tf_name} 最近{len(recent)}根（{note}）\n时间," + ",".join(_LABELS[c] for c in columns)
+    rows = [",".join(parts) for parts in zip(*cols)]
+    return "\n".join([header, *rows])
+
+
+def reference_price(dfs: dict[str, pd.DataFrame]) -> float:
+    """基准价：最细周期的最新收盘价，取到整数美元，便于模型还原实际价格"""
+    finest = dfs["M5"] if "M5" in dfs else next(iter(dfs.values()))
+    return float(round(finest["close"].iat[-1]))
+
+
+def encode_market_blocks(
+    dfs: dict[str, pd.DataFrame],
+    windows: dict[str, int],
+    relative: bool = True,
+    precision: int = 1,
+    columns: tuple[str, ...] = COMPACT_COLUMNS,
+) -> dict[str, str]:
+    ref = reference_price(dfs) if relative else None
+    return {
+        tf_name: format_compact_block(df, tf_name, windows[tf_name], ref, precision, columns)
+        for tf_name, df in dfs.items()
+    }
+
+
+def fit_windows(
+    dfs: dict[str, pd.DataFrame],
+    budget: int | None,
+    max_n: int = 10,
+    min_n: int = 3,
+    **encode_kwargs,
+) -> tuple[dict[str, int], dict[str, str], int]:
+    """
+    在 token 预算内为各周期选择窗口长度：从 max_n 开始，按 REDUCE_ORDER 轮流缩短，直到总 token ≤ budget
+    或全部到达 min_n。返回 (窗口长度, 编码后的文本, 总 token 数)。
+    """
+    windows = {tf_name: max_n for tf_name in dfs}
+    blocks = encode_market_blocks(dfs, windows, **encode_kwargs)
+    total = sum(count_tokens(b) for b in blocks.values())
+    if budget is None:
+        return windows, blocks, total
+
+    order = [tf for tf in REDUCE_ORDER if tf in dfs] + [tf for tf in dfs if tf not in REDUCE_ORDER]
+    while total > budget:
+        candidates = [tf for tf in order if windows[tf] > min_n]
+        if not candidates:
+            break
+        # 先缩短当前最长的窗口，长度相同时按 REDUCE_ORDER
+        longest = max(windows[tf] for tf in candidates)
+        tf_name = next(tf for tf in candidates if windows[tf] == longest)
+        windows[tf_name] -= 1
+        blocks = encode_market_blocks(dfs, windows, **encode_kwargs)
+        total = sum(count_tokens(b) for b in blocks.values())
+    return windows, blocks, total
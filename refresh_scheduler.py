@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+XAUUSD 交易助手 - 自动刷新调度
+按事件决定是否重新分析，代替固定 30 分钟重跑：
+- 指定周期（默认 M5/M15/H1）有新K线收盘
+- 价格相对上次分析价移动超过 ATR 的一定比例
+- 点差从异常放大恢复正常
+- 距上次分析超过最长间隔（可选）
+触发后由调用方以 reuse_unchanged=True 运行分析：量化输入不变时不会重新调用 LLM。
+检查时的 MT5 查询（各周期收盘时间 + 最新报价）经 bot.refresh_probe 合并为一次网关提交并设超时，不阻塞页面片段/调度线程。
+"""
+
+import threading
+import time
+from datetime import datetime
+
+
+class RefreshPolicy:
+    def __init__(
+        self,
+        bar_timeframes: tuple[str, ...] = ("M5", "M15", "H1"),
+        atr_timeframe: str = "M15",
+        atr_fraction: float = 0.5,
+        spread_wide_factor: float = 2.0,
+        spread_wide_points: float | None = None,
+        min_interval: float = 60.0,
+        max_interval: float | None = None,
+        probe_timeout: float = 5.0,
+    ):
+        # bar_timeframes：收盘即触发的周期；空元组表示不按K线收盘触发
+        self.bar_timeframes = bar_timeframes
+        # 价格移动 >= atr_fraction × ATR(atr_timeframe) 时触发；None 表示关闭
+        self.atr_timeframe = atr_timeframe
+        self.atr_fraction = atr_fraction
+        # 点差 > spread_wide_points（或 > 滚动均值 × spread_wide_factor）视为异常，恢复后触发
+        self.spread_wide_factor = spread_wide_factor
+        self.spread_wide_points = spread_wide_points
+        # 两次分析（或两次触发，含首次）的最短间隔（防抖），以及可选的最长间隔
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        # 一次检查中 MT5 查询的最长等待（秒），超时视为无触发
+        self.probe_timeout = probe_timeout
+
+
+class RefreshScheduler:
+    """
+    单品种调度器（线程安全，可在多个会话间共享）：
+    - check()：返回触发原因列表，空列表表示无需刷新
+    - mark_analysed(result)：分析完成后记录参照值（result["refresh_anchor"]）
+    result_cache：共享结果缓存；还没有参照值时先采用其中该品种最近一次的结果，不再无条件触发“首次分析”
+    """
+
+    def __init__(self, bot, symbol: str, policy: RefreshPolicy | None = None, result_cache=None):
+        self.bot = bot
+        self.symbol = symbol
+        self.policy = policy or RefreshPolicy()
+        self.result_cache = result_cache
+        self._lock = threading.Lock()
+        self.anchor: dict | None = None
+        self.last_run_at: float | None = None
+        self.last_triggered_at: float | None = None
+        self.last_reasons: list[str] = []
+        self._spread_was_wide = False
+        self._spread_recovered = False
+
+    def mark_analysed(self, result: dict):
+        with self._lock:
+            self._adopt(result, time.monotonic())
+
+    def _adopt(self, result: dict, run_at: float):
+        self.anchor = result.get("refresh_anchor")
+        self.last_run_at = run_at
+        self._spread_recovered = False
+
+    def _adopt_latest(self):
+        # 其他会话/进程已分析过：沿用共享缓存中最近一次结果的参照值，上次分析时间按结果时间戳折算
+        latest = self.result_cache.latest(self.symbol) if self.result_cache is not None else None
+        if latest is None or latest.get("refresh_anchor") is None:
+            return
+        try:
+            age = max(0.0, (datetime.now() - datetime.fromisoformat(latest["timestamp"])).total_seconds())
+        except (KeyError, TypeError, ValueError):
+            age = 0.0
+        with self._lock:
+            if self.anchor is None:
+                self._adopt(latest, time.monotonic() - age)
+
+    def _spread_is_wide(self, spread: dict | None) -> bool:
+        if not spread or spread.get("last") is None:
+            return False
+        p = self.policy
+        if p.spread_wide_points is not None:
+            return spread["last"] > p.spread_wide_points
+        return spread["count"] >= 20 and spread["last"] > spread["mean"] * p.spread_wide_factor
+
+    def _spread_stats(self, probe: dict) -> dict | None:
+        # 当前点差取本次查询的报价，均值/样本数取实时状态中的滚动统计（只读，不拉取 tick）
+        feed = self.bot.live_feed(self.symbol) if getattr(self.bot, "live_ticks", False) else None
+        stats = feed.state.summary()["spread"] if feed is not None else None
+        if probe["spread"] is None:
+            return stats
+        return {"count": 0, "mean": 0.0, **(stats or {}), "last": probe["spread"]}
+
+    def _trigger(self, reasons: list[str]) -> list[str]:
+        with self._lock:
+            self.last_triggered_at = time.monotonic()
+            self.last_reasons = reasons
+        return reasons
+
+    def check(self) -> list[str]:
+        p = self.policy
+        if self.anchor is None:
+            self._adopt_latest()
+        with self._lock:
+            anchor, last_run_at, last_triggered_at = self.anchor, self.last_run_at, self.last_triggered_at
+
+        # 防抖：距上次分析或上次触发（含首次分析）不足 min_interval 时不检查，也不查询 MT5
+        now = time.monotonic()
+        since = [t for t in (last_run_at, last_triggered_at) if t is not None]
+        if since and now - max(since) < p.min_interval:
+            return []
+        if anchor is None:
+            return self._trigger(["首次分析"])
+
+        probe = self.bot.refresh_probe(self.symbol, p.bar_timeframes, timeout=p.probe_timeout)
+        if probe is None:
+            return []
+
+        reasons = []
+        wide = self._spread_is_wide(self._spread_stats(probe))
+        with self._lock:
+            if self._spread_was_wide and not wide:
+                self._spread_recovered = True
+            self._spread_was_wide = wide
+            if self._spread_recovered:
+                reasons.append("点差恢复正常")
+
+        for tf_name in p.bar_timeframes:
+            t = probe["closed_bar_time"].get(tf_name)
+            if t is not None and t != anchor["closed_bar_time"].get(tf_name):
+                reasons.append(f"{tf_name} K线收盘")
+
+        if p.atr_fraction is not None and probe["bid"] is not None:
+            atr = anchor["atr"].get(p.atr_timeframe)
+            move = abs(probe["bid"] - anchor["price"])
+            if atr and move >= p.atr_fraction * atr:
+                reasons.append(f"价格移动 {move:.2f}（≥ {p.atr_fraction}×{p.atr_timeframe} ATR）")
+
+        elapsed = now - last_run_at if last_run_at is not None else float("inf")
+        if p.max_interval is not None and elapsed >= p.max_interval:
+            reasons.append("超过最长刷新间隔")
+
+        # 点差仍异常时不刷新（等恢复后再分析，避免在异常报价上给信号）
+        if wide or not reasons:
+            return []
+        return self._trigger(reasons)
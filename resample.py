@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+XAUUSD 交易助手 - 本地周期合成
+只拉取最细周期（M5 或 M1），按服务器时区的整点/零点边界向量化合成 M15/M30/H1/H4/D1，
+并提供与券商自身高周期K线的一致性校验。
+"""
+
+import numpy as np
+import pandas as pd
+
+
+TF_SECONDS = {
+    "M1": 60,
+    "M5": 300,
+    "M15": 900,
+    "M30": 1800,
+    "H1": 3600,
+    "H4": 14400,
+    "D1": 86400,
+}
+
+PRICE_COLUMNS = ("open", "high", "low", "close")
+
+
+def resample_ohlc(df: pd.DataFrame, tf_name: str) -> pd.DataFrame:
+    """
+    把细周期K线合成为 tf_name 周期。
+    MT5 的K线时间是按服务器时区编码的秒数，直接按周期秒数取整即可对齐券商的日/小时边界。
+    """
+    secs = TF_SECONDS[tf_name]
+    t = df["time"].to_numpy(dtype="datetime64[s]").astype(np.int64)
+    if len(t) == 0:
+        return df.iloc[0:0].copy()
+
+    bucket = t - t % secs
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(t)] - 1
+
+    out = {
+        "time": pd.to_datetime(bucket[starts], unit="s"),
+        "open": df["open"].to_numpy()[starts],
+        "high": np.maximum.reduceat(df["high"].to_numpy(), starts),
+        "low": np.minimum.reduceat(df["low"].to_numpy(), starts),
+        "close": df["close"].to_numpy()[ends],
+    }
+    if "tick_volume" in df:
+        out["tick_volume"] = np.add.reduceat(df["tick_volume"].to_numpy(), starts)
+    if "spread" in df:
+        # MT5 K线中的点差为该K线内的最小点差
+        out["spread"] = np.minimum.reduceat(df["spread"].to_numpy(), starts)
+    if "real_volume" in df:
+        out["real_volume"] = np.add.reduceat(df["real_volume"].to_numpy(), starts)
+    return pd.DataFrame(out)
+
+
+def compare_bars(derived: pd.DataFrame, broker: pd.DataFrame, tol: float = 0.01) -> dict:
+    """按时间对齐比较合成K线与券商K线，返回对比统计"""
+    merged = derived.merge(broker, on="time", how="right", suffixes=("", "_broker"), indicator=True)
+    missing = int((merged["_merge"] != "both").sum())
+    both = merged[merged["_merge"] == "both"]
+    max_diff = 0.0
+    mismatches = 0
+    if len(both):
+        diffs = np.column_stack([
+            np.abs(both[c].to_numpy(dtype=np.float64) - both[f"{c}_broker"].to_numpy(dtype=np.float64))
+            for c in PRICE_COLUMNS
+        ])
+        max_diff = float(diffs.max())
+        mismatches = int((diffs > tol).any(axis=1).sum())
+    return {
+        "compared": int(len(both)),
+        "missing": missing,
+        "mismatches": mismatches,
+        "max_diff": round(max_diff, 5),
+        "ok": missing == 0 and mismatches == 0,
+    }
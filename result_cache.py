@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+XAUUSD 交易助手 - 进程内共享分析结果缓存
+按 (品种, 最后收盘K线时间) 保存分析结果，带 TTL；
+同一品种同一时间只允许一个调用方重新计算（single-flight），其余调用方等待并共享结果。
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+
+
+class SharedResultCache:
+    def __init__(self, ttl: float = 1800.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: dict[tuple, tuple[float, dict]] = {}
+        self._latest: dict[str, tuple] = {}
+        self._inflight: dict[str, Future] = {}
+
+    def _alive(self, key: tuple) -> dict | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.monotonic() - stored_at > self.ttl:
+            self._entries.pop(key, None)
+            return None
+        return value
+
+    def get(self, symbol: str, bar_time) -> dict | None:
+        with self._lock:
+            return self._alive((symbol, bar_time))
+
+    def latest(self, symbol: str) -> dict | None:
+        """该品种最近一次的结果（未过期）"""
+        with self._lock:
+            key = self._latest.get(symbol)
+            return self._alive(key) if key is not None else None
+
+    def put(self, symbol: str, bar_time, value: dict):
+        with self._lock:
+            now = time.monotonic()
+            self._entries = {k: e for k, e in self._entries.items() if now - e[0] <= self.ttl}
+            self._entries[(symbol, bar_time)] = (now, value)
+            self._latest[symbol] = (symbol, bar_time)
+
+    def is_computing(self, symbol: str) -> bool:
+        with self._lock:
+            return symbol in self._inflight
+
+    def get_or_compute(self, symbol: str, bar_time, compute, force: bool = False) -> dict:
+        """
+        命中则直接返回；否则由第一个调用方执行 compute()，
+        同时到达的其他调用方等待该次计算完成后再判断是否命中。
+        """
+        while True:
+            with self._lock:
+                if not force:
+                    value = self._alive((symbol, bar_time))
+                    if value is not None:
+                        return value
+                fut = self._inflight.get(symbol)
+                owner = fut is None
+                if owner:
+                    fut = Future()
+                    self._inflight[symbol] = fut
+            if not owner:
+                fut.result()
+                force = False
+                continue
+
+            try:
+                value = compute()
+            except BaseException as e:
+                with self._lock:
+                    self._inflight.pop(symbol, None)
+                fut.set_exception(e)
+                raise
+            self.put(symbol, bar_time, value)
+            with self._lock:
+                self._inflight.pop(symbol, None)
+            fut.set_result(value)
+            return value
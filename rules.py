@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+XAUUSD 交易助手 - 本地规则预检
+TRADING_PROMPT 中可以直接算出来的硬性规则在本地计算，不再交给模型：
+- 趋势一致性：各周期 收盘/EMA20/EMA50 多头或空头排列，至少 min_agree 个周期同向
+- 止损距离：执行周期 1.5×ATR
+- 最小盈亏比：到 H1 摆动高/低的空间至少为止损距离的 min_rr 倍
+- 点差上限：按品种 point 换算为价格后与执行周期 ATR 比较（不同报价位数的品种/平台通用），可另设每个品种的点数上限
+- RSI 极值（不作为硬性条件，只作为事实提供给模型）
+screen() 对 (周期数, ...) 形状的数组整体计算，既可用于最新一根（实时分析），也可一次算出整段历史（回测）。
+硬性条件不满足时直接给出“不交易”，满足时把计算出的事实写入交易信号 Prompt。
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class TradingRules:
+    def __init__(
+        self,
+        min_agree: int = 4,
+        exec_timeframe: str = "M15",
+        sl_atr: float = 1.5,
+        min_rr: float = 2.0,
+        max_spread_atr: float | None = 0.15,
+        max_spread_points: float | None = None,
+        rsi_overbought: float = 70.0,
+        rsi_oversold: float = 30.0,
+        swing_lookback: int = 80,
+    ):
+        # 至少 min_agree 个周期同向排列才有方向
+        self.min_agree = min_agree
+        # 止损 = sl_atr × ATR(exec_timeframe)；到 H1 摆动位的空间 ≥ min_rr × 止损距离
+        self.exec_timeframe = exec_timeframe
+        self.sl_atr = sl_atr
+        self.min_rr = min_rr
+        # 点差上限：点差 × point ≤ max_spread_atr × ATR(exec_timeframe)；point 或点差未知时不检查，None 表示不检查
+        self.max_spread_atr = max_spread_atr
+        # 按点数的绝对上限（与平台报价位数有关，只适合针对单个品种设置）；None 表示不检查
+        self.max_spread_points = max_spread_points
+        self.rsi_overbought = rsi_overbought
+        self.rsi_oversold = rsi_oversold
+        # H1 摆动高/低的回看根数（与当日行情分析一致）
+        self.swing_lookback = swing_lookback
+
+
+def screen(
+    close: np.ndarray,
+    ema20: np.ndarray,
+    ema50: np.ndarray,
+    price,
+    atr_exec,
+    rsi_exec,
+    swing_high,
+    swing_low,
+    spread,
+    rules: TradingRules,
+    point: float | None = None,
+) -> dict[str, np.ndarray]:
+    """
+    close/ema20/ema50：形状 (周期数, ...)；其余参数为标量或形状 (...) 的数组，spread（点）未知时为 nan。
+    point：品种最小报价单位（symbol_info.point），用于把点差换算为价格；None 表示未知。
+    返回各项中间结果与 passed（硬性条件是否全部满足），形状均为 (...)。
+    """
+    bull = (close > ema20) & (ema20 > ema50)
+    bear = (close < ema20) & (ema20 < ema50)
+    trend = bull.astype(np.int8) - bear.astype(np.int8)
+    up = bull.sum(axis=0)
+    down = bear.sum(axis=0)
+    side = np.where(up >= rules.min_agree, 1, np.where(down >= rules.min_agree, -1, 0))
+
+    price = np.asarray(price, dtype=np.float64)
+    stop = rules.sl_atr * np.asarray(atr_exec, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        atr_ok = stop > 0
+        room = np.where(side >= 0, swing_high - price, price - swing_low)
+        # 价格已越过摆动位：数据中没有更近的阻力/支撑，不限制空间
+        room = np.where(room > 0, room, np.inf)
+        rr = np.where(atr_ok, room / np.where(atr_ok, stop, 1.0), np.nan)
+        rr_ok = rr >= rules.min_rr
+
+        spread = np.asarray(spread, dtype=np.float64)
+        spread_price = spread * (np.nan if point is None else float(point))
+        if rules.max_spread_atr is None:
+            spread_limit = np.full(np.shape(spread_price), np.inf)
+        else:
+            spread_limit = rules.max_spread_atr * np.asarray(atr_exec, dtype=np.float64)
+        spread_ok = np.isnan(spread_price) | np.isnan(spread_limit) | (spread_price <= spread_limit)
+        if rules.max_spread_points is not None:
+            spread_ok = spread_ok & (np.isnan(spread) | (spread <= rules.max_spread_points))
+
+        rsi_exec = np.asarray(rsi_exec, dtype=np.float64)
+        rsi_extreme = ((side > 0) & (rsi_exec >= rules.rsi_overbought)) | ((side < 0) & (rsi_exec <= rules.rsi_oversold))
+
+    return {
+        "trend": trend,
+        "up": up,
+        "down": down,
+        "side": side,
+        "stop": stop,
+        "sl": price - side * stop,
+        "target": price + side * rules.min_rr * stop,
+        "room": room,
+        "rr": rr,
+        "atr_ok": atr_ok,
+        "rr_ok": rr_ok,
+        "spread_price": spread_price,
+        "spread_limit": spread_limit,
+        "spread_ok": spread_ok,
+        "rsi_extreme": rsi_extreme,
+        "passed": (side != 0) & atr_ok & rr_ok & spread_ok,
+    }
+
+
+def _num(x, nd: int = 2):
+    x = float(x)
+    return round(x, nd) if np.isfinite(x) else None
+
+
+def verdict(
+    s: dict[str, np.ndarray],
+    tf_names: tuple[str, ...],
+    rules: TradingRules,
+    price: float,
+    atr_exec: float,
+    rsi_exec: float,
+    swing_high: float,
+    swing_low: float,
+    spread: int | None,
+    i: int | None = None,
+) -> dict:
+    """把 screen() 的结果（整段历史时取第 i 个）整理为预检结论：数值、逐条检查与未通过原因"""
+    def at(key):
+        v = s[key]
+        return v[..., i] if i is not None else v
+
+    trend = at("trend")
+    up, down, side = int(at("up")), int(at("down")), int(at("side"))
+    direction = {1: "买入", -1: "卖出"}.get(side)
+    n = len(tf_names)
+    trend_map = {tf: {1: "多", -1: "空"}.get(int(t), "震荡") for tf, t in zip(tf_names, trend)}
+
+    checks = [{
+        "rule": "趋势一致性",
+        "ok": side != 0,
+        "detail": f"多头排列 {up}/{n}，空头排列 {down}/{n}（要求 ≥{rules.min_agree}）",
+    }, {
+        "rule": "ATR",
+        "ok": bool(at("atr_ok")),
+        "detail": f"{rules.exec_timeframe} ATR={_num(atr_exec)}，止损距离 {rules.sl_atr}×ATR={_num(at('stop'))}",
+    }]
+    if side != 0:
+        rr = _num(at("rr"), 1)
+        level = "H1 摆动高" if side > 0 else "H1 摆动低"
+        checks.append({
+            "rule": "最小盈亏比",
+            "ok": bool(at("rr_ok")),
+            "detail": (
+                f"{level} {_num(swing_high if side > 0 else swing_low)}，可用空间约 {rr}R（要求 ≥{rules.min_rr:g}R）"
+                if rr is not None and np.isfinite(at("room")) else f"价格已越过{level}，空间不受限"
+            ),
+        })
+    if spread is None:
+        spread_detail = "无法确认点差"
+    else:
+        spread_price, spread_limit = _num(at("spread_price"), 3), _num(at("spread_limit"), 3)
+        limits = []
+        if rules.max_spread_atr is not None and spread_limit is not None:
+            limits.append(f"{rules.max_spread_atr:g}×ATR={spread_limit}")
+        if rules.max_spread_points is not None:
+            limits.append(f"{rules.max_spread_points:g} 点")
+        spread_detail = f"{spread} 点" + (f"（约 {spread_price}）" if spread_price is not None else "（品种报价单位未知，未换算）")
+        spread_detail += f"，上限 {' / '.join(limits)}" if limits else ""
+    checks.append({"rule": "点差", "ok": bool(at("spread_ok")), "detail": spread_detail})
+
+    return {
+        "passed": bool(at("passed")),
+        "direction": direction,
+        "trend": trend_map,
+        "up": up,
+        "down": down,
+        "min_agree": rules.min_agree,
+        "min_rr": rules.min_rr,
+        "price": _num(price),
+        "exec_timeframe": rules.exec_timeframe,
+        "atr_exec": _num(atr_exec),
+        "stop_distance": _num(at("stop")),
+        "sl": _num(at("sl")) if direction else None,
+        "min_target": _num(at("target")) if direction else None,
+        "swing_high": _num(swing_high),
+        "swing_low": _num(swing_low),
+        "rr_room": _num(at("rr"), 1) if direction else None,
+        "rsi_exec": _num(rsi_exec, 1),
+        "rsi_extreme": bool(at("rsi_extreme")),
+        "spread": spread,
+        "checks": checks,
+        "reasons": [c["detail"] for c in checks if not c["ok"]],
+    }
+
+
+def prescreen(dfs: dict[str, pd.DataFrame], spread: int | None, rules: TradingRules, point: float | None = None) -> dict:
+    """实时分析：对各周期最新一根K线做预检；point 为品种最小报价单位（点差换算为价格）"""
+    tf_names = tuple(dfs)
+    last = {col: np.array([df[col].iat[-1] for df in dfs.values()], dtype=np.float64) for col in ("close", "ema_20", "ema_50")}
+    execution = dfs[rules.exec_timeframe]
+    h1 = dfs["H1"].tail(rules.swing_lookback)
+    price = float(dfs["M5"]["close"].iat[-1])
+    atr_exec = float(execution["atr"].iat[-1])
+    rsi_exec = float(execution["rsi"].iat[-1])
+    swing_high, swing_low = float(h1["high"].max()), float(h1["low"].min())
+
+    s = screen(
+        last["close"], last["ema_20"], last["ema_50"],
+        price, atr_exec, rsi_exec, swing_high, swing_low,
+        np.nan if spread is None else spread, rules, point,
+    )
+    return verdict(s, tf_names, rules, price, atr_exec, rsi_exec, swing_high, swing_low, spread)
+
+
+# ===============================
+# 文本
+# ===============================
+def format_rule_facts(v: dict) -> str:
+    """写入交易信号 Prompt 的预检事实"""
+    trend = "｜".join(f"{tf} {t}" for tf, t in v["trend"].items())
+    lines = [f"- 趋势排列（收盘/EMA20/EMA50）：{trend}"]
+    for c in v["checks"]:
+        lines.append(f"- {c['rule']}：{c['detail']}{'' if c['ok'] else '（未满足）'}")
+    if v["direction"]:
+        lines.append(f"- 方向 {v['direction']}：参考止损 {v['sl']}，最小盈亏比 1:{v['min_rr']:g} 对应目标 {v['min_target']}")
+    rsi_note = "（极值，需注意追单风险）" if v["rsi_extreme"] else ""
+    lines.append(f"- {v['exec_timeframe']} RSI(14)：{v['rsi_exec']}{rsi_note}")
+    lines.append("- 结论：硬性条件" + ("全部满足" if v["passed"] else "未满足"))
+    return "\n".join(lines)
+
+
+def no_trade_text(v: dict) -> str:
+    """预检未通过时的交易信号（与 TRADING_PROMPT 输出格式一致，不调用模型）"""
+    reasons = "\n".join(f"- {r}" for r in v["reasons"])
+    return (
+        "交易信号：不交易\n"
+        f"理由（要点列表）：\n{reasons}\n"
+        f"执行条件：等待至少 {v['min_agree']} 个周期同向排列、点差正常且到摆动位空间满足最小盈亏比后再评估\n"
+        "置信度：—（本地规则预检未通过，未调用 GPT）"
+    )
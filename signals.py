@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+XAUUSD 交易助手 - 交易信号解析
+从 TRADING_PROMPT 规定的输出格式中提取 方向/入场区间/止损/止盈/置信度。
+"""
+
+import re
+
+
+_NUM = r"(-?\d+(?:\.\d+)?)"
+_SEP = r"[*\s]*[：:][*\s]*"
+
+_PATTERNS = {
+    "signal": re.compile(r"交易信号" + _SEP + r"(买入|卖出|不交易)"),
+    "entry": re.compile(r"入场区间" + _SEP + _NUM + r"\s*[~～\-—至]+\s*" + _NUM),
+    "sl": re.compile(r"止损(?:SL)?" + _SEP + _NUM),
+    "tp1": re.compile(r"止盈TP1" + _SEP + _NUM),
+    "tp2": re.compile(r"止盈TP2" + _SEP + _NUM),
+    "tp3": re.compile(r"止盈TP3" + _SEP + _NUM),
+    "confidence": re.compile(r"置信度" + _SEP + r"(\d{1,3})"),
+}
+
+
+def parse_trading_signal(text: str) -> dict:
+    """
+    返回 {"signal", "entry", "sl", "tp1", "tp2", "tp3", "confidence"}；
+    无法识别的字段为 None，entry 为 (低, 高)。
+    """
+    text = text or ""
+    out = {"signal": None, "entry": None, "sl": None, "tp1": None, "tp2": None, "tp3": None, "confidence": None}
+
+    m = _PATTERNS["signal"].search(text)
+    if m:
+        out["signal"] = m.group(1)
+
+    m = _PATTERNS["entry"].search(text)
+    if m:
+        a, b = float(m.group(1)), float(m.group(2))
+        out["entry"] = (min(a, b), max(a, b))
+
+    for field in ("sl", "tp1", "tp2", "tp3"):
+        m = _PATTERNS[field].search(text)
+        if m:
+            out[field] = float(m.group(1))
+
+    m = _PATTERNS["confidence"].search(text)
+    if m:
+        out["confidence"] = int(m.group(1))
+    return out
+
+
+def is_actionable(sig: dict) -> bool:
+    """方向为买入/卖出，且入场区间、止损、TP1 都已给出"""
+    return sig.get("signal") in ("买入", "卖出") and all(sig.get(k) is not None for k in ("entry", "sl", "tp1"))
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""测试公共部分：模块都在仓库根目录（平铺），以及合成K线数据"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bar_cache import RATES_DTYPE  # noqa: E402
+
+
+def make_rates(n: int, start: int = 1_700_000_000, step: int = 300, seed: int = 0, price: float = 2000.0) -> np.ndarray:
+    """n 根随机游走K线（MT5 结构化数组格式，time 为秒，价格保留两位小数）"""
+    rng = np.random.default_rng(seed)
+    close = np.round(price + np.cumsum(rng.normal(0.0, 1.0, n)), 2)
+    open_ = np.r_[close[:1], close[:-1]]
+    out = np.zeros(n, dtype=RATES_DTYPE)
+    out["time"] = start + step * np.arange(n)
+    out["open"] = open_
+    out["high"] = np.round(np.maximum(open_, close) + rng.random(n), 2)
+    out["low"] = np.round(np.minimum(open_, close) - rng.random(n), 2)
+    out["close"] = close
+    out["tick_volume"] = rng.integers(1, 100, n)
+    out["spread"] = rng.integers(10, 30, n)
+    return out
+
+
+def rates_frame(rates: np.ndarray) -> pd.DataFrame:
+    df = pd.DataFrame(rates)
+    df["time"] = pd.to_datetime(df["time"], unit="s")
+    return df
+
+
+@pytest.fixture
+def rates():
+    return make_rates(3000)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import http.client
+import json
+import threading
+from datetime import datetime
+
+import pytest
+
+from analysis_server import AnalysisService, ServiceError, make_server, query_bool, query_fields, query_int, query_seconds
+
+
+def test_query_int():
+    assert query_int({}, "n", 20, 1, 1000) == 20
+    assert query_int({"n": "5"}, "n", 20, 1, 1000) == 5
+    for raw in ("abc", "0", "1001", "1.5"):
+        with pytest.raises(ServiceError) as e:
+            query_int({"n": raw}, "n", 20, 1, 1000)
+        assert e.value.status == 400
+
+
+def test_query_seconds():
+    assert query_seconds({}, "max_age") is None
+    assert query_seconds({"max_age": "1.5"}, "max_age") == 1.5
+    for raw in ("x", "-1", "nan", "inf"):
+        with pytest.raises(ServiceError) as e:
+            query_seconds({"max_age": raw}, "max_age")
+        assert e.value.status == 400
+
+
+def test_query_bool_and_fields():
+    assert query_bool({}, "wait", True) is True
+    assert query_bool({"wait": "False"}, "wait", True) is False
+    with pytest.raises(ServiceError):
+        query_bool({"wait": "maybe"}, "wait", True)
+    assert query_fields({}) is None
+    assert query_fields({"fields": "trading_signal,forecast"}) == ("trading_signal", "forecast")
+    with pytest.raises(ServiceError):
+        query_fields({"fields": "a b"})
+
+
+class _History:
+    def last_signals(self, symbol, n):
+        if symbol == "BOOM":
+            raise ValueError("internal")
+        return [{"symbol": symbol, "n": n}]
+
+
+class _Bot:
+    """只提供服务用到的接口：结果直接来自分析历史（warm_start），不连接 MT5"""
+
+    history = _History()
+
+    def warm_start(self, symbol):
+        return {"symbol": symbol, "timestamp": datetime.now().isoformat(), "trading_signal": "交易信号：不交易"}
+
+
+@pytest.fixture
+def server():
+    svc = AnalysisService(_Bot(), ["XAUUSD", "BOOM"], workers=1)
+    srv = make_server(svc, "127.0.0.1", 0)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv.server_address[1]
+    srv.shutdown()
+    svc.close()
+
+
+def _get(port, path, method="GET"):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    conn.request(method, path)
+    resp = conn.getresponse()
+    return resp.status, json.loads(resp.read())
+
+
+@pytest.mark.parametrize("path", [
+    "/v1/XAUUSD/signals?n=abc",
+    "/v1/XAUUSD/signals?n=0",
+    "/v1/XAUUSD/analysis?max_age=x",
+    "/v1/XAUUSD/analysis?fields=a%20b",
+    "/v1/XAUUSD/analysis?fields=nope",
+])
+def test_bad_parameters_return_400(server, path):
+    status, body = _get(server, path)
+    assert status == 400 and body["error"].startswith("参数错误")
+
+
+def test_valid_requests(server):
+    assert _get(server, "/v1/XAUUSD/signals?n=3") == (200, [{"symbol": "XAUUSD", "n": 3}])
+    status, body = _get(server, "/v1/XAUUSD/analysis?fields=trading_signal")
+    assert status == 200 and set(body) == {"symbol", "timestamp", "trading_signal"}
+
+
+def test_routing_errors(server):
+    assert _get(server, "/v1/XAUUSD/refresh")[0] == 405
+    assert _get(server, "/v1/XAUUSD/nothing")[0] == 404
+    assert _get(server, "/v1/EURUSD/signals")[0] == 404
+
+
+def test_internal_value_error_is_500(server):
+    status, body = _get(server, "/v1/BOOM/signals")
+    assert status == 500 and body["error"] == "ValueError: internal"
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from bar_buffer import BarBuffer, price_dtype_for
+from conftest import make_rates
+
+
+def _expected(rates, capacity):
+    return rates[-capacity:]
+
+
+def test_merge_keeps_last_capacity_bars_across_wraparound():
+    rates = make_rates(2000)
+    buf = BarBuffer(100, np.float64, slack=16)
+    buf.merge(rates[:50])
+    # 每次从最后一根（未收盘）开始合并，多次写满 capacity + slack 触发搬移
+    pos = 50
+    while pos < len(rates):
+        nxt = min(len(rates), pos + 7)
+        buf.merge(rates[pos - 1:nxt])
+        pos = nxt
+        df = buf.frame()
+        exp = _expected(rates[:pos], 100)
+        assert len(buf) == len(exp)
+        assert np.array_equal(df["close"].to_numpy(), exp["close"])
+        assert np.array_equal(df["time"].to_numpy(dtype="datetime64[s]").astype(np.int64), exp["time"])
+    assert buf.last_time() == int(rates["time"][-1])
+
+
+def test_merge_replaces_forming_bar():
+    rates = make_rates(20)
+    buf = BarBuffer(50, np.float64)
+    buf.merge(rates[:10])
+    update = rates[9:10].copy()
+    update["close"] += 3.0
+    buf.merge(update)
+    assert len(buf) == 10
+    assert buf.frame()["close"].iat[-1] == update["close"][0]
+
+
+def test_merge_longer_than_capacity():
+    rates = make_rates(300)
+    buf = BarBuffer(100, np.float64)
+    buf.merge(rates)
+    assert np.array_equal(buf.frame()["close"].to_numpy(), rates["close"][-100:])
+
+
+def test_price_dtype_for():
+    assert price_dtype_for(2650.12, 2) == np.float32
+    assert price_dtype_for(95000.12, 2) == np.float64
+    assert price_dtype_for(1.08123, 5) == np.float32
+    assert price_dtype_for(2650.12, None) == np.float64
+
+
+def test_auto_dtype_upcasts_when_prices_outgrow_float32():
+    rates = make_rates(20, price=2600.0)
+    buf = BarBuffer(50, digits=2)
+    buf.merge(rates[:10])
+    assert buf.price_dtype == np.float32
+    big = rates[10:].copy()
+    big["high"] = big["close"] = 95000.12
+    buf.merge(big)
+    assert buf.price_dtype == np.float64
+    assert buf.frame()["close"].iat[-1] == 95000.12
+    assert np.array_equal(np.round(buf.frame()["close"].to_numpy()[:9], 2), rates["close"][:9])
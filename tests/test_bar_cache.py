@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import numpy as np
+
+from bar_cache import BarCache
+from conftest import make_rates
+
+
+def test_replace_all_and_load(tmp_path, rates):
+    cache = BarCache(tmp_path)
+    cache.replace_all("XAUUSD", 5, rates, covered_from=int(rates["time"][0]))
+    loaded = cache.load("XAUUSD", 5)
+    assert np.array_equal(loaded, rates)
+    assert cache.last_time("XAUUSD", 5) == int(rates["time"][-1])
+    assert cache.covered_from("XAUUSD", 5) == int(rates["time"][0])
+
+
+def test_empty_cache(tmp_path):
+    cache = BarCache(tmp_path)
+    assert len(cache.load("XAUUSD", 5)) == 0
+    assert cache.last_time("XAUUSD", 5) is None
+    assert cache.covered_from("XAUUSD", 5) is None
+
+
+def test_append_replaces_forming_bar(tmp_path, rates):
+    cache = BarCache(tmp_path)
+    cache.replace_all("XAUUSD", 5, rates[:100], covered_from=int(rates["time"][0]))
+    # 新数据从缓存最后一根（未收盘）开始：该根被覆盖，其后追加
+    update = rates[99:120].copy()
+    update["close"][0] += 1.0
+    cache.append("XAUUSD", 5, update)
+    loaded = cache.load("XAUUSD", 5)
+    assert len(loaded) == 120
+    assert np.array_equal(loaded[:99], rates[:99])
+    assert np.array_equal(loaded[99:], update)
+
+
+def test_append_truncates_overlap(tmp_path, rates):
+    cache = BarCache(tmp_path)
+    cache.replace_all("XAUUSD", 5, rates[:100], covered_from=0)
+    # 重叠多根时截掉 time >= 新数据首根的全部记录
+    cache.append("XAUUSD", 5, rates[90:95])
+    loaded = cache.load("XAUUSD", 5)
+    assert np.array_equal(loaded, rates[:95])
+
+
+def test_append_to_missing_file(tmp_path, rates):
+    cache = BarCache(tmp_path)
+    cache.append("XAUUSD", 5, rates[:10])
+    assert np.array_equal(cache.load("XAUUSD", 5), rates[:10])
+
+
+def test_slice(tmp_path, rates):
+    cache = BarCache(tmp_path)
+    cache.replace_all("XAUUSD", 5, rates, covered_from=0)
+    t = rates["time"]
+    part = cache.slice("XAUUSD", 5, int(t[10]), int(t[20]))
+    assert np.array_equal(part, rates[10:21])
+
+
+def test_concurrent_read_never_sees_truncated_file(tmp_path):
+    rates = make_rates(5000)
+    cache = BarCache(tmp_path)
+    cache.replace_all("XAUUSD", 5, rates, covered_from=0)
+    short = []
+    stop = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            if len(cache.load("XAUUSD", 5)) < len(rates):
+                short.append(1)
+
+    threads = [threading.Thread(target=reader) for _ in range(2)]
+    for th in threads:
+        th.start()
+    for _ in range(300):
+        cache.append("XAUUSD", 5, rates[-2:])
+    stop.set()
+    for th in threads:
+        th.join()
+    assert not short
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+
+import pytest
+
+from history_store import AnalysisHistory
+
+T0 = datetime(2025, 1, 6, 9, 0)
+
+
+def _result(i: int, signal: str, symbol: str = "XAUUSD") -> dict:
+    text = f"交易信号：{signal}"
+    if signal != "不交易":
+        text += f"\n入场区间：{2000 + i} ~ {2001 + i}\n止损SL：{1995 + i}\n止盈TP1：{2010 + i}\n置信度：{50 + i}"
+    return {
+        "symbol": symbol,
+        "timestamp": (T0 + timedelta(minutes=5 * i)).isoformat(),
+        "trading_signal": text,
+        "input_fingerprint": f"fp{i}",
+        "refresh_anchor": {"price": 2000.0 + i},
+        "trace": {"total_ms": 10.0 * i},
+    }
+
+
+@pytest.fixture
+def history(tmp_path):
+    h = AnalysisHistory(tmp_path / "history.sqlite", keep_days=None)
+    for i, sig in enumerate(["买入", "不交易", "卖出", "不交易", "买入"]):
+        h.append(_result(i, sig))
+    h.append(_result(9, "卖出", symbol="XAGUSD"))
+    yield h
+    h.close()
+
+
+def test_latest_and_get(history):
+    assert history.latest("XAUUSD")["input_fingerprint"] == "fp4"
+    assert history.latest("EURUSD") is None
+    assert history.get(1)["input_fingerprint"] == "fp0"
+
+
+def test_last_signals(history):
+    rows = history.last_signals("XAUUSD", 3)
+    assert [r["signal"] for r in rows] == ["买入", "不交易", "卖出"]
+    assert rows[0]["entry_low"] == 2004.0 and rows[0]["sl"] == 1999.0 and rows[0]["confidence"] == 54
+    assert rows[0]["price"] == 2004.0 and rows[0]["total_ms"] == 40.0
+    actionable = history.last_signals("XAUUSD", 10, actionable_only=True)
+    assert [r["fingerprint"] for r in actionable] == ["fp4", "fp2", "fp0"]
+
+
+def test_scan_and_count(history):
+    rows = history.scan("XAUUSD", T0 + timedelta(minutes=5), T0 + timedelta(minutes=15))
+    assert [r["fingerprint"] for r in rows] == ["fp1", "fp2"]
+    full = history.scan("XAUUSD", start=(T0 + timedelta(minutes=20)).isoformat(), full=True)
+    assert [r["input_fingerprint"] for r in full] == ["fp4"]
+    assert history.count() == 6 and history.count("XAUUSD") == 5
+
+
+def test_prune(history):
+    assert history.prune(T0 + timedelta(minutes=10)) == 2
+    assert history.count("XAUUSD") == 3
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_rates, rates_frame
+from indicators import (
+    INDICATOR_COLUMNS,
+    IndicatorEngine,
+    compute_indicators,
+    compute_indicators_batch,
+    compute_indicators_many,
+    pad_series,
+)
+
+
+def _full(df):
+    return compute_indicators(df["close"].to_numpy(), df["high"].to_numpy(), df["low"].to_numpy())
+
+
+def _assert_same(df, expected, cols=INDICATOR_COLUMNS):
+    for col in cols:
+        assert np.array_equal(df[col].to_numpy(), expected[col], equal_nan=True), col
+
+
+def test_matches_pandas_definitions():
+    df = rates_frame(make_rates(1000))
+    v = _full(df)
+    for span in (20, 50, 200):
+        ref = df["close"].ewm(span=span, adjust=False).mean().to_numpy()
+        assert np.allclose(v[f"ema_{span}"], ref)
+    prev = df["close"].shift(1)
+    tr = pd.concat([df["high"] - df["low"], (df["high"] - prev).abs(), (df["low"] - prev).abs()], axis=1).max(axis=1)
+    assert np.allclose(v["atr"], tr.rolling(14).mean().to_numpy(), equal_nan=True)
+
+
+def test_incremental_equals_full():
+    df = rates_frame(make_rates(1500))
+    engine = IndicatorEngine()
+    engine.update(("XAUUSD", "M5"), df.iloc[:1000].copy())
+    for end in range(1003, len(df) + 1, 3):
+        out = engine.update(("XAUUSD", "M5"), df.iloc[:end].copy())
+        _assert_same(out, _full(df.iloc[:end]))
+    assert engine.verify(("XAUUSD", "M5"))
+
+
+def test_incremental_forming_bar_update():
+    df = rates_frame(make_rates(500))
+    engine = IndicatorEngine()
+    engine.update(("XAUUSD", "M5"), df.copy())
+    changed = df.copy()
+    changed.loc[len(df) - 1, "close"] += 5.0
+    out = engine.update(("XAUUSD", "M5"), changed)
+    _assert_same(out, _full(changed))
+
+
+def test_incremental_with_max_rows_window():
+    df = rates_frame(make_rates(3000))
+    engine = IndicatorEngine(max_rows=600)
+    engine.update(("XAUUSD", "M5"), df.iloc[:600].copy())
+    for end in range(601, len(df) + 1, 5):
+        window = df.iloc[end - 600:end].copy()
+        out = engine.update(("XAUUSD", "M5"), window)
+        assert len(out) == 600
+    # 截断后 EMA 依赖被丢弃的历史，只比较窗口类指标
+    _assert_same(out.iloc[20:], {k: v[-580:] for k, v in _full(df.iloc[:end]).items()}, ("rsi", "atr"))
+    assert engine.verify(("XAUUSD", "M5"))
+    assert engine.needs_full(("XAUUSD", "M5"), df.iloc[:100]) is True
+
+
+@pytest.mark.parametrize("rows", [3, 12])
+def test_batch_kernels_bit_identical(rows):
+    series = []
+    for r in range(rows):
+        rates = make_rates(200 + 97 * r, seed=r)
+        series.append((rates["close"], rates["high"], rates["low"]))
+    many = compute_indicators_many(series)
+    for (c, h, l), got in zip(series, many):
+        ref = compute_indicators(c, h, l)
+        for col in INDICATOR_COLUMNS:
+            assert np.array_equal(got[col], ref[col], equal_nan=True)
+
+    padded = [pad_series([s[i] for s in series])[0] for i in range(3)]
+    batch = compute_indicators_batch(*padded)
+    n = padded[0].shape[1]
+    for r, (c, h, l) in enumerate(series):
+        ref = compute_indicators(c, h, l)
+        for k, col in enumerate(INDICATOR_COLUMNS):
+            assert np.array_equal(batch[k, r, n - len(c):], ref[col], equal_nan=True)
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from conftest import make_rates, rates_frame
+from market_structure import StructureEngine, bar_arrays, build_structure, extend_structure
+
+
+def test_extend_equals_build():
+    bars = bar_arrays(rates_frame(make_rates(1200, seed=3)))
+    st = build_structure(tuple(a[:300] for a in bars))
+    extend_structure(st, bars, 300, 1200)
+    full = build_structure(bars)
+    assert st.count == full.count == 1200
+    assert st.snapshot() == full.snapshot()
+
+
+def test_engine_update_incremental_matches_full():
+    df = rates_frame(make_rates(1500, seed=5))
+    engine = StructureEngine()
+    key = ("XAUUSD", "M15")
+    engine.update(key, df.iloc[:800])
+    for end in range(810, len(df) + 1, 10):
+        engine.update(key, df.iloc[:end])
+        assert engine.verify(key, df.iloc[:end])
+
+
+def test_engine_advance_matches_build():
+    bars = bar_arrays(rates_frame(make_rates(900, seed=8)))
+    engine = StructureEngine()
+    for end in range(100, 901, 40):
+        st = engine.advance(("XAUUSD", "H1"), bars, end)
+    assert st.snapshot() == build_structure(bars).snapshot()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import json
+
+import numpy as np
+
+from output_check import (
+    TRADING_SCHEMA,
+    OutputRules,
+    grounding_set,
+    partial_json_fields,
+    schema_errors,
+    validate_output,
+)
+
+
+def _trading(**kw):
+    data = {
+        "signal": "买入", "reasons": ["多周期同向"], "entry_low": 2000.5, "entry_high": 2001.0,
+        "sl": 1995.0, "tp1": 2010.0, "tp2": 2015.0, "tp3": None, "trigger": "回踩", "invalidation": "跌破",
+        "risks": ["数据公布"], "confidence": 60, "confidence_basis": "趋势",
+    }
+    data.update(kw)
+    return data
+
+
+ALLOWED = grounding_set(["收盘 2000.5 2001.0 1995.0 2010.0 2015.0"])
+
+
+def test_schema_errors():
+    assert schema_errors(_trading(), TRADING_SCHEMA) == []
+    assert schema_errors(_trading(signal="观望"), TRADING_SCHEMA) == ["$.signal 取值应为 买入/卖出/不交易"]
+    assert schema_errors(_trading(confidence=True), TRADING_SCHEMA) == ["$.confidence 类型应为 integer"]
+    extra = schema_errors(_trading(note="x"), TRADING_SCHEMA)
+    assert extra == ["$.note 不是约定字段"]
+    missing = _trading()
+    del missing["sl"]
+    assert schema_errors(missing, TRADING_SCHEMA) == ["$.sl 缺失"]
+    assert schema_errors(_trading(reasons=["a", 1]), TRADING_SCHEMA) == ["$.reasons[1] 类型应为 string"]
+
+
+def test_validate_text_ok():
+    text = "交易信号：买入\n入场区间：2000.5 ~ 2001.0\n止损SL：1995.0\n止盈TP1：2010.0\n置信度：60"
+    v = validate_output("trading", text, ALLOWED, 2000.0, OutputRules())
+    assert v == {"ok": True, "issues": [], "data": None}
+
+
+def test_validate_text_english_and_ungrounded_price():
+    text = "交易信号：买入 buy now\n止损SL：1980.0\nRSI 55，时间 2024-05-01 12:30"
+    v = validate_output("trading", text, ALLOWED, 2000.0, OutputRules())
+    assert not v["ok"]
+    assert v["issues"] == ["出现英文：buy、now", "以下价格在给定数据中找不到：1980"]
+
+
+def test_validate_structured():
+    v = validate_output("trading", json.dumps(_trading(), ensure_ascii=False), ALLOWED, 2000.0, OutputRules(), structured=True)
+    assert v["ok"] and v["data"]["signal"] == "买入"
+    bad = validate_output("trading", json.dumps(_trading(sl=1980.0)), ALLOWED, 2000.0, OutputRules(), structured=True)
+    assert bad["issues"] == ["以下价格在给定数据中找不到：1980"]
+    broken = validate_output("trading", "{not json", ALLOWED, 2000.0, OutputRules(), structured=True)
+    assert broken["issues"] == ["输出不是合法的 JSON"] and broken["data"] is None
+    out_of_range = validate_output("trading", json.dumps(_trading(confidence=150)), ALLOWED, 2000.0, OutputRules(), structured=True)
+    assert out_of_range["issues"] == ["$.confidence 应在 0-100 之间"]
+
+
+def test_price_tolerance():
+    # 容差为当前价的 0.025%（2000 -> 0.5）
+    allowed = grounding_set([], [np.array([2000.0])])
+    assert validate_output("trading", "止损 2000.4", allowed, 2000.0, OutputRules())["ok"]
+    assert not validate_output("trading", "止损 2000.6", allowed, 2000.0, OutputRules())["ok"]
+
+
+def test_partial_json_fields():
+    text = json.dumps(_trading(), ensure_ascii=False)
+    cut = text.index('"entry_high"')
+    fields = partial_json_fields(text[:cut + 20])
+    assert fields["signal"] == "买入" and fields["entry_low"] == 2000.5
+    assert "entry_high" not in fields
+    assert partial_json_fields(text) == _trading()
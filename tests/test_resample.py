@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+
+from conftest import make_rates, rates_frame
+from resample import resample_ohlc
+
+
+def test_resample_m5_to_h1():
+    # 从整点开始的 M5：每 12 根合成一根 H1
+    rates = make_rates(12 * 30, start=1_700_000_000 - 1_700_000_000 % 3600)
+    df = rates_frame(rates)
+    h1 = resample_ohlc(df, "H1")
+    assert len(h1) == 30
+    groups = rates.reshape(30, 12)
+    assert np.array_equal(h1["open"].to_numpy(), groups["open"][:, 0])
+    assert np.array_equal(h1["close"].to_numpy(), groups["close"][:, -1])
+    assert np.array_equal(h1["high"].to_numpy(), groups["high"].max(axis=1))
+    assert np.array_equal(h1["low"].to_numpy(), groups["low"].min(axis=1))
+    assert np.array_equal(h1["tick_volume"].to_numpy(), groups["tick_volume"].sum(axis=1))
+    assert np.array_equal(h1["spread"].to_numpy(), groups["spread"].min(axis=1))
+    assert (h1["time"].to_numpy(dtype="datetime64[s]").astype(np.int64) % 3600 == 0).all()
+
+
+def test_resample_partial_bucket_and_gaps():
+    # 起点不在整点、中间缺几根：按周期边界分组，缺失不补
+    base = 1_700_000_000 - 1_700_000_000 % 900
+    times = base + 300 * np.array([1, 2, 3, 4, 8, 9])
+    df = pd.DataFrame({
+        "time": pd.to_datetime(times, unit="s"),
+        "open": [1.0, 2, 3, 4, 5, 6],
+        "high": [1.5, 2.5, 3.5, 4.5, 5.5, 6.5],
+        "low": [0.5, 1.5, 2.5, 3.5, 4.5, 5.5],
+        "close": [1.2, 2.2, 3.2, 4.2, 5.2, 6.2],
+    })
+    m15 = resample_ohlc(df, "M15")
+    assert m15["time"].tolist() == list(pd.to_datetime([base, base + 900, base + 1800, base + 2700], unit="s"))
+    assert m15["open"].tolist() == [1.0, 3.0, 5.0, 6.0]
+    assert m15["close"].tolist() == [2.2, 4.2, 5.2, 6.2]
+    assert m15["high"].tolist() == [2.5, 4.5, 5.5, 6.5]
+    assert m15["low"].tolist() == [0.5, 2.5, 4.5, 5.5]
+
+
+def test_resample_empty():
+    df = rates_frame(make_rates(0))
+    assert len(resample_ohlc(df, "H1")) == 0
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from rules import TradingRules, screen
+
+
+def _bull(n_tf=6, agree=6):
+    # agree 个周期多头排列（收盘 > EMA20 > EMA50），其余空头
+    close = np.array([110.0] * agree + [90.0] * (n_tf - agree))
+    ema20 = np.full(n_tf, 100.0)
+    ema50 = np.array([95.0] * agree + [105.0] * (n_tf - agree))
+    return close, ema20, ema50
+
+
+def _screen(agree=6, price=2000.0, atr=2.0, swing_high=2010.0, swing_low=1990.0, spread=np.nan, point=None, **kw):
+    close, ema20, ema50 = _bull(agree=agree)
+    return screen(close, ema20, ema50, price, atr, 50.0, swing_high, swing_low, spread, TradingRules(**kw), point)
+
+
+def test_trend_direction_and_stop():
+    v = _screen()
+    assert int(v["side"]) == 1 and int(v["up"]) == 6
+    assert float(v["stop"]) == 3.0
+    assert float(v["sl"]) == 1997.0
+    assert float(v["target"]) == 2006.0
+    assert bool(v["passed"])
+
+
+def test_not_enough_agreement():
+    v = _screen(agree=3)
+    assert int(v["side"]) == 0
+    assert not bool(v["passed"])
+
+
+def test_reward_risk_to_swing():
+    # 到摆动高只有 4 美元，止损 3 美元：盈亏比不足 2
+    v = _screen(swing_high=2004.0)
+    assert not bool(v["rr_ok"]) and not bool(v["passed"])
+    # 价格已越过摆动高：不限制空间
+    v = _screen(swing_high=1999.0)
+    assert np.isinf(v["room"]) and bool(v["passed"])
+
+
+def test_spread_relative_to_atr():
+    # 上限 0.15 × ATR(2.0) = 0.30 美元；两位报价 25 点 = 0.25，三位报价 250 点同价
+    assert bool(_screen(spread=25, point=0.01)["spread_ok"])
+    assert bool(_screen(spread=250, point=0.001)["spread_ok"])
+    assert not bool(_screen(spread=40, point=0.01)["spread_ok"])
+    # point 未知或点差未知时不检查
+    assert bool(_screen(spread=400)["spread_ok"])
+    assert bool(_screen(spread=np.nan, point=0.01)["spread_ok"])
+    # 绝对点数上限
+    assert not bool(_screen(spread=25, point=0.01, max_spread_points=20)["spread_ok"])
+
+
+def test_vectorized_over_time():
+    n = 5
+    close, ema20, ema50 = (np.repeat(a[:, None], n, axis=1) for a in _bull())
+    atr = np.array([2.0, 2.0, 0.0, 2.0, 2.0])
+    v = screen(close, ema20, ema50, np.full(n, 2000.0), atr, np.full(n, 50.0), 2010.0, 1990.0, np.full(n, np.nan), TradingRules())
+    assert v["passed"].tolist() == [True, True, False, True, True]
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+XAUUSD 交易助手 - 分阶段耗时追踪
+一次 run_analysis 对应一个 Trace；各阶段用 span(...) 记录耗时和属性（token 数、字节数等）。
+当前 Trace / 父 span 保存在 contextvars 中，asyncio 任务和 asyncio.to_thread 会自动继承，
+因此数据拉取、指标、格式化等函数不需要额外传参；没有活动 Trace 时 span() 不做任何事。
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+
+_current_trace: contextvars.ContextVar["Trace | None"] = contextvars.ContextVar("xau_trace", default=None)
+_current_span: contextvars.ContextVar[str | None] = contextvars.ContextVar("xau_span", default=None)
+
+
+class Span:
+    __slots__ = ("span_id", "parent_id", "name", "start_ns", "end_ns", "attrs")
+
+    def __init__(self, name: str, parent_id: str | None, attrs: dict):
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns: int | None = None
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    @property
+    def duration_ms(self) -> float | None:
+        if self.end_ns is None:
+            return None
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def to_dict(self) -> dict:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3) if self.end_ns is not None else None,
+            "attrs": self.attrs,
+        }
+
+
+class Trace:
+    def __init__(self, name: str, **attrs):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attrs = attrs
+        self.start_ns = time.time_ns()
+        self.end_ns: int | None = None
+        self._lock = threading.Lock()
+        self.spans: list[Span] = []
+
+    def _add(self, sp: Span):
+        with self._lock:
+            self.spans.append(sp)
+
+    def finish(self):
+        self.end_ns = time.time_ns()
+
+    def to_dict(self) -> dict:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        with self._lock:
+            spans = [sp.to_dict() for sp in sorted(self.spans, key=lambda s: s.start_ns)]
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "attrs": self.attrs,
+            "start_ns": self.start_ns,
+            "total_ms": round((end - self.start_ns) / 1e6, 3),
+            "spans": spans,
+        }
+
+
+class _NullSpan:
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+@contextmanager
+def start_trace(name: str, **attrs):
+    """在当前上下文中开启一个 Trace（with 块内的 span 都记录到它上面）"""
+    trace = Trace(name, **attrs)
+    token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    try:
+        yield trace
+    finally:
+        trace.finish()
+        _current_span.reset(span_token)
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """记录一个阶段；嵌套调用自动成为子 span。异常时记录 error 属性后继续抛出"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield _NULL_SPAN
+        return
+    sp = Span(name, _current_span.get(), attrs)
+    token = _current_span.set(sp.span_id)
+    try:
+        yield sp
+    except BaseException as e:
+        sp.attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        sp.end_ns = time.time_ns()
+        _current_span.reset(token)
+        trace._add(sp)
+
+
+# ===============================
+# LLM 用量
+# ===============================
+def usage_of(message) -> dict:
+    """从 AIMessage / AIMessageChunk 中取 token 用量；缓存命中或模型未返回时为空 dict"""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return {"prompt_tokens": usage.get("input_tokens"), "completion_tokens": usage.get("output_tokens")}
+    meta = getattr(message, "response_metadata", None) or {}
+    token_usage = meta.get("token_usage") or {}
+    if token_usage:
+        return {"prompt_tokens": token_usage.get("prompt_tokens"), "completion_tokens": token_usage.get("completion_tokens")}
+    return {}
+
+
+def is_cache_hit(message) -> bool:
+    meta = getattr(message, "response_metadata", None) or {}
+    return bool(meta.get("cache_hit"))
+
+
+def text_bytes(values) -> int:
+    """若干字符串的 UTF-8 字节数之和"""
+    return sum(len(str(v).encode("utf-8")) for v in values)
+
+
+# ===============================
+# 汇总与导出
+# ===============================
+def stage_summary(trace: dict) -> list[dict]:
+    """顶层 span 的耗时列表（侧边栏显示用），按开始时间排序"""
+    return [
+        {"stage": sp["name"], "ms": sp["duration_ms"]}
+        for sp in trace.get("spans", [])
+        if sp["parent_id"] is None and sp["duration_ms"] is not None
+    ]
+
+
+def token_totals(trace: dict) -> dict:
+    totals = {"prompt_tokens": 0, "completion_tokens": 0}
+    for sp in trace.get("spans", []):
+        for k in totals:
+            totals[k] += sp["attrs"].get(k) or 0
+    return totals
+
+
+def export_jsonl(trace: dict, path: str | os.PathLike):
+    """追加一行（整个 Trace）到 JSON Lines 文件"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(trace, ensure_ascii=False, default=str) + "\n")
+
+
+def to_otel_spans(trace: dict, service_name: str = "xauusd-ai") -> dict:
+    """转换为 OTLP/JSON 结构（resourceSpans → scopeSpans → spans），可直接发给 OTLP HTTP 接收端"""
+
+    def attr(k, v):
+        if isinstance(v, bool):
+            value = {"boolValue": v}
+        elif isinstance(v, int):
+            value = {"intValue": str(v)}
+        elif isinstance(v, float):
+            value = {"doubleValue": v}
+        else:
+            value = {"stringValue": str(v)}
+        return {"key": k, "value": value}
+
+    root_id = uuid.uuid5(uuid.NAMESPACE_OID, trace["trace_id"]).hex[:16]
+    end_root = trace["start_ns"] + int(trace["total_ms"] * 1e6)
+    spans = [{
+        "traceId": trace["trace_id"],
+        "spanId": root_id,
+        "name": trace["name"],
+        "kind": 1,
+        "startTimeUnixNano": str(trace["start_ns"]),
+        "endTimeUnixNano": str(end_root),
+        "attributes": [attr(k, v) for k, v in trace["attrs"].items() if v is not None],
+    }]
+    for sp in trace["spans"]:
+        spans.append({
+            "traceId": trace["trace_id"],
+            "spanId": sp["span_id"],
+            "parentSpanId": sp["parent_id"] or root_id,
+            "name": sp["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(sp["start_ns"]),
+            "endTimeUnixNano": str(sp["end_ns"]),
+            "attributes": [attr(k, v) for k, v in sp["attrs"].items() if v is not None],
+            **({"status": {"code": 2, "message": sp["attrs"]["error"]}} if "error" in sp["attrs"] else {}),
+        })
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [attr("service.name", service_name)]},
+            "scopeSpans": [{"scope": {"name": "xauusd.tracing"}, "spans": spans}],
+        }]
+    }
+
+
+def export_trace(trace: dict, path: str | os.PathLike, fmt: str = "jsonl"):
+    """fmt="jsonl"：每次分析一行；fmt="otel"：每次分析一行 OTLP/JSON"""
+    if fmt == "otel":
+        export_jsonl(to_otel_spans(trace), path)
+    elif fmt == "jsonl":
+        export_jsonl(trace, path)
+    else:
+        raise ValueError(f"不支持的导出格式：{fmt}（可选 jsonl/otel）")